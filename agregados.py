@@ -0,0 +1,318 @@
+"""Cubo de agregados región × nivel de madurez.
+
+Se construye una sola vez al cargar los datos: por cada celda (región, nivel)
+guarda la cantidad de municipios y la suma de cada indicador, más un rollup
+nacional bajo la región ``TODO_EL_PAIS``. Las vistas leen estas pocas celdas en
+vez de filtrar y reducir el DataFrame completo en cada rerun.
+
+En un refresco incremental el cubo no se reconstruye: ``parchar_cubo`` suma
+las filas nuevas y resta las que salieron directo sobre sus celdas (agregando
+las que no existían), igual que la densidad y el histograma.
+
+La relación P19–P34 usa otro agregado, la densidad: cuántos municipios hay en
+cada celda (P19 promedio, índice P34, nivel). Ambos ejes son discretos, así
+que hay a lo sumo unas cientos de celdas sin importar cuántas filas se carguen;
+el gráfico, la correlación y las medias por nivel salen de ahí.
+
+``intervalos_bootstrap`` da intervalos de confianza para las medias por región.
+Como los indicadores toman pocos valores distintos, remuestrear una región de
+m municipios equivale a sortear m valores según sus frecuencias: un multinomial
+sobre la tabla región × valor. Todas las remuestras de todas las regiones salen
+de una sola llamada y el costo no depende de la cantidad de filas.
+
+Los niveles de madurez se cortan sobre el índice P34 con ``UMBRALES_MADUREZ``
+(Bajo hasta el primero, Medio hasta el segundo, Alto sobre él; por defecto
+``MONITOR_UMBRALES_MADUREZ=3,7``). El cubo usa esos umbrales; para otros, el
+histograma región × valor del índice permite recontar los niveles sumando
+columnas, sin volver a cargar ni recorrer las filas.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+TODO_EL_PAIS = "Todo el país"
+NIVELES_ORDEN = ["Bajo (Iniciando)", "Medio (En desarrollo)", "Alto (Avanzado)"]
+REMUESTRAS_BOOTSTRAP = 2000
+
+
+def leer_umbrales(texto):
+    """``"3,7"`` -> ``(3, 7)``; ValueError si no son dos enteros no negativos en orden."""
+    try:
+        umbrales = tuple(int(u) for u in str(texto).split(","))
+    except ValueError:
+        raise ValueError(f"Umbrales inválidos: {texto!r}") from None
+    if len(umbrales) != 2 or not 0 <= umbrales[0] <= umbrales[1]:
+        raise ValueError(f"Se esperan dos umbrales 0 <= bajo <= medio: {texto!r}")
+    return umbrales
+
+
+UMBRALES_MADUREZ = leer_umbrales(os.environ.get("MONITOR_UMBRALES_MADUREZ", "3,7"))
+
+
+def clasificar_niveles(valores, umbrales=None):
+    """Nivel de madurez (categórico, en ``NIVELES_ORDEN``) de cada valor del índice P34."""
+    umbrales = UMBRALES_MADUREZ if umbrales is None else umbrales
+    codigos = np.searchsorted(np.asarray(umbrales), np.asarray(valores), side="left")
+    return pd.Categorical.from_codes(codigos, categories=NIVELES_ORDEN)
+
+
+def construir_cubo(df, indicadores):
+    """Índice (región, nivel); columnas ``n`` y ``suma_<indicador>``."""
+    cols = [c for c in indicadores if c in df.columns]
+    base = df[["region_nombre", "Nivel_Madurez"] + cols]
+
+    por_region = base.groupby(["region_nombre", "Nivel_Madurez"], observed=True, sort=True)
+    cubo = por_region[cols].sum().add_prefix("suma_")
+    cubo.insert(0, "n", por_region.size())
+
+    nacional = base.groupby("Nivel_Madurez", observed=True)[cols].sum().add_prefix("suma_")
+    nacional.insert(0, "n", base.groupby("Nivel_Madurez", observed=True).size())
+    nacional.index = pd.MultiIndex.from_product(
+        [[TODO_EL_PAIS], nacional.index], names=["region_nombre", "Nivel_Madurez"]
+    )
+    return pd.concat([cubo, nacional])
+
+
+def _sumar_celdas(tabla, claves, aportes):
+    """``(índice, valores)``: las celdas de ``tabla`` con ``aportes`` sumados.
+
+    ``claves`` es la celda de cada fila de datos y ``aportes`` lo que suma
+    (con su signo). Las celdas que no existían se agregan al final del índice.
+    """
+    indice = tabla.index
+    lugares = indice.get_indexer(claves)
+    if (lugares < 0).any():
+        indice = indice.append(claves[lugares < 0].unique())
+        lugares = indice.get_indexer(claves)
+    valores = np.zeros((len(indice), tabla.shape[1]))
+    valores[: len(tabla)] = tabla.to_numpy(dtype=float)
+    np.add.at(valores, lugares, aportes)
+    return indice, valores
+
+
+def _con_signo(agregar, quitar):
+    """``(filas, signos)``: las filas que entran (+1) y las que salen (-1), juntas.
+
+    None si no hay ninguna.
+    """
+    partes = [
+        (filas, signo)
+        for filas, signo in ((agregar, 1.0), (quitar, -1.0))
+        if filas is not None and not filas.empty
+    ]
+    if not partes:
+        return None
+    signos = np.concatenate([np.full(len(filas), signo) for filas, signo in partes])
+    return pd.concat([filas for filas, _ in partes]), signos
+
+
+def _tipo_suma(valores, tipo):
+    """``valores`` con el tipo que da ``groupby().sum()`` sobre una columna ``tipo``.
+
+    pandas deja el tipo de entrada si todas las sumas caben en él y si no pasa
+    a 64 bits; así el cubo parchado queda igual que uno construido de cero.
+    """
+    if tipo.kind not in "iu":
+        return valores.astype(tipo)
+    rango = np.iinfo(tipo)
+    if len(valores) and (valores.min() < rango.min or valores.max() > rango.max):
+        tipo = np.dtype(np.uint64 if tipo.kind == "u" else np.int64)
+    return valores.astype(tipo)
+
+
+def parchar_cubo(cubo, agregar=None, quitar=None):
+    """Cubo con las filas ``agregar`` sumadas y las ``quitar`` restadas.
+
+    ``agregar`` y ``quitar`` son las filas que entran y salen (con los ítems
+    desempaquetados); se suman directo sobre las celdas del cubo y las que
+    quedan sin municipios se eliminan.
+    """
+    cambios = _con_signo(agregar, quitar)
+    if cambios is None:
+        return cubo
+    filas, signos = cambios
+    cols = [c.removeprefix("suma_") for c in cubo.columns[1:]]
+    valores = signos[:, None] * np.column_stack(
+        [np.ones(len(filas)), filas[cols].to_numpy(dtype=float)]
+    )
+    # Cada fila suma en su región (si tiene) y en TODO_EL_PAIS.
+    con_region = np.flatnonzero(filas["region_nombre"].notna().to_numpy())
+    tomar = np.concatenate([con_region, np.arange(len(filas))])
+    regiones = filas["region_nombre"].to_numpy(dtype=object)[tomar]
+    regiones[len(con_region) :] = TODO_EL_PAIS
+    celdas_ = pd.MultiIndex.from_arrays(
+        [regiones, filas["Nivel_Madurez"].array.take(tomar)], names=cubo.index.names
+    )
+    indice, valores = _sumar_celdas(cubo, celdas_, valores[tomar])
+
+    tipos = filas[cols].dtypes
+    quedan = valores[:, 0] > 0
+    res = pd.DataFrame(
+        {
+            "n": valores[quedan, 0].astype(np.int64),
+            **{
+                f"suma_{c}": _tipo_suma(valores[quedan, j + 1], tipos[c])
+                for j, c in enumerate(cols)
+            },
+        },
+        index=indice[quedan],
+    )
+    if len(indice) == len(cubo):
+        return res
+    claves = sorted(
+        res.index, key=lambda c: (c[0] == TODO_EL_PAIS, c[0], NIVELES_ORDEN.index(c[1]))
+    )
+    return res.loc[claves]
+
+
+def construir_densidad(df):
+    """Índice (P19_promedio, indice_digitalizacion, Nivel_Madurez); columna ``n``."""
+    ejes = ["P19_promedio", "indice_digitalizacion", "Nivel_Madurez"]
+    return df.groupby(ejes, observed=True, sort=True).size().to_frame("n")
+
+
+def construir_histograma(df):
+    """Municipios por región (más ``TODO_EL_PAIS``) y valor del índice P34."""
+    regiones = df["region_nombre"].astype(str)
+    hist = pd.crosstab(regiones, df["indice_digitalizacion"])
+    hist.loc[TODO_EL_PAIS] = hist.sum()
+    hist.columns = hist.columns.astype(int)
+    return hist.rename_axis(index="region_nombre", columns="indice_digitalizacion")
+
+
+def parchar_histograma(histograma, agregar=None, quitar=None):
+    """Como ``parchar_cubo`` pero para el histograma del índice."""
+    cambios = _con_signo(agregar, quitar)
+    if cambios is None:
+        return histograma
+    filas, signos = cambios
+    regiones = filas["region_nombre"].astype(str).to_numpy()
+    valores = filas["indice_digitalizacion"].to_numpy()
+    filas_ = histograma.index.append(pd.Index(np.unique(regiones)))
+    filas_ = filas_[~filas_.duplicated()]
+    columnas = histograma.columns.append(pd.Index(np.unique(valores)))
+    columnas = columnas[~columnas.duplicated()]
+    res = np.zeros((len(filas_), len(columnas)), dtype=np.int64)
+    res[: len(histograma), : histograma.shape[1]] = histograma.to_numpy()
+    j = columnas.get_indexer(valores)
+    np.add.at(res, (filas_.get_indexer(regiones), j), signos.astype(np.int64))
+    np.add.at(res[filas_.get_loc(TODO_EL_PAIS)], j, signos.astype(np.int64))
+    quedan_f, quedan_c = res.sum(axis=1) > 0, res.sum(axis=0) > 0
+    res = pd.DataFrame(
+        res[quedan_f][:, quedan_c], index=filas_[quedan_f], columns=columnas[quedan_c]
+    )
+    if len(filas_) > len(histograma.index):
+        res = res.loc[sorted(res.index, key=lambda r: (r == TODO_EL_PAIS, r))]
+    if len(columnas) > len(histograma.columns):
+        res = res.sort_index(axis=1)
+    return res.rename_axis(index="region_nombre", columns="indice_digitalizacion")
+
+
+def niveles_histograma(histograma, region=TODO_EL_PAIS, umbrales=None, orden=None):
+    """Municipios por nivel de madurez en la región, cortando el histograma con ``umbrales``."""
+    orden = orden or list(reversed(NIVELES_ORDEN))
+    if region not in histograma.index:
+        return pd.Series(0, index=orden)
+    fila = histograma.loc[region]
+    niveles = clasificar_niveles(fila.index.to_numpy(), umbrales)
+    return fila.groupby(niveles, observed=False).sum().reindex(orden, fill_value=0)
+
+
+def reclasificar_densidad(densidad, umbrales=None):
+    """La densidad P19–P34 con el nivel recalculado según ``umbrales``."""
+    celdas_ = densidad.reset_index()
+    celdas_["Nivel_Madurez"] = clasificar_niveles(celdas_["indice_digitalizacion"], umbrales)
+    # El nivel depende sólo del índice P34: cada celda sigue siendo única.
+    return celdas_.set_index(["P19_promedio", "indice_digitalizacion", "Nivel_Madurez"])
+
+
+def parchar_densidad(densidad, agregar=None, quitar=None):
+    """Como ``parchar_cubo`` pero para la densidad P19–P34."""
+    cambios = _con_signo(agregar, quitar)
+    if cambios is None:
+        return densidad
+    filas, signos = cambios
+    ejes = list(densidad.index.names)
+    celdas_ = pd.MultiIndex.from_arrays([filas[e].array for e in ejes], names=ejes)
+    indice, valores = _sumar_celdas(densidad, celdas_, signos[:, None])
+    res = pd.DataFrame({"n": valores[:, 0].astype(np.int64)}, index=indice)
+    res = res[res["n"] > 0]
+    return res if len(indice) == len(densidad) else res.sort_index()
+
+
+def estadisticas_densidad(densidad):
+    """``(correlación, por_nivel)`` con una pasada sobre las celdas.
+
+    ``por_nivel``: por nivel de madurez, ``n`` y las medias de P19 y P34.
+    La correlación es la de Pearson ponderando cada celda por su ``n``.
+    """
+    celdas_ = densidad.reset_index()
+    n = celdas_["n"].to_numpy(dtype=float)
+    x = celdas_["P19_promedio"].to_numpy(dtype=float)
+    y = celdas_["indice_digitalizacion"].to_numpy(dtype=float)
+
+    total = n.sum()
+    correlacion = float("nan")
+    if total > 1:
+        mx, my = (n * x).sum() / total, (n * y).sum() / total
+        cov = (n * (x - mx) * (y - my)).sum()
+        var = (n * (x - mx) ** 2).sum() * (n * (y - my) ** 2).sum()
+        if var > 0:
+            correlacion = float(cov / np.sqrt(var))
+
+    celdas_["suma_P19"] = n * x
+    celdas_["suma_P34"] = n * y
+    por_nivel = celdas_.groupby("Nivel_Madurez", observed=True)[["n", "suma_P19", "suma_P34"]].sum()
+    por_nivel["media_P19_promedio"] = por_nivel.pop("suma_P19") / por_nivel["n"]
+    por_nivel["media_indice_digitalizacion"] = por_nivel.pop("suma_P34") / por_nivel["n"]
+    return correlacion, por_nivel
+
+
+def intervalos_bootstrap(
+    df, indicador, regiones, remuestras=REMUESTRAS_BOOTSTRAP, confianza=0.95, semilla=0
+):
+    """Media e intervalo bootstrap (percentil) de ``indicador`` por región.
+
+    Índice: región (sólo las de ``regiones`` con datos); columnas ``n``,
+    ``media``, ``inferior`` y ``superior``.
+    """
+    base = df.loc[df["region_nombre"].isin(regiones), ["region_nombre", indicador]]
+    tabla = pd.crosstab(base["region_nombre"].astype(str), base[indicador])
+    conteos = tabla.to_numpy(dtype=np.int64)
+    valores = tabla.columns.to_numpy(dtype=float)
+    n = conteos.sum(axis=1)
+
+    rng = np.random.default_rng(semilla)
+    # (remuestras, regiones, valores): cuántas veces sale cada valor en cada remuestra.
+    sorteos = rng.multinomial(n, conteos / n[:, None], size=(remuestras, len(n)))
+    medias = sorteos @ valores / n
+    alfa = (1 - confianza) / 2
+    inferior, superior = np.quantile(medias, [alfa, 1 - alfa], axis=0)
+    return pd.DataFrame(
+        {"n": n, "media": conteos @ valores / n, "inferior": inferior, "superior": superior},
+        index=tabla.index.rename("region_nombre"),
+    )
+
+
+def celdas(cubo, region=TODO_EL_PAIS):
+    """Celdas de una región (por nivel); vacío si la región no está en el cubo."""
+    if region not in cubo.index.get_level_values(0):
+        return cubo.iloc[0:0].droplevel(0)
+    return cubo.xs(region, level="region_nombre")
+
+
+def resumen(cubo, region=TODO_EL_PAIS):
+    """Totales de la región sumando sus niveles: ``n``, ``suma_*`` y ``media_*``."""
+    tot = celdas(cubo, region).sum()
+    sumas = tot[tot.index.str.startswith("suma_")]
+    medias = sumas / tot["n"] if tot["n"] else sumas * float("nan")
+    medias.index = medias.index.str.replace("suma_", "media_", regex=False)
+    return pd.concat([tot, medias])
+
+
+def medias_por_region(cubo, indicador, regiones):
+    """Media de ``indicador`` por región (sólo las regiones indicadas)."""
+    por_region = cubo.groupby(level="region_nombre")[["n", f"suma_{indicador}"]].sum()
+    por_region = por_region.loc[por_region.index.isin(regiones)]
+    return por_region[f"suma_{indicador}"] / por_region["n"]
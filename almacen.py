@@ -0,0 +1,183 @@
+"""Almacén local de snapshots de la encuesta (archivo columnar + metadatos).
+
+Cada descarga exitosa del CSV se guarda como Parquet, identificado por el hash
+SHA-256 del contenido descargado, junto a un ``meta.json`` con el ETag y el
+Last-Modified entregados por el servidor. Así un reinicio del proceso no vuelve
+a bajar el dump completo: si el snapshot es reciente se sirve directo del disco
+y, si no, se revalida con una petición condicional (304 = sin cambios).
+
+Aparte se guarda el último resultado ya procesado (``guardar_procesado``),
+serializado con pickle y marcado con una firma: un arranque con la misma firma
+lo lee en milisegundos en lugar de rehacer el pipeline. Los archivos los
+escribe la propia app; el directorio no debe ser escribible por terceros.
+"""
+import json
+import os
+import pickle
+import time
+from pathlib import Path
+
+import pandas as pd
+
+from ingesta import descargar_streaming, parsear_csv
+
+DIR_SNAPSHOTS = Path(
+    os.environ.get("MONITOR_SNAPSHOT_DIR", Path(__file__).resolve().parent / ".snapshots")
+)
+# Segundos durante los que un snapshot se sirve sin consultar la red.
+FRESCURA_SNAPSHOT = float(os.environ.get("MONITOR_SNAPSHOT_FRESCURA", 6 * 3600))
+
+ARCHIVO_META = "meta.json"
+
+
+# ----------------- LECTURA / ESCRITURA -----------------
+def leer_metadatos(directorio=None):
+    ruta = Path(directorio or DIR_SNAPSHOTS) / ARCHIVO_META
+    try:
+        with open(ruta, encoding="utf-8") as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return {}
+
+
+def _escribir_atomico(ruta: Path, escribir):
+    """Escribe en un temporal y lo renombra, para no dejar archivos a medias."""
+    tmp = ruta.with_name(f".{ruta.name}.{os.getpid()}.tmp")
+    try:
+        escribir(tmp)
+        os.replace(tmp, ruta)
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+
+
+def _guardar_metadatos(meta, directorio):
+    def escribir(tmp):
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(meta, fh, ensure_ascii=False, indent=2)
+
+    _escribir_atomico(Path(directorio) / ARCHIVO_META, escribir)
+
+
+def cargar_snapshot(meta, directorio=None):
+    """Devuelve el DataFrame del snapshot descrito por ``meta`` o None si no existe."""
+    if not meta.get("archivo"):
+        return None
+    ruta = Path(directorio or DIR_SNAPSHOTS) / meta["archivo"]
+    try:
+        return pd.read_parquet(ruta)
+    except (OSError, ValueError):
+        return None
+
+
+def guardar_snapshot(df, sha256, etag=None, last_modified=None, url=None, directorio=None):
+    """Persiste ``df`` como Parquet y actualiza los metadatos; borra snapshots anteriores."""
+    directorio = Path(directorio or DIR_SNAPSHOTS)
+    directorio.mkdir(parents=True, exist_ok=True)
+
+    archivo = f"encuesta-{sha256[:16]}.parquet"
+    _escribir_atomico(directorio / archivo, lambda tmp: df.to_parquet(tmp, index=False))
+
+    ahora = time.time()
+    meta = {
+        "url": url,
+        "sha256": sha256,
+        "archivo": archivo,
+        "etag": etag,
+        "last_modified": last_modified,
+        "filas": int(len(df)),
+        "columnas": int(df.shape[1]),
+        "creado": ahora,
+        "revalidado": ahora,
+    }
+    _guardar_metadatos(meta, directorio)
+
+    for viejo in directorio.glob("encuesta-*.parquet"):
+        if viejo.name != archivo:
+            viejo.unlink(missing_ok=True)
+    return meta
+
+
+# ----------------- RESULTADO PROCESADO -----------------
+def _ruta_procesado(firma, directorio=None):
+    return Path(directorio or DIR_SNAPSHOTS) / f"procesado-{firma[:16]}.pickle"
+
+
+def guardar_procesado(objeto, firma, directorio=None):
+    """Serializa ``objeto`` bajo ``firma`` y borra los de otras firmas; devuelve la ruta."""
+    ruta = _ruta_procesado(firma, directorio)
+    ruta.parent.mkdir(parents=True, exist_ok=True)
+
+    def escribir(tmp):
+        with open(tmp, "wb") as fh:
+            pickle.dump(objeto, fh, protocol=pickle.HIGHEST_PROTOCOL)
+
+    _escribir_atomico(ruta, escribir)
+    for viejo in ruta.parent.glob("procesado-*.pickle"):
+        if viejo != ruta:
+            viejo.unlink(missing_ok=True)
+    return ruta
+
+
+def cargar_procesado(firma, directorio=None):
+    """El objeto guardado con ``firma`` o None si no existe o no se puede leer."""
+    try:
+        with open(_ruta_procesado(firma, directorio), "rb") as fh:
+            return pickle.load(fh)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        return None
+
+
+# ----------------- DESCARGA CONDICIONAL -----------------
+def obtener_encuesta(url, timeout=30, directorio=None, frescura=None, session=None):
+    """Devuelve ``(df, meta)`` usando el snapshot local siempre que sea posible.
+
+    - Snapshot más joven que ``frescura`` segundos: se sirve sin tocar la red.
+    - Si no, GET condicional con If-None-Match / If-Modified-Since; un 304 (o un
+      cuerpo con el mismo hash) sólo actualiza los metadatos.
+    - Si la red falla y hay snapshot, se sirve el último bueno; si no hay, se
+      propaga la excepción.
+    """
+    directorio = Path(directorio or DIR_SNAPSHOTS)
+    frescura = FRESCURA_SNAPSHOT if frescura is None else frescura
+
+    meta = leer_metadatos(directorio)
+    df_local = cargar_snapshot(meta, directorio) if meta else None
+
+    if df_local is not None and time.time() - meta.get("revalidado", 0) < frescura:
+        return df_local, dict(meta, origen="snapshot", bytes=0)
+
+    headers = {}
+    if df_local is not None:
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+    try:
+        desc = descargar_streaming(url, headers=headers, timeout=timeout, session=session)
+        if desc.status_code == 304 and df_local is not None:
+            meta["revalidado"] = time.time()
+            _guardar_metadatos(meta, directorio)
+            return df_local, dict(meta, origen="304", bytes=0)
+        if desc.archivo is None:
+            raise RuntimeError(f"Respuesta inesperada {desc.status_code} para {url}")
+    except Exception:
+        if df_local is not None:
+            return df_local, dict(meta, origen="snapshot-sin-red", bytes=0)
+        raise
+
+    try:
+        if df_local is not None and desc.sha256 == meta.get("sha256"):
+            meta.update(
+                etag=desc.etag, last_modified=desc.last_modified, revalidado=time.time()
+            )
+            _guardar_metadatos(meta, directorio)
+            return df_local, dict(meta, origen="sin-cambios", bytes=desc.bytes)
+
+        df = parsear_csv(desc.archivo, desc.encoding)
+    finally:
+        desc.cerrar()
+
+    meta = guardar_snapshot(df, desc.sha256, desc.etag, desc.last_modified, url, directorio)
+    return df, dict(meta, origen="descarga", bytes=desc.bytes)
@@ -0,0 +1,400 @@
+"""API JSON de sólo lectura sobre el dataset del monitor (asyncio, sin Streamlit).
+
+Sirve los mismos números que el dashboard sin ejecutar el script de Streamlit
+ni matplotlib:
+
+- ``GET /api/version``: versión de datos vigente.
+- ``GET /api/kpis?region=&umbrales=3,7``: KPIs del panorama (municipios,
+  promedios, niveles de madurez y presencia web/redes/trámites).
+- ``GET /api/regiones?indicador=indice_digitalizacion|P19_promedio``: promedio
+  por región.
+- ``GET /api/ranking?region=&desde=0&limite=50&buscar=``: ranking por índice
+  P34 con puestos (competencia y denso) y percentil; ``buscar`` filtra por
+  prefijo del nombre.
+- ``GET /api/comunas/<clave>``: ficha de una comuna (clave normalizada, p. ej.
+  ``NUNOA``; también acepta el nombre tal como viene en la encuesta).
+
+``umbrales`` (kpis, ranking y comunas) fija los cortes Bajo/Medio/Alto sobre el
+índice P34; por defecto los de ``MONITOR_UMBRALES_MADUREZ``.
+
+Cada respuesta se serializa una vez por versión de datos y se guarda en un LRU;
+el ETag deriva de la versión y del contenido, así un ``If-None-Match`` vigente
+recibe un 304 sin cuerpo.
+
+Uso::
+
+    python api.py --puerto 8600          # proceso propio, con su refresco
+    MONITOR_API_PUERTO=8600 streamlit run app.py   # junto a la app, mismo dataset
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import threading
+import zlib
+from collections import OrderedDict
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from agregados import (
+    TODO_EL_PAIS,
+    UMBRALES_MADUREZ,
+    clasificar_niveles,
+    leer_umbrales,
+    medias_por_region,
+    niveles_histograma,
+    resumen,
+)
+from bloques import desempaquetar
+from geografia import normalizar_clave
+from indices import pagina_ranking
+from metricas import medir
+
+log = logging.getLogger(__name__)
+
+PUERTO_API = os.environ.get("MONITOR_API_PUERTO")
+HOST_API = os.environ.get("MONITOR_API_HOST", "127.0.0.1")
+MAX_RESPUESTAS = 2048
+# Límites de la petición: largo de cada línea (incluida la de la petición),
+# cantidad de cabeceras y bytes de todas juntas.
+MAX_LINEA = 8192
+MAX_CABECERAS = 100
+MAX_BYTES_CABECERAS = 32768
+LIMITE_RANKING = 500
+RUTAS = ("/api/version", "/api/kpis", "/api/regiones", "/api/ranking")
+INDICADORES = ("indice_digitalizacion", "P19_promedio")
+EXCLUIDAS = ("Desconocida", "Sin clasificar")
+
+RAZONES = {
+    200: "OK",
+    304: "Not Modified",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    431: "Request Header Fields Too Large",
+    503: "Service Unavailable",
+}
+
+
+class ErrorApi(Exception):
+    def __init__(self, estado, mensaje):
+        super().__init__(mensaje)
+        self.estado = estado
+
+
+# ----------------- RESPUESTAS -----------------
+def _kpis(dataset, region, umbrales):
+    tot = resumen(dataset.cubo, region)
+    if not tot["n"]:
+        raise ErrorApi(404, f"Región sin datos: {region}")
+    niveles = niveles_histograma(dataset.histograma, region, umbrales)
+    return {
+        "region": region,
+        "umbrales": list(umbrales),
+        "municipios": int(tot["n"]),
+        "media_indice_digitalizacion": float(tot["media_indice_digitalizacion"]),
+        "media_P19_promedio": float(tot["media_P19_promedio"]),
+        "niveles": {nivel: int(n) for nivel, n in niveles.items()},
+        "presencia": {
+            col: int(tot[f"suma_{col}"]) for col in dataset.cols_main if f"suma_{col}" in tot
+        },
+    }
+
+
+def _regiones(dataset, indicador):
+    if indicador not in INDICADORES:
+        raise ErrorApi(400, f"indicador debe ser uno de {', '.join(INDICADORES)}")
+    regiones = [r for r in dataset.indice.regiones if r not in EXCLUIDAS]
+    medias = medias_por_region(dataset.cubo, indicador, regiones).sort_values(ascending=False)
+    return {
+        "indicador": indicador,
+        "regiones": [{"region": r, "media": float(v)} for r, v in medias.items()],
+    }
+
+
+def _ranking(dataset, region, desde, limite, buscar="", umbrales=UMBRALES_MADUREZ):
+    clave = None if region == TODO_EL_PAIS else region
+    if clave is not None and clave not in dataset.indice.limites:
+        raise ErrorApi(404, f"Región desconocida: {region}")
+    pagina, total = pagina_ranking(
+        dataset.df, dataset.indice, "indice_digitalizacion", clave, desde, limite, buscar
+    )
+    niveles = clasificar_niveles(pagina["indice_digitalizacion"], umbrales)
+    return {
+        "region": region,
+        "total": total,
+        "desde": desde,
+        "buscar": buscar,
+        "municipios": [
+            {
+                "posicion": desde + i + 1,
+                "puesto": int(f.puesto),
+                "puesto_denso": int(f.puesto_denso),
+                "percentil": round(float(f.percentil), 2),
+                "municipalidad": f.MUNICIPALIDAD,
+                "region": str(f.region_nombre),
+                "indice_digitalizacion": int(f.indice_digitalizacion),
+                "P19_promedio": float(f.P19_promedio),
+                "nivel": str(nivel),
+            }
+            for i, (f, nivel) in enumerate(zip(pagina.itertuples(index=False), niveles))
+        ],
+    }
+
+
+def _comuna(dataset, claves, clave, umbrales=UMBRALES_MADUREZ):
+    posicion = claves.get(clave)
+    if posicion is None:
+        posicion = claves.get(normalizar_clave(clave))
+    if posicion is None:
+        raise ErrorApi(404, f"Comuna desconocida: {clave}")
+    fila = dataset.df.iloc[posicion : posicion + 1]
+    f = fila.iloc[0]
+    region = str(f["region_nombre"])
+    tot = resumen(dataset.cubo, region)
+    items = {
+        bloque: {
+            col: int(v)
+            for col, v in desempaquetar(fila, bloque, cols).iloc[0].items()
+        }
+        for bloque, cols in (("P19", dataset.cols_p19), ("P34", dataset.cols_p34))
+    }
+    return {
+        "clave": f["Comuna_clave"],
+        "municipalidad": f["MUNICIPALIDAD"],
+        "region": region,
+        "nivel": str(clasificar_niveles([f["indice_digitalizacion"]], umbrales)[0]),
+        "indice_digitalizacion": int(f["indice_digitalizacion"]),
+        "P19_promedio": float(f["P19_promedio"]),
+        "media_regional_indice_digitalizacion": float(tot["media_indice_digitalizacion"]),
+        "media_regional_P19_promedio": float(tot["media_P19_promedio"]),
+        "presencia": {col: int(f[col]) for col in dataset.cols_main},
+        "P19": items["P19"],
+        "P34": items["P34"],
+    }
+
+
+def _umbrales(query):
+    try:
+        return leer_umbrales(query["umbrales"][0]) if "umbrales" in query else UMBRALES_MADUREZ
+    except ValueError as exc:
+        raise ErrorApi(400, str(exc)) from None
+
+
+def _etag_vigente(etag, if_none_match):
+    """Si ``If-None-Match`` nombra ``etag`` (o es ``*``), con comparación débil."""
+    etiquetas = {e.strip().removeprefix("W/") for e in if_none_match.split(",")}
+    return "*" in etiquetas or etag.removeprefix("W/") in etiquetas
+
+
+async def _leer_peticion(reader):
+    """``(método, objetivo, versión, cabeceras)``; None si el cliente cerró.
+
+    Una línea más larga que ``MAX_LINEA`` o malformada es un 400; demasiadas
+    cabeceras (en cantidad o en bytes), un 431.
+    """
+    try:
+        linea = await reader.readline()
+    except (ValueError, asyncio.LimitOverrunError):
+        raise ErrorApi(400, "Línea de petición demasiado larga") from None
+    if not linea:
+        return None
+    try:
+        metodo, objetivo, version_http = linea.decode("latin-1").split()
+    except ValueError:
+        raise ErrorApi(400, "Línea de petición inválida") from None
+
+    cabeceras = {}
+    total = 0
+    while True:
+        try:
+            h = await reader.readline()
+        except (ValueError, asyncio.LimitOverrunError):
+            raise ErrorApi(431, "Cabecera demasiado larga") from None
+        if h in (b"\r\n", b"\n", b""):
+            break
+        total += len(h)
+        if len(cabeceras) >= MAX_CABECERAS or total > MAX_BYTES_CABECERAS:
+            raise ErrorApi(431, "Demasiadas cabeceras")
+        nombre, _, valor = h.decode("latin-1").partition(":")
+        cabeceras[nombre.strip().lower()] = valor.strip()
+    return metodo, objetivo, version_http, cabeceras
+
+
+def _entero(query, nombre, defecto, maximo=None):
+    try:
+        valor = int(query.get(nombre, [defecto])[0])
+    except ValueError:
+        raise ErrorApi(400, f"{nombre} debe ser un entero") from None
+    if valor < 0:
+        raise ErrorApi(400, f"{nombre} no puede ser negativo")
+    return min(valor, maximo) if maximo else valor
+
+
+# ----------------- SERVICIO -----------------
+class Api:
+    """Resuelve peticiones contra ``obtener_dataset()`` (el Dataset vigente)."""
+
+    def __init__(self, obtener_dataset):
+        self._obtener_dataset = obtener_dataset
+        self._respuestas = OrderedDict()
+        self._claves = (None, {})
+        self._lock = threading.Lock()
+
+    def _claves_comuna(self, dataset):
+        version, claves = self._claves
+        if version != dataset.version:
+            claves = {}
+            for i, clave in enumerate(dataset.df["Comuna_clave"]):
+                claves.setdefault(clave, i)
+            self._claves = (dataset.version, claves)
+        return claves
+
+    def _cuerpo(self, dataset, ruta, query):
+        region = query.get("region", [TODO_EL_PAIS])[0]
+        if ruta == "/api/version":
+            return {"version": dataset.version, "municipios": len(dataset.df)}
+        if ruta == "/api/kpis":
+            return _kpis(dataset, region, _umbrales(query))
+        if ruta == "/api/regiones":
+            return _regiones(dataset, query.get("indicador", ["indice_digitalizacion"])[0])
+        if ruta == "/api/ranking":
+            desde = _entero(query, "desde", 0)
+            limite = _entero(query, "limite", 50, LIMITE_RANKING)
+            return _ranking(
+                dataset, region, desde, limite, query.get("buscar", [""])[0], _umbrales(query)
+            )
+        if ruta.startswith("/api/comunas/"):
+            clave = unquote(ruta[len("/api/comunas/") :])
+            return _comuna(dataset, self._claves_comuna(dataset), clave, _umbrales(query))
+        raise ErrorApi(404, f"Ruta desconocida: {ruta}")
+
+    def responder(self, metodo, objetivo, cabeceras):
+        """``(estado, cabeceras, cuerpo)`` para una petición ya parseada."""
+        if metodo not in ("GET", "HEAD"):
+            return self._error(405, "Sólo GET y HEAD")
+        partes = urlsplit(objetivo)
+        query = parse_qs(partes.query)
+        dataset = self._obtener_dataset()
+        if dataset is None or dataset.df.empty:
+            estado, _, cuerpo = self._error(503, "Datos no disponibles")
+            return estado, {"Retry-After": "30"}, cuerpo
+
+        parametros = tuple(sorted((k, tuple(v)) for k, v in query.items()))
+        clave = (dataset.version, partes.path, parametros)
+        with self._lock:
+            guardada = self._respuestas.get(clave)
+            if guardada is not None:
+                self._respuestas.move_to_end(clave)
+        if guardada is None:
+            # El nombre de la métrica no sale de la ruta pedida: cada ruta
+            # inventada sería una serie nueva que nunca se libera.
+            if partes.path.startswith("/api/comunas/"):
+                nombre = "/api/comunas"
+            elif partes.path in RUTAS:
+                nombre = partes.path
+            else:
+                nombre = "desconocida"
+            try:
+                with medir("api", nombre):
+                    cuerpo = json.dumps(
+                        self._cuerpo(dataset, partes.path, query),
+                        ensure_ascii=False,
+                        separators=(",", ":"),
+                    ).encode("utf-8")
+            except ErrorApi as exc:
+                return self._error(exc.estado, str(exc))
+            etag = f'"{dataset.version}-{zlib.crc32(cuerpo):08x}"'
+            guardada = (etag, cuerpo)
+            with self._lock:
+                self._respuestas[clave] = guardada
+                while len(self._respuestas) > MAX_RESPUESTAS:
+                    self._respuestas.popitem(last=False)
+
+        etag, cuerpo = guardada
+        extra = {"ETag": etag, "Cache-Control": "no-cache"}
+        if _etag_vigente(etag, cabeceras.get("if-none-match", "")):
+            return 304, extra, b""
+        return 200, extra, cuerpo
+
+    @staticmethod
+    def _error(estado, mensaje):
+        return estado, {}, json.dumps({"error": mensaje}, ensure_ascii=False).encode("utf-8")
+
+    async def _atender(self, reader, writer):
+        try:
+            while True:
+                try:
+                    peticion = await _leer_peticion(reader)
+                except ErrorApi as exc:
+                    # Lo que queda en el stream ya no se puede interpretar: se
+                    # responde el error y se cierra la conexión.
+                    estado, extra, cuerpo = self._error(exc.estado, str(exc))
+                    await self._escribir(writer, "GET", estado, extra, cuerpo, seguir=False)
+                    break
+                if peticion is None:
+                    break
+                metodo, objetivo, version_http, cabeceras = peticion
+
+                estado, extra, cuerpo = self.responder(metodo, objetivo, cabeceras)
+                seguir = (
+                    version_http == "HTTP/1.1"
+                    and cabeceras.get("connection", "").lower() != "close"
+                )
+                await self._escribir(writer, metodo, estado, extra, cuerpo, seguir)
+                if not seguir:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _escribir(writer, metodo, estado, extra, cuerpo, seguir):
+        cabecera = [
+            f"HTTP/1.1 {estado} {RAZONES.get(estado, '')}",
+            "Content-Type: application/json; charset=utf-8",
+            f"Content-Length: {len(cuerpo)}",
+            "Access-Control-Allow-Origin: *",
+            "Connection: keep-alive" if seguir else "Connection: close",
+        ] + [f"{k}: {v}" for k, v in extra.items()]
+        writer.write(("\r\n".join(cabecera) + "\r\n\r\n").encode("latin-1"))
+        if metodo != "HEAD":
+            writer.write(cuerpo)
+        await writer.drain()
+
+    async def servir(self, host="127.0.0.1", puerto=8600):
+        servidor = await asyncio.start_server(self._atender, host, puerto, limit=MAX_LINEA)
+        log.info("API JSON escuchando en http://%s:%s", host, puerto)
+        async with servidor:
+            await servidor.serve_forever()
+
+
+def iniciar_en_hilo(obtener_dataset, host=HOST_API, puerto=None):
+    """Levanta la API en un hilo con su propio event loop (para correr junto a la app)."""
+    api = Api(obtener_dataset)
+    hilo = threading.Thread(
+        target=lambda: asyncio.run(api.servir(host, int(puerto or PUERTO_API))),
+        name="api-json",
+        daemon=True,
+    )
+    hilo.start()
+    return api
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--host", default=HOST_API)
+    parser.add_argument("--puerto", type=int, default=int(PUERTO_API or 8600))
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    from refresco import Refresco
+
+    refresco = Refresco()
+    refresco.iniciar()
+    asyncio.run(Api(refresco.actual).servir(args.host, args.puerto))
+
+
+if __name__ == "__main__":
+    main()
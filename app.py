@@ -1,28 +1,59 @@
 import streamlit as st
 import pandas as pd
-import requests
-import matplotlib.pyplot as plt
-from io import StringIO
-import unicodedata
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+import api
+from descargas import CACHE_DESCARGAS, FORMATOS, descargar, formatos_disponibles, nombre_archivo
+from agregados import (
+    REMUESTRAS_BOOTSTRAP,
+    UMBRALES_MADUREZ,
+    clasificar_niveles,
+    estadisticas_densidad,
+    intervalos_bootstrap,
+    niveles_histograma,
+    reclasificar_densidad,
+    resumen,
+)
+from fichas import detalle_p34
+from indices import ordenado, pagina_ranking, particion
+from metricas import ARRANQUE, DEBUG, REGISTRO, SESIONES, arranque, medir, medir_memoria
+from refresco import Refresco
+from similares import similares
+from graficos import (
+    CACHE_RENDER,
+    P19_COLOR,
+    P34_COLOR,
+    fig_barras_municipios,
+    fig_comparacion,
+    fig_detalle_p34,
+    fig_densidad,
+    fig_niveles,
+    fig_promedios_region,
+    fig_torta,
+)
+from graficos_vega import (
+    MOTOR_GRAFICOS,
+    spec_barras_municipios,
+    spec_comparacion,
+    spec_detalle_p34,
+    spec_densidad,
+    spec_niveles,
+    spec_promedios_region,
+    spec_torta,
+)
+
+# matplotlib y requests no se importan acá: graficos carga pyplot con la
+# primera figura y fuentes importa requests al crear la sesión HTTP.
+arranque("imports")
+
+# Con matplotlib los gráficos de municipios se cortan en las primeras filas por
+# legibilidad y costo de render; con Vega-Lite se envían todas.
+LIMITE_BARRAS = 20 if MOTOR_GRAFICOS == "matplotlib" else None
+FILAS_POR_PAGINA = 25
 
 # ----------------- CONFIG BÁSICA -----------------
 st.set_page_config(page_title="Monitor Digital Municipal", layout="wide")
 
-# Estilo matplotlib
-plt.rcParams.update({
-    "figure.facecolor": "#ffffff",
-    "axes.facecolor": "#f9fafb",
-    "axes.edgecolor": "#e5e7eb",
-    "axes.grid": True,
-    "grid.color": "#e5e7eb",
-    "grid.linestyle": "--",
-    "grid.alpha": 0.6,
-    "axes.titlesize": 11,
-    "axes.labelsize": 10,
-    "xtick.labelsize": 9,
-    "ytick.labelsize": 9,
-})
-
 
 # ----------------- ESTILO CUSTOM (CSS) -----------------
 def set_custom_style():
@@ -129,14 +160,6 @@ def set_custom_style():
 
 set_custom_style()
 
-# ----------------- CONSTANTES -----------------
-P34_COLOR = "#1d4ed8"   # azul institucional
-P19_COLOR = "#0f766e"   # verde sobrio
-NO_COLOR   = "#b91c1c"  # rojo más oscuro
-
-PREGUNTAS_PRINCIPALES = ["P10", "P11", "P12"]
-BLOQUE_P19 = [f"P19.{i}" for i in range(1, 12)]
-
 
 # ----------------- HELPERS -----------------
 def render_kpi(title: str, value: str):
@@ -152,30 +175,24 @@ def render_kpi(title: str, value: str):
     )
 
 
-def quitar_acentos(texto):
-    if not isinstance(texto, str):
-        texto = str(texto)
-    texto = unicodedata.normalize("NFKD", texto)
-    return "".join(c for c in texto if not unicodedata.combining(c))
+def mostrar_figura(clave, construir, spec=None):
+    """Muestra un gráfico con el motor configurado.
 
+    Con ``vega`` se envía la especificación de ``spec()`` y dibuja el navegador;
+    si no, la imagen sale de la caché de render (sólo se dibuja si no está).
+    """
+    if MOTOR_GRAFICOS == "vega" and spec is not None:
+        with medir("grafico", str(clave[0]), motor="vega") as ev:
+            especificacion = spec()
+            ev["filas"] = len(especificacion["data"]["values"])
+        st.vega_lite_chart(spec=especificacion, width="stretch")
+        return
+    st.image(CACHE_RENDER.obtener(clave, construir), width="stretch")
 
-def normalizar_clave_comuna(txt):
-    if not isinstance(txt, str):
-        txt = str(txt)
-    txt = quitar_acentos(txt).upper()
-    for prefix in ["ILUSTRE MUNICIPALIDAD DE ", "MUNICIPALIDAD DE ", "MUNICIPALIDAD "]:
-        txt = txt.replace(prefix, "")
-    txt = txt.replace(" ", "").replace("-", "").replace("'", "")
-    return txt.strip()
 
-
-def clasificar_nivel(valor):
-    if valor <= 3:
-        return "Bajo (Iniciando)"
-    elif valor <= 7:
-        return "Medio (En desarrollo)"
-    else:
-        return "Alto (Avanzado)"
+def etiquetas_municipios(nombres):
+    """Nombres abreviados para matplotlib; Vega-Lite los recorta solo y muestra el completo al pasar el mouse."""
+    return nombres if MOTOR_GRAFICOS == "vega" else nombres.apply(abreviar_muni)
 
 
 def prettify_columns(df, extra_map=None):
@@ -198,35 +215,89 @@ def abreviar_muni(nombre, max_len=16):
     return s[: max_len - 3] + "..."
 
 
-def binarizar(df_cols):
-    df_num = df_cols.apply(pd.to_numeric, errors="coerce")
-    df_num = df_num.where(df_num.isin([0, 1]), 0)
-    return df_num.fillna(0).astype(int)
-
-
-def make_pie(df_view, col, label_si, label_no):
-    if col not in df_view.columns:
+def make_pie(totales, col, label_si, label_no, clave=()):
+    """Torta Sí/No a partir de los totales del cubo (``n`` y ``suma_<col>``)."""
+    if f"suma_{col}" not in totales.index:
         st.caption(f"{col} no está disponible en la base.")
         return
-    si = int(df_view[col].sum())
-    no = int(len(df_view) - si)
+    si = int(totales[f"suma_{col}"])
+    no = int(totales["n"] - si)
     if si + no == 0:
         st.caption(f"Sin datos suficientes para {col} en esta vista.")
         return
-    fig, ax = plt.subplots(figsize=(3.6, 3.6))
-    ax.pie(
-        [si, no],
-        labels=[label_si, label_no],
-        autopct="%1.0f%%",
-        colors=[P19_COLOR, NO_COLOR],
-        textprops={"fontsize": 8},
+    mostrar_figura(
+        ("torta", col, si, no) + tuple(clave),
+        lambda: fig_torta(si, no, label_si, label_no),
+        lambda: spec_torta(si, no, label_si, label_no),
+    )
+
+
+def con_niveles(df):
+    """``df`` con ``Nivel_Madurez`` según los umbrales elegidos en la barra lateral."""
+    if umbrales == UMBRALES_MADUREZ:
+        return df
+    return df.assign(
+        Nivel_Madurez=clasificar_niveles(df["indice_digitalizacion"], umbrales)
     )
-    ax.axis("equal")
-    st.pyplot(fig)
 
 
-def explorar_bloque(df_region, comuna_sel, tipo, cols_p34=None):
+def mostrar_similares(dataset, fila):
+    """Municipios de todo el país con el perfil P19.x/P34.x más parecido al de ``fila``."""
+    st.markdown("#### Municipios con perfil similar")
+    metrica = st.segmented_control(
+        "Distancia",
+        ["Jaccard", "Hamming"],
+        default="Jaccard",
+        required=True,
+        key="sim_metrica",
+        persist_state="session",
+    )
+    pares = con_niveles(similares(dataset, fila, metrica=metrica.lower()))
+    st.dataframe(
+        prettify_columns(
+            pares[
+                ["MUNICIPALIDAD", "region_nombre", "Nivel_Madurez", "indice_digitalizacion",
+                 "P19_promedio", "en_comun", "distancia"]
+            ],
+            {"en_comun": "Ítems en común", "distancia": "Distancia"},
+        ),
+        hide_index=True,
+        column_config={"Distancia": st.column_config.NumberColumn(format="%.2f")},
+    )
+    st.caption(
+        "Se comparan las respuestas de P19.x y P34.x. Jaccard: 1 − ítems en común / ítems "
+        "declarados por alguno de los dos (0 = mismo conjunto). Hamming: cantidad de ítems "
+        "en que difieren."
+    )
+
+
+def botones_descarga(vista, filtros, construir):
+    """Un botón por formato con el recorte ``construir()`` de la vista, con P19.x y P34.x.
+
+    Los bytes se generan recién al hacer clic y quedan cacheados por vista,
+    filtros, umbrales, formato y versión de datos.
+    """
+    clave = (vista, *filtros, umbrales, dataset.version)
+    formatos = formatos_disponibles()
+    for col, formato in zip(st.columns(len(formatos)), formatos):
+        with col:
+            st.download_button(
+                f"Descargar {formato}",
+                data=lambda f=formato: descargar(
+                    clave, lambda: dataset.con_items(con_niveles(construir())), f
+                ),
+                file_name=nombre_archivo(vista, *filtros, formato=formato),
+                mime=FORMATOS[formato][1],
+                key=f"{vista}_descarga_{formato}",
+                width="stretch",
+            )
+
+
+def explorar_bloque(dataset, region, comuna_sel, tipo):
     """Explorador genérico para P19 y P34 (reduce código repetido)."""
+    df_region = particion(dataset.df, dataset.indice, region)
+    cols_p34, version = dataset.cols_p34, dataset.version
+
     if tipo == "P19":
         col_val = "P19_promedio"
         titulo_tabla = "bloque P19"
@@ -248,23 +319,22 @@ def explorar_bloque(df_region, comuna_sel, tipo, cols_p34=None):
 
     if comuna_sel == "Todas las comunas":
         st.markdown(f"#### Tabla de comunas de la región ({titulo_tabla})")
-        df_tab = df_region[["MUNICIPALIDAD", "Nivel_Madurez", "indice_digitalizacion", "P19_promedio"]]
-        st.dataframe(prettify_columns(df_tab).sort_values("Municipalidad"))
+        df_tab = con_niveles(ordenado(dataset.df, dataset.indice, "MUNICIPALIDAD", region))[
+            ["MUNICIPALIDAD", "Nivel_Madurez", "indice_digitalizacion", "P19_promedio"]
+        ]
+        st.dataframe(prettify_columns(df_tab))
 
         st.markdown(f"#### Comparación de comunas según {titulo_valor}")
-        df_plot = df_region.sort_values(col_val, ascending=False)
-        max_munis = 20
-        if len(df_plot) > max_munis:
-            df_plot = df_plot.head(max_munis)
-            st.caption(cap_top.format(n=max_munis))
-
-        df_plot["Etiqueta"] = df_plot["MUNICIPALIDAD"].apply(abreviar_muni)
-        fig, ax = plt.subplots(figsize=(8, 6))
-        ax.barh(df_plot["Etiqueta"], df_plot[col_val], color=color)
-        ax.set_xlabel(ylabel)
-        ax.set_ylabel("Municipio")
-        ax.invert_yaxis()
-        st.pyplot(fig)
+        df_plot = ordenado(dataset.df, dataset.indice, col_val, region, k=LIMITE_BARRAS)
+        if LIMITE_BARRAS and len(df_region) > LIMITE_BARRAS:
+            st.caption(cap_top.format(n=LIMITE_BARRAS))
+        etiquetas = etiquetas_municipios(df_plot["MUNICIPALIDAD"])
+
+        mostrar_figura(
+            ("expl_top", tipo, region, version),
+            lambda: fig_barras_municipios(etiquetas, df_plot[col_val], color, ylabel),
+            lambda: spec_barras_municipios(etiquetas, df_plot[col_val], color, ylabel),
+        )
         st.caption(cap_reg)
         return
 
@@ -273,7 +343,7 @@ def explorar_bloque(df_region, comuna_sel, tipo, cols_p34=None):
         st.warning("No se encontró información para la comuna seleccionada.")
         return
 
-    row = df_comuna.iloc[0]
+    row = con_niveles(df_comuna).iloc[0]
     st.markdown(f"#### Ficha comunal – {titulo_tabla}")
 
     col_a, col_b, col_c, col_d = st.columns(4)
@@ -289,184 +359,103 @@ def explorar_bloque(df_region, comuna_sel, tipo, cols_p34=None):
 
     st.markdown('<hr class="soft-divider">', unsafe_allow_html=True)
 
-    media_reg = df_region[col_val].mean()
+    media_reg = resumen(dataset.cubo, region)[f"media_{col_val}"]
     st.write(
         f"Comparación de la comuna **{comuna_sel}** con el promedio de la región "
         f"**{row['region_nombre']}** ({titulo_tabla})."
     )
 
-    fig, ax = plt.subplots()
-    ax.bar(
-        ["Comuna seleccionada", "Promedio regional"],
-        [row[col_val], media_reg],
-        color=[color, "#9ca3af"],
+    mostrar_figura(
+        ("expl_comuna", tipo, row["region_nombre"], comuna_sel, version),
+        lambda: fig_comparacion(row[col_val], media_reg, color, ylabel),
+        lambda: spec_comparacion(row[col_val], media_reg, color, ylabel),
     )
-    ax.set_ylabel(ylabel)
-    ax.grid(axis="y", linestyle="--", alpha=0.4)
-    st.pyplot(fig)
     st.caption(cap_com)
 
+    st.markdown('<hr class="soft-divider">', unsafe_allow_html=True)
+    mostrar_similares(dataset, df_comuna.index[0])
+
     if tipo == "P34" and cols_p34:
         st.markdown("---")
         st.write("Sistemas por área municipal (P34.x) activos en la comuna seleccionada")
 
-        detalle_p34 = df_comuna[cols_p34].T.reset_index()
-        detalle_p34.columns = ["Pregunta", "Valor"]
-        detalle_p34 = detalle_p34[detalle_p34["Valor"] > 0]
+        detalle = detalle_p34(df_comuna, cols_p34)
 
-        if detalle_p34.empty:
+        if detalle.empty:
             st.info("La comuna no declara sistemas activos en P34.x.")
             return
 
-        detalle_p34["Etiqueta"] = (
-            detalle_p34["Pregunta"]
-            .str.replace("P34", "", regex=False)
-            .str.replace("_", " ", regex=False)
-            .str.strip()
-        )
-
-        max_items_det = 20
-        if len(detalle_p34) > max_items_det:
-            detalle_p34 = detalle_p34.head(max_items_det)
+        if LIMITE_BARRAS and len(detalle) > LIMITE_BARRAS:
+            detalle = detalle.head(LIMITE_BARRAS)
             st.caption(
-                f"Se muestran los primeros {max_items_det} ítems de P34.x activados para esta comuna."
+                f"Se muestran los primeros {LIMITE_BARRAS} ítems de P34.x activados para esta comuna."
             )
 
-        fig6, ax6 = plt.subplots(figsize=(10, 4))
-        ax6.bar(detalle_p34["Etiqueta"], detalle_p34["Valor"], color=P34_COLOR)
-        ax6.set_xticklabels(detalle_p34["Etiqueta"], rotation=90)
-        ax6.set_ylabel("Presencia del sistema (1 = presente)")
-        ax6.grid(axis="y", linestyle="--", alpha=0.4)
-        st.pyplot(fig6)
+        mostrar_figura(
+            ("expl_p34", row["region_nombre"], comuna_sel, version),
+            lambda: fig_detalle_p34(detalle["Etiqueta"], detalle["Valor"]),
+            lambda: spec_detalle_p34(detalle["Etiqueta"], detalle["Valor"]),
+        )
         st.caption("Cada ítem P34.x corresponde a un área específica con sistema de administración.")
 
 
 # ----------------- CARGA DE DATOS -----------------
-@st.cache_data(show_spinner=False)
-def cargar_datos():
-    url_csv = "https://datos.gob.cl/datastore/dump/a6e3cfd1-08d7-4221-abb8-ee6d766a4820?bom=True"
-    try:
-        r = requests.get(url_csv, timeout=30)
-        r.raise_for_status()
-        try:
-            content = r.content.decode("utf-8")
-        except UnicodeDecodeError:
-            content = r.content.decode("latin1", errors="ignore")
-        df = pd.read_csv(StringIO(content), low_memory=False)
-    except Exception:
-        return pd.DataFrame(), [], [], []
-
-    def get_api(endpoint):
-        try:
-            r = requests.get(
-                f"https://apis.digital.gob.cl/dpa/{endpoint}",
-                headers={"User-Agent": "Mozilla"},
-                timeout=5,
-            )
-            if r.status_code == 200:
-                return pd.DataFrame(r.json())
-            return pd.DataFrame()
-        except Exception:
-            return pd.DataFrame()
-
-    comunas = get_api("comunas")
-    provincias = get_api("provincias")
-    regiones = get_api("regiones")
-
-    df["Comuna_clave"] = df["MUNICIPALIDAD"].apply(normalizar_clave_comuna)
-
-    if not comunas.empty:
-        comunas = comunas.rename(
-            columns={
-                "codigo": "codigo_comuna",
-                "codigo_padre": "codigo_provincia",
-                "nombre": "nombre_comuna",
-            }
-        )
-        comunas["Comuna_clave"] = comunas["nombre_comuna"].apply(normalizar_clave_comuna)
-
-        provincias = provincias.rename(
-            columns={"codigo": "codigo_provincia", "codigo_padre": "codigo_region"}
-        )
-        regiones = regiones.rename(
-            columns={"codigo": "codigo_region", "nombre": "region_nombre"}
-        )
-
-        full_geo = comunas.merge(provincias, on="codigo_provincia").merge(
-            regiones, on="codigo_region"
-        )
+# cache_resource: un solo refresco (y un solo Dataset vigente) por proceso,
+# compartido sin copiar por todas las sesiones; ver Dataset.congelar(). Sólo
+# el primer arranque espera la carga; después el hilo de refresco publica las
+# versiones nuevas y cada rerun toma la vigente.
+@st.cache_resource(show_spinner=False)
+def refresco():
+    r = Refresco()
+    r.iniciar()
+    return r
 
-        df = df.merge(
-            full_geo[["Comuna_clave", "region_nombre"]].drop_duplicates(),
-            on="Comuna_clave",
-            how="left",
-        )
-        df["region_nombre"] = df["region_nombre"].fillna("Desconocida")
-
-        # Parche manual
-        comuna_region_codigo = {
-            "SANTIAGO": "13",
-            "LLAYLLAY": "05",
-            "LACALERA": "05",
-            "MARCHIGUE": "06",
-            "TREHUACO": "16",
-            "PAIHUANO": "04",
-            "OHIGGINS": "11",
-        }
-        if not regiones.empty:
-            for clave_comuna, cod_region in comuna_region_codigo.items():
-                nombre_region = regiones.loc[
-                    regiones["codigo_region"] == cod_region, "region_nombre"
-                ]
-                if not nombre_region.empty:
-                    df.loc[df["Comuna_clave"] == clave_comuna, "region_nombre"] = nombre_region.iloc[0]
-    else:
-        df["region_nombre"] = "Sin clasificar"
 
-    cols_binarias = [p for p in PREGUNTAS_PRINCIPALES if p in df.columns]
-    if cols_binarias:
-        df[cols_binarias] = (
-            df[cols_binarias].apply(pd.to_numeric, errors="coerce").fillna(0).astype(int)
-        )
+@st.cache_resource(show_spinner=False)
+def memoria_dataset(_dataset, version):
+    return _dataset.memoria()
 
-    cols_p19 = [p for p in BLOQUE_P19 if p in df.columns]
-    if cols_p19:
-        p19_bin = binarizar(df[cols_p19])
-        df[cols_p19] = p19_bin
-        df["P19_promedio"] = p19_bin.mean(axis=1)
-    else:
-        df["P19_promedio"] = 0.0
 
-    cols_p34 = [c for c in df.columns if c.startswith("P34")]
-    if cols_p34:
-        p34_bin = binarizar(df[cols_p34])
-        df[cols_p34] = p34_bin
-        df["indice_digitalizacion"] = p34_bin.sum(axis=1)
-    else:
-        df["indice_digitalizacion"] = 0
-
-    df["Nivel_Madurez"] = df["indice_digitalizacion"].apply(clasificar_nivel)
+# Los intervalos sólo cambian con la versión de datos: se remuestrea una vez
+# por versión e indicador y los reruns leen el resultado.
+@st.cache_data(show_spinner=False, max_entries=8)
+def intervalos_region(_dataset, version, indicador, regiones):
+    with medir("agregado", "bootstrap", indicador=indicador, remuestras=REMUESTRAS_BOOTSTRAP):
+        return intervalos_bootstrap(_dataset.df, indicador, list(regiones))
 
-    return df, cols_binarias, cols_p19, cols_p34
 
+@st.cache_resource(show_spinner=False)
+def api_json():
+    """API JSON en un hilo del mismo proceso, sobre el Dataset vigente."""
+    return api.iniciar_en_hilo(refresco().actual)
 
-with st.spinner("Conectando con datos.gob.cl..."):
-    df, cols_main, cols_p19, cols_p34 = cargar_datos()
 
-if df.empty:
-    st.error("No fue posible cargar los datos. Verifica tu conexión y vuelve a intentar.")
-    st.stop()
+# ----------------- SHELL -----------------
+# Título, ayuda y fuentes no dependen de los datos: se dibujan antes de
+# esperarlos, así el primer pintado no paga el pipeline ni la red. Los
+# contenedores reservan el lugar de lo que sí depende del dataset.
+st.markdown(
+    """
+<div class="main-title">
+  <h1>Monitor de Digitalización Municipal</h1>
+  <p>Visualización del nivel de digitalización de las municipalidades de Chile</p>
+</div>
+""",
+    unsafe_allow_html=True,
+)
 
-df_base = df.copy()
-regiones_validas = sorted(
-    [r for r in df_base["region_nombre"].dropna().unique().tolist()
-     if r not in ("Desconocida", "Sin clasificar")]
+st.markdown(
+    """
+- **Panorama general**: resumen por región, indicadores clave y niveles de madurez.  
+- **Comparaciones avanzadas**: promedios regionales, relación P19–P34 y ranking de municipios.  
+- **Explorador regional y comunal**: detalle por región y comuna para P19 y P34.
+"""
 )
 
-# ----------------- SIDEBAR -----------------
 st.sidebar.title("Dirección de variables")
-
-with st.sidebar.expander("General", expanded=False):
+controles = st.sidebar.container()
+ayuda_general = st.sidebar.expander("General", expanded=False)
+with ayuda_general:
     st.markdown(
         """
 - **P10 – Sitio web institucional** (0 = No, 1 = Sí).  
@@ -532,60 +521,142 @@ st.sidebar.markdown(
 """
 )
 
-# ----------------- CUERPO PRINCIPAL -----------------
-st.markdown(
-    """
-<div class="main-title">
-  <h1>Monitor de Digitalización Municipal</h1>
-  <p>Visualización del nivel de digitalización de las municipalidades de Chile</p>
-</div>
-""",
-    unsafe_allow_html=True,
+arranque("shell")
+
+# ----------------- DATOS -----------------
+with st.spinner("Conectando con datos.gob.cl..."):
+    dataset = refresco().actual()
+arranque("datos", origen=refresco().estado["arranque"])
+if api.PUERTO_API:
+    api_json()
+df, cubo, indice = dataset.df, dataset.cubo, dataset.indice
+
+if df.empty:
+    st.error("No fue posible cargar los datos. Verifica tu conexión y vuelve a intentar.")
+    st.stop()
+
+df_base = df
+CACHE_RENDER.fijar_version(dataset.version)
+CACHE_DESCARGAS.fijar_version(dataset.version)
+
+contexto = get_script_run_ctx()
+SESIONES.visto(contexto.session_id if contexto else "local")
+memoria = medir_memoria(memoria_dataset(dataset, dataset.version))
+regiones_validas = sorted(
+    [r for r in indice.regiones if r not in ("Desconocida", "Sin clasificar")]
 )
 
-st.markdown(
-    """
-- **Panorama general**: resumen por región, indicadores clave y niveles de madurez.  
-- **Comparaciones avanzadas**: promedios regionales, relación P19–P34 y ranking de municipios.  
-- **Explorador regional y comunal**: detalle por región y comuna para P19 y P34.
-"""
+
+def region_o_pais(sel):
+    """Traduce la opción "Todo el país" a ``None`` para el índice por región."""
+    return None if sel == "Todo el país" else sel
+
+
+# ----------------- SIDEBAR -----------------
+# Los niveles se recalculan desde el histograma del índice por región: mover
+# los umbrales no recarga datos ni recorre las filas.
+umbrales = controles.slider(
+    "Umbrales de madurez (índice P34)",
+    min_value=0,
+    max_value=max(len(dataset.cols_p34), UMBRALES_MADUREZ[1]),
+    value=UMBRALES_MADUREZ,
+    key="umbrales",
+    persist_state="session",
+    help="Bajo: hasta el primer valor. Medio: hasta el segundo. Alto: sobre el segundo.",
 )
 
-tab1, tab2, tab3 = st.tabs(
-    ["Panorama general", "Comparaciones avanzadas", "🔍 Explorador regional y comunal"]
+ayuda_general.caption(
+    f"Umbrales vigentes: Bajo ≤ {umbrales[0]} < Medio ≤ {umbrales[1]} < Alto."
 )
 
-# ---------- TAB 1 ----------
-with tab1:
+with st.sidebar.expander("Tiempos de carga por fuente", expanded=False):
+    for fila in dataset.tiempos:
+        st.markdown(
+            f"- **{fila['fuente']}**: {fila['segundos']:.2f} s · "
+            f"{fila['bytes'] / 1024:,.0f} KB · {fila['estado']}"
+        )
+    estado = refresco().estado
+    if estado["ultimo_intento"]:
+        hora = pd.Timestamp(estado["ultimo_intento"], unit="s").strftime("%H:%M")
+        st.caption(f"Último refresco ({hora} UTC): {estado['resultado']}")
+    if estado["error"]:
+        st.caption(f"Se sirve la versión anterior; error: {estado['error']}")
+
+no_resueltos = dataset.no_resueltos()
+if not no_resueltos.empty:
+    with st.sidebar.expander("Cruce de comunas con el DPA", expanded=False):
+        st.caption(
+            "Nombres de la encuesta que no calzan exacto con el DPA. Se aceptan "
+            "los aproximados con confianza suficiente; el resto queda como "
+            "región \"Desconocida\"."
+        )
+        st.dataframe(
+            no_resueltos.rename_axis("clave").reset_index(),
+            hide_index=True,
+            column_config={
+                "confianza": st.column_config.ProgressColumn(
+                    "confianza", min_value=0.0, max_value=1.0, format="%.2f"
+                )
+            },
+        )
+
+
+def panel_debug():
+    """Panel de instrumentación (opt-in con MONITOR_DEBUG=1 o ?debug=1)."""
+    with st.sidebar.expander("Instrumentación", expanded=True):
+        st.caption(f"Versión de datos: {dataset.version}")
+        mb = 1024 * 1024
+        st.markdown(
+            f"- Memoria del proceso: {memoria['memoria_rss_bytes'] / mb:,.0f} MB\n"
+            f"- Dataset compartido: {memoria['memoria_dataset_bytes'] / mb:,.1f} MB\n"
+            f"- Sesiones activas: {memoria['sesiones_activas']}\n"
+            f"- Memoria por sesión: {memoria['memoria_por_sesion_bytes'] / mb:,.1f} MB"
+        )
+        st.markdown("**Arranque del proceso** (segundos desde el inicio)")
+        st.dataframe(pd.DataFrame(list(ARRANQUE.values())), hide_index=True)
+        st.markdown("**Acumulado por etapa**")
+        st.dataframe(pd.DataFrame(REGISTRO.resumen()), hide_index=True)
+        st.markdown("**Eventos recientes**")
+        st.dataframe(pd.DataFrame(REGISTRO.recientes()), hide_index=True)
+
+# ----------------- CUERPO PRINCIPAL -----------------
+# Cada vista es un fragmento: sólo se ejecuta la vista activa y un cambio en
+# sus widgets vuelve a correr sólo ese fragmento, no el script completo.
+# persist_state="session" conserva la selección al cambiar de vista.
+
+# ---------- PANORAMA GENERAL ----------
+@st.fragment
+@medir("vista", "panorama")
+def vista_panorama():
     st.subheader("Panorama general por región")
 
     regiones_pg = ["Todo el país"] + regiones_validas
-    region_pg_sel = st.selectbox("Región a visualizar", regiones_pg, key="pg_region")
+    region_pg_sel = st.selectbox(
+        "Región a visualizar", regiones_pg, key="pg_region", persist_state="session"
+    )
 
-    df_view_pg = df_base.copy()
-    if region_pg_sel != "Todo el país":
-        df_view_pg = df_view_pg[df_view_pg["region_nombre"] == region_pg_sel]
+    totales_pg = resumen(cubo, region_pg_sel)
 
-    if df_view_pg.empty:
+    if not totales_pg["n"]:
         st.warning("No hay municipios para la combinación de filtros seleccionada.")
     else:
         col_kpi1, col_kpi2, col_kpi3, col_kpi4 = st.columns(4)
         with col_kpi1:
-            render_kpi("Municipios en la vista", f"{len(df_view_pg):,}")
+            render_kpi("Municipios en la vista", f"{int(totales_pg['n']):,}")
         with col_kpi2:
             render_kpi(
                 "Servicios digitales promedio (P34)",
-                f"{df_view_pg['indice_digitalizacion'].mean():.1f}",
+                f"{totales_pg['media_indice_digitalizacion']:.1f}",
             )
         with col_kpi3:
             render_kpi(
                 "Digitalización interna promedio (P19)",
-                f"{df_view_pg['P19_promedio'].mean():.2f}",
+                f"{totales_pg['media_P19_promedio']:.2f}",
             )
         with col_kpi4:
             render_kpi(
                 "Municipios con alta madurez",
-                f"{int((df_view_pg['Nivel_Madurez'] == 'Alto (Avanzado)').sum()):,}",
+                f"{int(niveles_histograma(dataset.histograma, region_pg_sel, umbrales)['Alto (Avanzado)']):,}",
             )
 
         st.caption(
@@ -600,51 +671,210 @@ with tab1:
         else:
             st.write("Servicios digitales por municipio (índice P34, muestra limitada).")
 
-        df_plot = df_view_pg.sort_values("indice_digitalizacion", ascending=False)
-        max_munis = 20
-        if len(df_plot) > max_munis:
-            df_plot = df_plot.head(max_munis)
+        df_plot = ordenado(
+            df_base, indice, "indice_digitalizacion", region_o_pais(region_pg_sel), k=LIMITE_BARRAS
+        )
+        if LIMITE_BARRAS and totales_pg["n"] > LIMITE_BARRAS:
             st.caption(
-                f"Se muestran los {max_munis} municipios con mayor índice de digitalización "
+                f"Se muestran los {LIMITE_BARRAS} municipios con mayor índice de digitalización "
                 "para mantener la legibilidad del gráfico."
             )
+        barras = (
+            etiquetas_municipios(df_plot["MUNICIPALIDAD"]),
+            df_plot["indice_digitalizacion"],
+            P34_COLOR,
+            "Índice de digitalización (suma P34.x)",
+        )
 
-        df_plot["Etiqueta"] = df_plot["MUNICIPALIDAD"].apply(abreviar_muni)
-        fig, ax = plt.subplots(figsize=(8, 6))
-        ax.barh(df_plot["Etiqueta"], df_plot["indice_digitalizacion"], color=P34_COLOR)
-        ax.set_xlabel("Índice de digitalización (suma P34.x)")
-        ax.set_ylabel("Municipio")
-        ax.invert_yaxis()
-        st.pyplot(fig)
+        mostrar_figura(
+            ("pg_top", region_pg_sel, dataset.version),
+            lambda: fig_barras_municipios(*barras),
+            lambda: spec_barras_municipios(*barras),
+        )
 
         st.markdown('<hr class="soft-divider">', unsafe_allow_html=True)
         st.write("Presencia de sitio web, redes sociales y trámites en línea (P10, P11, P12).")
 
         col_p10, col_p11, col_p12 = st.columns(3)
         with col_p10:
-            make_pie(df_view_pg, "P10", "Con sitio web", "Sin sitio web")
+            make_pie(totales_pg, "P10", "Con sitio web", "Sin sitio web", (dataset.version,))
         with col_p11:
-            make_pie(df_view_pg, "P11", "Usan redes sociales", "No usan redes")
+            make_pie(totales_pg, "P11", "Usan redes sociales", "No usan redes", (dataset.version,))
         with col_p12:
-            make_pie(df_view_pg, "P12", "Ofrecen trámites en línea", "Solo presencial")
+            make_pie(totales_pg, "P12", "Ofrecen trámites en línea", "Solo presencial", (dataset.version,))
 
         st.markdown('<hr class="soft-divider">', unsafe_allow_html=True)
         st.write("Distribución de niveles de madurez digital (a partir del índice P34).")
-        madurez_counts = df_view_pg["Nivel_Madurez"].value_counts().reindex(
+        madurez_counts = niveles_histograma(
+            dataset.histograma,
+            region_pg_sel,
+            umbrales,
             ["Alto (Avanzado)", "Medio (En desarrollo)", "Bajo (Iniciando)"],
-            fill_value=0,
         )
-        fig3, ax3 = plt.subplots()
-        ax3.bar(
-            madurez_counts.index,
-            madurez_counts.values,
-            color=[P19_COLOR, "#f97316", "#94a3b8"],
+        mostrar_figura(
+            ("pg_niveles", region_pg_sel, umbrales, dataset.version),
+            lambda: fig_niveles(madurez_counts),
+            lambda: spec_niveles(madurez_counts),
         )
-        ax3.set_ylabel("Cantidad de municipios")
-        st.pyplot(fig3)
 
-# ---------- TAB 2 ----------
-with tab2:
+        st.markdown('<hr class="soft-divider">', unsafe_allow_html=True)
+        st.write("Descargar los municipios de la vista, con todas las columnas P19.x y P34.x.")
+        botones_descarga(
+            "panorama",
+            (region_pg_sel,),
+            lambda: particion(df_base, indice, region_o_pais(region_pg_sel)),
+        )
+
+
+# ---------- COMPARACIONES AVANZADAS ----------
+@st.fragment
+@medir("vista", "comparaciones.promedios")
+def seccion_promedios():
+    st.markdown("### Promedio por región")
+    variable_opciones = {
+        "Índice de digitalización (P34)": "indice_digitalizacion",
+        "Digitalización interna promedio (P19)": "P19_promedio",
+    }
+    var_label_reg = st.selectbox(
+        "Variable a visualizar por región",
+        list(variable_opciones.keys()),
+        key="adv_var_region",
+        persist_state="session",
+    )
+    var_col_reg = variable_opciones[var_label_reg]
+
+    intervalos = intervalos_region(
+        dataset, dataset.version, var_col_reg, tuple(regiones_validas)
+    ).sort_values("media")
+
+    color_sel = P34_COLOR if var_col_reg == "indice_digitalizacion" else P19_COLOR
+    mostrar_figura(
+        ("adv_region", var_col_reg, dataset.version),
+        lambda: fig_promedios_region(intervalos, color_sel, var_label_reg),
+        lambda: spec_promedios_region(intervalos, color_sel, var_label_reg),
+    )
+    st.caption(
+        f"Las barras de error son intervalos de confianza del 95 % (bootstrap, "
+        f"{REMUESTRAS_BOOTSTRAP:,} remuestras). Las regiones con pocas comunas tienen "
+        "intervalos más anchos: su promedio es menos preciso."
+    )
+
+
+@st.fragment
+@medir("vista", "comparaciones.relacion")
+def seccion_relacion():
+    st.markdown("### Relación entre P19 promedio y P34 según nivel de madurez")
+    densidad = dataset.densidad
+    if umbrales != UMBRALES_MADUREZ:
+        densidad = reclasificar_densidad(densidad, umbrales)
+
+    mostrar_figura(
+        ("adv_densidad", umbrales, dataset.version),
+        lambda: fig_densidad(densidad),
+        lambda: spec_densidad(densidad),
+    )
+    st.caption(
+        "Cada círculo agrupa a los municipios con el mismo P19 promedio e índice P34; "
+        "su tamaño indica cuántos son."
+    )
+
+    corr_val, por_nivel = estadisticas_densidad(densidad)
+    if pd.notna(corr_val):
+        st.caption(
+            f"La correlación entre P19 promedio y el índice P34 es aproximadamente {corr_val:.2f} "
+            "(1 indica relación positiva fuerte, 0 ausencia de relación)."
+        )
+    st.dataframe(
+        prettify_columns(
+            por_nivel.rename_axis("Nivel_Madurez").reset_index(),
+            {
+                "n": "Municipios",
+                "media_P19_promedio": "P19 promedio",
+                "media_indice_digitalizacion": "Índice P34 promedio",
+            },
+        ),
+        hide_index=True,
+    )
+
+
+@st.fragment
+@medir("vista", "comparaciones.ranking")
+def seccion_ranking():
+    st.markdown("### Ranking de municipios según índice de digitalización (P34)")
+    ambitos_rank = ["Todo el país"] + regiones_validas
+    col_ambito, col_buscar = st.columns([2, 1])
+    with col_ambito:
+        ambito_sel = st.selectbox(
+            "Ámbito del ranking", ambitos_rank, key="rank_scope", persist_state="session"
+        )
+    with col_buscar:
+        buscar = st.text_input(
+            "Buscar municipio", key="rank_buscar", placeholder="Ej.: San", persist_state="session"
+        )
+
+    # Sólo viaja al navegador la página visible; puestos y percentiles vienen
+    # precalculados en el índice, así el costo no depende del tamaño del ranking.
+    _, total = pagina_ranking(
+        df_base, indice, "indice_digitalizacion", region_o_pais(ambito_sel), limite=0, buscar=buscar
+    )
+    if not total:
+        st.info(
+            f"Ningún municipio del ámbito empieza con \"{buscar}\"."
+            if buscar
+            else "No hay municipios en el ámbito seleccionado."
+        )
+        return
+
+    paginas = -(-total // FILAS_POR_PAGINA)
+    pagina_sel = st.number_input(
+        f"Página (de {paginas})", min_value=1, max_value=paginas, value=1, key="rank_pagina"
+    )
+    desde = (min(pagina_sel, paginas) - 1) * FILAS_POR_PAGINA
+    df_rank, _ = pagina_ranking(
+        df_base,
+        indice,
+        "indice_digitalizacion",
+        region_o_pais(ambito_sel),
+        desde,
+        FILAS_POR_PAGINA,
+        buscar,
+    )
+    df_rank = con_niveles(df_rank)[
+        ["puesto", "puesto_denso", "percentil", "MUNICIPALIDAD", "region_nombre",
+         "indice_digitalizacion", "Nivel_Madurez"]
+    ]
+    st.dataframe(
+        prettify_columns(
+            df_rank, {"puesto": "Puesto", "puesto_denso": "Puesto (denso)", "percentil": "Percentil"}
+        ),
+        hide_index=True,
+        column_config={"Percentil": st.column_config.NumberColumn(format="%.0f")},
+    )
+    st.caption(
+        f"Municipios {desde + 1}–{desde + len(df_rank)} de {total}. Los empates comparten "
+        "puesto: \"Puesto\" salta los lugares empatados (1, 2, 2, 4) y \"Puesto (denso)\" no (1, 2, 2, 3)."
+    )
+    # La descarga lleva el ranking filtrado completo, no sólo la página visible.
+    botones_descarga(
+        "ranking",
+        (ambito_sel, buscar),
+        lambda: pagina_ranking(
+            df_base, indice, "indice_digitalizacion", region_o_pais(ambito_sel),
+            limite=total, buscar=buscar,
+        )[0],
+    )
+
+
+SECCIONES_COMPARACIONES = {
+    "Promedios por región": seccion_promedios,
+    "Relación P19–P34": seccion_relacion,
+    "Ranking de municipios": seccion_ranking,
+}
+
+
+@st.fragment
+@medir("vista", "comparaciones")
+def vista_comparaciones():
     st.subheader("Comparaciones avanzadas")
     st.markdown(
         "Promedios regionales, relación entre digitalización interna (P19) y cobertura de sistemas (P34), "
@@ -654,121 +884,88 @@ with tab2:
     if df_base.empty:
         st.warning("No hay datos disponibles.")
     else:
-        sub_reg, sub_rel, sub_rank = st.tabs(
-            ["Promedios por región", "Relación P19–P34", "Ranking de municipios"]
+        seccion = st.segmented_control(
+            "Sección",
+            list(SECCIONES_COMPARACIONES),
+            default="Promedios por región",
+            required=True,
+            key="adv_seccion",
+            label_visibility="collapsed",
+            persist_state="session",
         )
+        SECCIONES_COMPARACIONES[seccion]()
 
-        with sub_reg:
-            st.markdown("### Promedio por región")
-            variable_opciones = {
-                "Índice de digitalización (P34)": "indice_digitalizacion",
-                "Digitalización interna promedio (P19)": "P19_promedio",
-            }
-            var_label_reg = st.selectbox(
-                "Variable a visualizar por región",
-                list(variable_opciones.keys()),
-                key="adv_var_region",
-            )
-            var_col_reg = variable_opciones[var_label_reg]
-
-            df_reg_filt = df_base[df_base["region_nombre"].isin(regiones_validas)].copy()
-            grp_reg = df_reg_filt.groupby("region_nombre")[var_col_reg].mean().sort_values()
-
-            fig7, ax7 = plt.subplots(figsize=(10, 6))
-            color_sel = P34_COLOR if var_col_reg == "indice_digitalizacion" else P19_COLOR
-            grp_reg.plot(kind="barh", ax=ax7, color=color_sel)
-            ax7.set_xlabel(var_label_reg)
-            ax7.set_ylabel("Región")
-            st.pyplot(fig7)
-
-        with sub_rel:
-            st.markdown("### Relación entre P19 promedio y P34 según nivel de madurez")
-            niveles_orden = ["Bajo (Iniciando)", "Medio (En desarrollo)", "Alto (Avanzado)"]
-            colores_nivel = {
-                "Bajo (Iniciando)": "#f97316",
-                "Medio (En desarrollo)": "#eab308",
-                "Alto (Avanzado)": "#22c55e",
-            }
-
-            fig9, ax9 = plt.subplots(figsize=(7, 5))
-            for nivel in niveles_orden:
-                sub = df_base[df_base["Nivel_Madurez"] == nivel]
-                if not sub.empty:
-                    ax9.scatter(
-                        sub["P19_promedio"],
-                        sub["indice_digitalizacion"],
-                        label=nivel,
-                        alpha=0.7,
-                        s=40,
-                        color=colores_nivel[nivel],
-                        marker="o",
-                        edgecolors="black",
-                        linewidths=0.5,
-                    )
-            ax9.set_xlabel("Digitalización interna (P19 promedio)")
-            ax9.set_ylabel("Índice de digitalización (P34)")
-            ax9.grid(True, linestyle="--", alpha=0.4)
-            ax9.legend(title="Nivel de madurez")
-            st.pyplot(fig9)
-
-            corr_val = df_base["P19_promedio"].corr(df_base["indice_digitalizacion"])
-            if pd.notna(corr_val):
-                st.caption(
-                    f"La correlación entre P19 promedio y el índice P34 es aproximadamente {corr_val:.2f} "
-                    "(1 indica relación positiva fuerte, 0 ausencia de relación)."
-                )
 
-        with sub_rank:
-            st.markdown("### Ranking de municipios según índice de digitalización (P34)")
-            ambitos_rank = ["Todo el país"] + regiones_validas
-            ambito_sel = st.selectbox(
-                "Ámbito del ranking", ambitos_rank, key="rank_scope"
-            )
-
-            df_rank = df_base[
-                ["MUNICIPALIDAD", "region_nombre", "indice_digitalizacion", "Nivel_Madurez"]
-            ].copy()
-            if ambito_sel != "Todo el país":
-                df_rank = df_rank[df_rank["region_nombre"] == ambito_sel]
-
-            if df_rank.empty:
-                st.info("No hay municipios en el ámbito seleccionado.")
-            else:
-                df_rank_display = prettify_columns(df_rank).sort_values(
-                    "Índice de digitalización (P34)", ascending=False
-                ).reset_index(drop=True)
-                st.dataframe(df_rank_display)
-
-# ---------- TAB 3 ----------
-with tab3:
+# ---------- EXPLORADOR REGIONAL Y COMUNAL ----------
+@st.fragment
+@medir("vista", "explorador")
+def vista_explorador():
     st.subheader("🔍 Explorador regional y comunal")
     st.markdown(
         "Selecciona una región y luego una comuna (o todas) para explorar los bloques **P19** y **P34**."
     )
 
-    region_sel = st.selectbox("Región", regiones_validas, key="expl_region")
-    df_region = df_base[df_base["region_nombre"] == region_sel]
+    region_sel = st.selectbox(
+        "Región", regiones_validas, key="expl_region", persist_state="session"
+    )
+    nombres_region = ordenado(df_base, indice, "MUNICIPALIDAD", region_sel)["MUNICIPALIDAD"]
 
-    if df_region.empty:
+    if nombres_region.empty:
         st.warning("No hay municipios en la región seleccionada.")
     else:
-        comunas_opts = ["Todas las comunas"] + sorted(
-            df_region["MUNICIPALIDAD"].dropna().unique().tolist()
+        comunas_opts = ["Todas las comunas"] + nombres_region.dropna().unique().tolist()
+        comuna_sel = st.selectbox(
+            "Comuna", comunas_opts, key="expl_comuna", persist_state="session"
         )
-        comuna_sel = st.selectbox("Comuna", comunas_opts, key="expl_comuna")
 
-        sub_p19, sub_p34 = st.tabs(
-            ["Bloque P19 – Digitalización interna", "Bloque P34 – Servicios digitales"]
+        def recorte():
+            df_region = particion(df_base, indice, region_sel)
+            if comuna_sel == "Todas las comunas":
+                return df_region
+            return df_region[df_region["MUNICIPALIDAD"] == comuna_sel]
+
+        botones_descarga("explorador", (region_sel, comuna_sel), recorte)
+
+        bloque = st.segmented_control(
+            "Bloque",
+            ["Bloque P19 – Digitalización interna", "Bloque P34 – Servicios digitales"],
+            default="Bloque P19 – Digitalización interna",
+            required=True,
+            key="expl_bloque",
+            label_visibility="collapsed",
+            persist_state="session",
         )
 
-        with sub_p19:
+        if bloque.startswith("Bloque P19"):
             st.markdown(
                 "El bloque **P19** muestra el grado de desarrollo de las funciones del área informática."
             )
-            explorar_bloque(df_region, comuna_sel, "P19")
-
-        with sub_p34:
+            explorar_bloque(dataset, region_sel, comuna_sel, "P19")
+        else:
             st.markdown(
                 "El bloque **P34** muestra en cuántas áreas municipales existen sistemas de administración."
             )
-            explorar_bloque(df_region, comuna_sel, "P34", cols_p34=cols_p34)
+            explorar_bloque(dataset, region_sel, comuna_sel, "P34")
+
+
+VISTAS = {
+    "Panorama general": vista_panorama,
+    "Comparaciones avanzadas": vista_comparaciones,
+    "🔍 Explorador regional y comunal": vista_explorador,
+}
+
+vista_sel = st.segmented_control(
+    "Vista",
+    list(VISTAS),
+    default="Panorama general",
+    required=True,
+    key="vista",
+    label_visibility="collapsed",
+    bind="query-params",
+)
+VISTAS[vista_sel]()
+
+if DEBUG or st.query_params.get("debug") == "1":
+    panel_debug()
+
+arranque("primer_render")
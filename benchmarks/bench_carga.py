@@ -0,0 +1,238 @@
+"""Benchmark por etapa del pipeline de carga.
+
+Genera encuestas sintéticas de distintos tamaños, las sirve con un servidor
+HTTP local y mide por separado cada etapa de ``cargar_dataset``. El resultado
+es JSON; con ``--comparar`` se contrasta contra una corrida anterior y el
+proceso termina con código 1 si alguna etapa empeora más que la tolerancia.
+También termina con código 1 si, en algún tamaño, el refresco incremental del
+1 % de las filas no es más rápido que procesar todo de nuevo.
+
+Uso (desde la raíz del repo)::
+
+    python -m benchmarks.bench_carga --filas 345,10000,100000 --salida bench.json
+    python -m benchmarks.bench_carga --comparar bench.json --tolerancia 0.25
+"""
+import argparse
+import codecs
+import json
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+
+import geografia
+from agregados import clasificar_niveles, construir_cubo
+from almacen import obtener_encuesta
+from benchmarks.sintetico import ServidorLocal, generar_dpa, generar_encuesta
+from datos import (
+    BLOQUE_P19,
+    Dataset,
+    actualizar,
+    binarizar,
+    derivar_indicadores,
+    procesar,
+)
+from fuentes import obtener_fuentes
+from indices import construir_indice, ordenar_por_region
+from ingesta import descargar_streaming, parsear_csv
+
+
+def _medir(funcion, repeticiones):
+    tiempos = []
+    resultado = None
+    for _ in range(repeticiones):
+        t0 = time.perf_counter()
+        resultado = funcion()
+        tiempos.append(time.perf_counter() - t0)
+    return resultado, {
+        "mediana_s": statistics.median(tiempos),
+        "min_s": min(tiempos),
+        "max_s": max(tiempos),
+    }
+
+
+def _validar_utf8(contenido):
+    decodificador = codecs.getincrementaldecoder("utf-8")()
+    vista = memoryview(contenido)
+    for i in range(0, len(contenido), 1 << 16):
+        decodificador.decode(vista[i : i + (1 << 16)])
+    decodificador.decode(b"", final=True)
+
+
+def medir_tamano(n_filas, repeticiones, dpa_payloads):
+    contenido = generar_encuesta(n_filas, semilla=n_filas)
+    etapas = {}
+
+    def etapa(nombre, funcion):
+        resultado, tiempos = _medir(funcion, repeticiones)
+        etapas[nombre] = tiempos
+        return resultado
+
+    rutas = {"/encuesta.csv": contenido}
+    rutas.update({f"/dpa/{k}": v for k, v in dpa_payloads.items()})
+    with ServidorLocal(rutas) as srv:
+        url_csv = srv.url("/encuesta.csv")
+
+        def descargar():
+            desc = descargar_streaming(url_csv)
+            desc.cerrar()
+
+        etapa("descarga_streaming", descargar)
+
+        def snapshot_frio():
+            with tempfile.TemporaryDirectory() as directorio:
+                obtener_encuesta(url_csv, directorio=directorio)
+
+        etapa("snapshot_descarga_y_guardado", snapshot_frio)
+
+        with tempfile.TemporaryDirectory() as directorio:
+            obtener_encuesta(url_csv, directorio=directorio)
+            etapa(
+                "snapshot_revalidacion_304",
+                lambda: obtener_encuesta(url_csv, directorio=directorio, frescura=0),
+            )
+            etapa("snapshot_local", lambda: obtener_encuesta(url_csv, directorio=directorio))
+
+            etapa(
+                "fuentes_concurrentes",
+                lambda: obtener_fuentes(
+                    url_csv, srv.url("/dpa"), directorio=directorio, incluir_dpa=True
+                ),
+            )
+
+    etapa("decodificacion", lambda: _validar_utf8(contenido))
+    crudo = etapa("parseo_csv", lambda: parsear_csv(BytesIO(contenido)))
+
+    def normalizar():
+        geografia._MEMO_CLAVES.clear()
+        return geografia.normalizar_claves(crudo["MUNICIPALIDAD"])
+
+    claves = etapa("normalizacion_claves", normalizar)
+    etapa("normalizacion_claves_memo", lambda: geografia.normalizar_claves(crudo["MUNICIPALIDAD"]))
+
+    indice_geo = geografia.cargar_indice_dpa()
+    etapa("tabla_geo", lambda: geografia.tabla_clave_region(indice_geo))
+
+    def emparejar():
+        geografia._INDICES_DIFUSOS.clear()
+        return geografia.asignar_regiones(claves, indice_geo)
+
+    regiones, _, _ = etapa("emparejamiento_comunas", emparejar)
+
+    cols_bloques = [c for c in crudo.columns if c in BLOQUE_P19 or c.startswith("P34")]
+    etapa("binarizar", lambda: binarizar(crudo[cols_bloques]))
+
+    def derivar():
+        df = crudo.copy()
+        df["Comuna_clave"] = claves
+        df["region_nombre"] = regiones.astype("category")
+        return derivar_indicadores(df)
+
+    df, cols_main, cols_p19, cols_p34 = etapa("derivar_indicadores", derivar)
+    etapa("clasificar_nivel", lambda: clasificar_niveles(df["indice_digitalizacion"]))
+
+    df = etapa("ordenar_por_region", lambda: ordenar_por_region(df))
+    dataset = Dataset(df, cols_main, cols_p19, cols_p34)
+    etapa("agregados", lambda: construir_cubo(dataset.con_items(), dataset.indicadores))
+    etapa("indices", lambda: construir_indice(df))
+
+    # Refresco incremental: el 1 % de las filas cambia de respuesta en P34.1.
+    anterior = procesar(crudo.copy(), indice_geo)
+    corregido = crudo.copy()
+    corregido.loc[corregido.index[::100], "P34.1"] = 9
+    etapa("procesar_completo", lambda: procesar(corregido.copy(), indice_geo))
+    etapa(
+        "refresco_incremental_1pct",
+        lambda: actualizar(anterior, corregido.copy(), indice_geo),
+    )
+
+    return {
+        "filas": n_filas,
+        "bytes_csv": len(contenido),
+        "memoria_df_bytes": int(df.memory_usage(deep=True).sum()),
+        "etapas": etapas,
+    }
+
+
+def comparar(actual, base, tolerancia):
+    """Lista de regresiones (etapa, filas, base, actual) sobre la mediana."""
+    previos = {r["filas"]: r["etapas"] for r in base.get("resultados", [])}
+    regresiones = []
+    for r in actual["resultados"]:
+        for nombre, t in r["etapas"].items():
+            t_base = previos.get(r["filas"], {}).get(nombre)
+            if t_base and t["mediana_s"] > t_base["mediana_s"] * (1 + tolerancia):
+                regresiones.append(
+                    {
+                        "etapa": nombre,
+                        "filas": r["filas"],
+                        "base_s": t_base["mediana_s"],
+                        "actual_s": t["mediana_s"],
+                    }
+                )
+    return regresiones
+
+
+def incremental_mas_lento(resultados):
+    """Tamaños en que el refresco incremental no le gana a ``procesar`` completo."""
+    lentos = []
+    for r in resultados:
+        completo = r["etapas"]["procesar_completo"]["mediana_s"]
+        incremental = r["etapas"]["refresco_incremental_1pct"]["mediana_s"]
+        if incremental >= completo:
+            lentos.append(
+                {"filas": r["filas"], "completo_s": completo, "incremental_s": incremental}
+            )
+    return lentos
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--filas", default="345,10000,100000", help="tamaños separados por coma")
+    parser.add_argument("--repeticiones", type=int, default=3)
+    parser.add_argument("--salida", help="archivo JSON de resultados (por defecto stdout)")
+    parser.add_argument("--comparar", help="JSON de una corrida anterior")
+    parser.add_argument("--tolerancia", type=float, default=0.25)
+    args = parser.parse_args(argv)
+
+    dpa_payloads = generar_dpa()
+    resultados = []
+    for n in (int(x) for x in args.filas.split(",")):
+        print(f"midiendo {n} filas...", file=sys.stderr)
+        resultados.append(medir_tamano(n, args.repeticiones, dpa_payloads))
+
+    salida = {
+        "meta": {
+            "fecha": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "repeticiones": args.repeticiones,
+        },
+        "resultados": resultados,
+    }
+
+    salida["incremental_mas_lento"] = incremental_mas_lento(resultados)
+    codigo = 1 if salida["incremental_mas_lento"] else 0
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as fh:
+            salida["regresiones"] = comparar(salida, json.load(fh), args.tolerancia)
+        codigo = 1 if salida["regresiones"] else codigo
+
+    texto = json.dumps(salida, ensure_ascii=False, indent=2)
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as fh:
+            fh.write(texto)
+    else:
+        print(texto)
+    return codigo
+
+
+if __name__ == "__main__":
+    sys.exit(main())
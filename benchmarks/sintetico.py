@@ -0,0 +1,172 @@
+"""Generador de encuestas y DPA sintéticos + servidor HTTP local.
+
+Las filas imitan el dump de datos.gob.cl: nombres "MUNICIPALIDAD DE ..." en
+mayúsculas tomados de la tabla DPA (con variantes sin tilde, con prefijo
+"ILUSTRE" y algunas comunas que no calzan), P10–P12, P19.1–P19.11 y P34.1–P34.12
+con ceros, unos, blancos y códigos fuera de rango, más columnas de texto que la
+app descarta. Sobre 346 filas los nombres se repiten como en un archivo con
+varias ediciones.
+"""
+import csv
+import hashlib
+import io
+import json
+import threading
+import unicodedata
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from geografia import cargar_indice_dpa
+
+N_P19 = 11
+N_P34 = 12
+COLUMNAS_RUIDO = (
+    [f"P{i}" for i in range(1, 10)] + [f"P{i}" for i in range(13, 19)] + ["P20", "P33"]
+)
+COMUNAS_INEXISTENTES = ["VILLA IMAGINARIA", "PUERTO FICTICIO", "SAN DESCONOCIDO"]
+
+
+def _sin_tildes(texto):
+    texto = unicodedata.normalize("NFKD", texto)
+    return "".join(c for c in texto if not unicodedata.combining(c))
+
+
+def nombres_municipios(n, rng):
+    comunas = cargar_indice_dpa()["nombre_comuna"].str.upper().tolist()
+    nombres = []
+    for i in range(n):
+        base = comunas[i % len(comunas)]
+        sorteo = rng.random()
+        if sorteo < 0.02:
+            base = COMUNAS_INEXISTENTES[i % len(COMUNAS_INEXISTENTES)]
+        elif sorteo < 0.25:
+            base = _sin_tildes(base)
+        prefijo = "ILUSTRE MUNICIPALIDAD DE " if rng.random() < 0.1 else "MUNICIPALIDAD DE "
+        nombres.append(prefijo + base)
+    return nombres
+
+
+def _respuestas(rng, n, k, p_si):
+    """Matriz de respuestas como texto: mayormente 0/1, con blancos y códigos 2/9."""
+    p = p_si[:, None]
+    valores = (rng.random((n, k)) < p).astype(int).astype(str).astype(object)
+    ruido = rng.random((n, k))
+    valores[ruido < 0.03] = ""
+    valores[(ruido >= 0.03) & (ruido < 0.05)] = "2"
+    valores[(ruido >= 0.05) & (ruido < 0.06)] = "9"
+    return valores
+
+
+def generar_encuesta(n_filas, semilla=0, encoding="utf-8-sig"):
+    """Bytes de un CSV sintético con ``n_filas`` municipios."""
+    rng = np.random.default_rng(semilla)
+    nombres = nombres_municipios(n_filas, rng)
+    # Propensión a digitalizar por municipio: correlaciona P19 y P34 como en los datos reales.
+    propension = rng.beta(2.0, 2.0, size=n_filas)
+    p10_12 = _respuestas(rng, n_filas, 3, 0.5 + 0.45 * propension)
+    p19 = _respuestas(rng, n_filas, N_P19, propension)
+    p_p34 = np.clip(propension + rng.normal(0, 0.1, n_filas), 0, 1)
+    p34 = _respuestas(rng, n_filas, N_P34, p_p34)
+
+    cabecera = (
+        ["_id", "MUNICIPALIDAD", "P10", "P11", "P12"]
+        + [f"P19.{i}" for i in range(1, N_P19 + 1)]
+        + ["P19.12"]
+        + [f"P34.{i}" for i in range(1, N_P34 + 1)]
+        + COLUMNAS_RUIDO
+    )
+    buf = io.StringIO()
+    escritor = csv.writer(buf, lineterminator="\n")
+    escritor.writerow(cabecera)
+    for i in range(n_filas):
+        escritor.writerow(
+            [i + 1, nombres[i]]
+            + list(p10_12[i])
+            + list(p19[i])
+            + ["Otra función declarada por el municipio"]
+            + list(p34[i])
+            + ["texto libre de la respuesta"] * len(COLUMNAS_RUIDO)
+        )
+    return buf.getvalue().encode(encoding)
+
+
+def generar_dpa():
+    """Payloads JSON con la forma de /dpa/comunas, /dpa/provincias y /dpa/regiones."""
+    indice = cargar_indice_dpa()
+
+    def registros(tabla, tipo, codigo, nombre, padre=None):
+        return [
+            {
+                "codigo": fila[codigo],
+                "tipo": tipo,
+                "nombre": fila[nombre],
+                "codigo_padre": fila[padre] if padre else "00",
+            }
+            for fila in tabla.drop_duplicates(codigo).to_dict("records")
+        ]
+
+    comunas = registros(indice, "comuna", "codigo_comuna", "nombre_comuna", "codigo_provincia")
+    provincias = registros(
+        indice, "provincia", "codigo_provincia", "nombre_provincia", "codigo_region"
+    )
+    regiones = registros(indice, "region", "codigo_region", "region_nombre")
+    return {
+        "comunas": json.dumps(comunas).encode(),
+        "provincias": json.dumps(provincias).encode(),
+        "regiones": json.dumps(regiones).encode(),
+    }
+
+
+# ----------------- SERVIDOR LOCAL -----------------
+class ServidorLocal:
+    """Servidor HTTP en un hilo que sirve ``rutas`` (ruta -> bytes) con ETag/304.
+
+    Uso::
+
+        with ServidorLocal({"/encuesta.csv": datos}) as srv:
+            url = srv.url("/encuesta.csv")
+    """
+
+    def __init__(self, rutas):
+        self.rutas = dict(rutas)
+        self.peticiones = []
+        servidor = self
+
+        class Manejador(BaseHTTPRequestHandler):
+            def do_GET(self):
+                ruta = self.path.split("?", 1)[0]
+                servidor.peticiones.append(ruta)
+                cuerpo = servidor.rutas.get(ruta)
+                if cuerpo is None:
+                    self.send_error(404)
+                    return
+                etag = '"%s"' % hashlib.sha1(cuerpo).hexdigest()
+                if self.headers.get("If-None-Match") == etag:
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", str(len(cuerpo)))
+                self.end_headers()
+                self.wfile.write(cuerpo)
+
+            def log_message(self, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), Manejador)
+        self._hilo = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+
+    def url(self, ruta=""):
+        host, puerto = self._httpd.server_address[:2]
+        return f"http://{host}:{puerto}{ruta}"
+
+    def __enter__(self):
+        self._hilo.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._httpd.shutdown()
+        self._httpd.server_close()
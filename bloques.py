@@ -0,0 +1,63 @@
+"""Representación compacta de los bloques binarios P19.x y P34.x.
+
+Las respuestas 0/1 de cada municipio se empaquetan en máscaras de bits
+(``uint64``, una palabra cada 64 ítems) guardadas en columnas
+``<bloque>_bits<j>``. El índice P34 y el promedio P19 salen de un popcount y la
+columna de cada ítem de un desplazamiento y un AND sobre las máscaras; las
+columnas 0/1 por ítem sólo se reconstruyen cuando una vista las necesita.
+"""
+import numpy as np
+import pandas as pd
+
+BITS_PALABRA = 64
+
+
+def columnas_bits(bloque, n_items):
+    n_palabras = max(1, -(-n_items // BITS_PALABRA))
+    return [f"{bloque}_bits{j}" for j in range(n_palabras)]
+
+
+def empaquetar(binarios):
+    """Matriz (n, k) de 0/1 -> matriz (n, palabras) ``uint64``; el ítem i es el bit i."""
+    binarios = np.asarray(binarios, dtype=np.uint64)
+    n, k = binarios.shape
+    palabras = np.zeros((n, max(1, -(-k // BITS_PALABRA))), dtype=np.uint64)
+    for i in range(k):
+        palabras[:, i // BITS_PALABRA] |= binarios[:, i] << np.uint64(i % BITS_PALABRA)
+    return palabras
+
+
+def mascaras(df, bloque, n_items):
+    """Matriz de palabras del bloque tomada de las columnas ``<bloque>_bits<j>``."""
+    return df[columnas_bits(bloque, n_items)].to_numpy(dtype=np.uint64)
+
+
+def popcount(palabras):
+    """Cantidad de bits encendidos por fila."""
+    return np.bitwise_count(palabras).sum(axis=1, dtype=np.int64)
+
+
+def bit(palabras, i):
+    """Columna 0/1 (``uint8``) del ítem ``i``."""
+    palabra = palabras[:, i // BITS_PALABRA]
+    return ((palabra >> np.uint64(i % BITS_PALABRA)) & np.uint64(1)).astype(np.uint8)
+
+
+def desempaquetar(df, bloque, cols):
+    """DataFrame 0/1 con una columna por ítem del bloque, alineado con ``df``."""
+    if not cols:
+        return pd.DataFrame(index=df.index)
+    palabras = mascaras(df, bloque, len(cols))
+    return pd.DataFrame(
+        {col: bit(palabras, i) for i, col in enumerate(cols)}, index=df.index
+    )
+
+
+def agregar_bloque(df, bloque, binarios):
+    """Reemplaza las columnas 0/1 del bloque por sus máscaras empaquetadas."""
+    cols = list(binarios.columns)
+    palabras = empaquetar(binarios.to_numpy())
+    df = df.drop(columns=cols)
+    for j, col in enumerate(columnas_bits(bloque, len(cols))):
+        df[col] = palabras[:, j]
+    return df
@@ -0,0 +1,63 @@
+"""LRU de bytes ya generados (figuras, exportaciones), acotado por bytes totales."""
+import threading
+from collections import OrderedDict
+
+from metricas import medir
+
+
+class CacheBytes:
+    """Guarda el resultado de ``generar()`` por clave y desaloja el menos usado.
+
+    Cada consulta se mide como un evento ``(tipo, clave[0])`` con acierto o
+    fallo de caché y los bytes entregados.
+    """
+
+    def __init__(self, max_bytes, tipo):
+        self.max_bytes = max_bytes
+        self.tipo = tipo
+        self.bytes = 0
+        self.aciertos = 0
+        self.fallos = 0
+        self.version = None
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obtener(self, clave, generar):
+        """Devuelve los bytes de ``clave``; sólo llama a ``generar()`` si no están."""
+        clave = tuple(clave)
+        with medir(self.tipo, str(clave[0])) as ev:
+            with self._lock:
+                datos = self._items.get(clave)
+                if datos is not None:
+                    self._items.move_to_end(clave)
+                    self.aciertos += 1
+                    ev.update(cache="hit", bytes=len(datos))
+                    return datos
+                self.fallos += 1
+
+            datos = generar()
+            ev.update(cache="miss", bytes=len(datos))
+
+        with self._lock:
+            if clave not in self._items:
+                self._items[clave] = datos
+                self.bytes += len(datos)
+            while self.bytes > self.max_bytes and len(self._items) > 1:
+                _, viejo = self._items.popitem(last=False)
+                self.bytes -= len(viejo)
+        return datos
+
+    def limpiar(self):
+        with self._lock:
+            self._items.clear()
+            self.bytes = 0
+
+    def fijar_version(self, version):
+        """Vacía la caché cuando cambia la versión de datos.
+
+        Todas las claves llevan la versión, así que las anteriores ya no se
+        van a pedir; sin esto ocuparían el tope hasta que el LRU las desaloje.
+        """
+        if version != self.version:
+            self.limpiar()
+            self.version = version
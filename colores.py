@@ -0,0 +1,11 @@
+"""Paleta compartida por los gráficos matplotlib y las especificaciones Vega-Lite."""
+P34_COLOR = "#1d4ed8"   # azul institucional
+P19_COLOR = "#0f766e"   # verde sobrio
+NO_COLOR   = "#b91c1c"  # rojo más oscuro
+GRIS = "#9ca3af"
+
+COLORES_NIVEL = {
+    "Bajo (Iniciando)": "#f97316",
+    "Medio (En desarrollo)": "#eab308",
+    "Alto (Avanzado)": "#22c55e",
+}
@@ -0,0 +1,423 @@
+"""Pipeline de datos del monitor, independiente de Streamlit.
+
+``cargar_dataset()`` obtiene las fuentes, arma las columnas derivadas
+(región, bloques binarizados, índice y nivel de madurez) y los agregados que
+consumen las vistas. Todo queda en un ``Dataset`` que la app cachea entero,
+de modo que los derivados se invalidan junto con los datos.
+
+El ``Dataset`` es compartido por todas las sesiones del proceso y se trata
+como inmutable: ``congelar()`` marca de sólo lectura los arreglos que no
+pasan por pandas, y con copy-on-write cualquier escritura sobre ``df`` o
+``cubo`` produce una copia local en vez de tocar el objeto compartido.
+
+Cada fila guarda en ``hash_fila`` un hash de su contenido crudo. Al refrescar
+con la misma geografía y el mismo esquema, ``actualizar`` compara esos hashes
+con el dump nuevo y sólo procesa las filas agregadas o modificadas: los
+agregados se parchan con la diferencia y las filas se intercalan en el orden
+por región y el índice existentes (``indices.empalmar``) en vez de rearmarlos.
+
+``emparejamiento`` guarda, por cada clave de comuna distinta, con qué nombre
+del DPA se cruzó, con qué confianza y por qué método; las que quedan sin
+región se informan en el log y en la barra lateral de la app.
+
+``guardar_serializado`` deja el último ``Dataset`` procesado junto a los
+snapshots y ``restaurar_serializado`` lo recupera en el siguiente arranque,
+siempre que la firma (código del pipeline, versiones de pandas/numpy y
+parámetros de entorno que cambian el resultado) coincida.
+``MONITOR_DATASET_SERIALIZADO=0`` lo desactiva.
+"""
+import hashlib
+import importlib
+import logging
+import os
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from agregados import (
+    UMBRALES_MADUREZ,
+    clasificar_niveles,
+    construir_cubo,
+    construir_densidad,
+    construir_histograma,
+    parchar_cubo,
+    parchar_densidad,
+    parchar_histograma,
+)
+from almacen import cargar_procesado, guardar_procesado
+from bloques import agregar_bloque, desempaquetar, mascaras, popcount
+from fuentes import obtener_fuentes
+from ingesta import BLOQUE_P19
+from geografia import (
+    UMBRAL_CONFIANZA,
+    VERSION_DPA,
+    asignar_regiones,
+    cargar_indice_dpa,
+    indice_desde_api,
+    normalizar_claves,
+)
+from indices import IndiceRegiones, construir_indice, empalmar, ordenar_por_region
+from metricas import REGISTRO, medir
+from similares import (
+    K_VECINOS,
+    PRECALCULO_MAX_FILAS,
+    TablaVecinos,
+    construir_tabla,
+    parchar_tabla,
+    perfiles,
+)
+
+log = logging.getLogger(__name__)
+
+PREGUNTAS_PRINCIPALES = ["P10", "P11", "P12"]
+
+# Fracción de filas cambiadas desde la que ``actualizar`` procesa todo de nuevo.
+MAX_CAMBIO_INCREMENTAL = 0.2
+SERIALIZAR_DATASET = os.environ.get("MONITOR_DATASET_SERIALIZADO", "1") == "1"
+# Módulos cuyo código decide el contenido del Dataset: si cambia alguno, el
+# serializado anterior ya no corresponde.
+MODULOS_PIPELINE = (
+    "agregados", "bloques", "datos", "emparejamiento", "geografia", "indices", "similares",
+)
+
+
+@dataclass
+class Dataset:
+    df: pd.DataFrame
+    cols_main: list = field(default_factory=list)
+    cols_p19: list = field(default_factory=list)
+    cols_p34: list = field(default_factory=list)
+    cubo: pd.DataFrame = None
+    densidad: pd.DataFrame = None
+    histograma: pd.DataFrame = None
+    vecinos: TablaVecinos = None
+    indice: IndiceRegiones = None
+    version: str = ""
+    tiempos: list = field(default_factory=list)
+    version_geo: str = ""
+    columnas_crudas: list = field(default_factory=list)
+    emparejamiento: pd.DataFrame = None
+
+    @property
+    def indicadores(self):
+        return (
+            self.cols_main
+            + ["indice_digitalizacion", "P19_promedio"]
+            + self.cols_p19
+            + self.cols_p34
+        )
+
+    def congelar(self):
+        """Marca de sólo lectura los arreglos del índice (posiciones, puestos y claves)."""
+        if self.indice is not None:
+            for arreglo in self.indice.arreglos():
+                arreglo.setflags(write=False)
+        if self.vecinos is not None:
+            for arreglo in self.vecinos.arreglos():
+                arreglo.setflags(write=False)
+        self.tiempos = tuple(self.tiempos)
+        return self
+
+    def no_resueltos(self):
+        """Claves cuyo cruce con el DPA no es exacto (aproximadas y sin región)."""
+        if self.emparejamiento is None:
+            return pd.DataFrame()
+        tabla = self.emparejamiento
+        return tabla[tabla["metodo"] != "exacto"].sort_values(["metodo", "confianza"])
+
+    def memoria(self):
+        """Bytes que ocupan el DataFrame, el cubo y el índice."""
+        total = int(self.df.memory_usage(deep=True).sum())
+        if self.cubo is not None:
+            total += int(self.cubo.memory_usage(deep=True).sum())
+        for tabla in (self.densidad, self.histograma):
+            if tabla is not None:
+                total += int(tabla.memory_usage(deep=True).sum())
+        if self.indice is not None:
+            total += sum(a.nbytes for a in self.indice.arreglos())
+        if self.vecinos is not None:
+            total += sum(a.nbytes for a in self.vecinos.arreglos())
+        return total
+
+    def con_items(self, df=None):
+        """``df`` (por defecto el dataset completo) con las columnas 0/1 de P19.x y P34.x."""
+        df = self.df if df is None else df
+        bits = [c for c in df.columns if c.startswith(("P19_bits", "P34_bits"))]
+        return pd.concat(
+            [
+                df.drop(columns=bits),
+                desempaquetar(df, "P19", self.cols_p19),
+                desempaquetar(df, "P34", self.cols_p34),
+            ],
+            axis=1,
+        )
+
+
+# ----------------- TRANSFORMACIONES -----------------
+def binarizar(df_cols):
+    df_num = df_cols.apply(pd.to_numeric, errors="coerce")
+    df_num = df_num.where(df_num.isin([0, 1]), 0)
+    return df_num.fillna(0).astype(int)
+
+
+def asignar_geografia(df, indice_geo):
+    """Agrega clave, región y confianza del cruce; devuelve ``(df, emparejamiento)``."""
+    df["Comuna_clave"] = normalizar_claves(df["MUNICIPALIDAD"])
+    regiones, confianza, emparejamiento = asignar_regiones(df["Comuna_clave"], indice_geo)
+    df["region_nombre"] = regiones.astype("category")
+    df["confianza_region"] = confianza
+    return df, emparejamiento
+
+
+def _informar_emparejamiento(emparejamiento, ev):
+    metodos = emparejamiento["metodo"].value_counts()
+    ev.update({f"claves_{m}": int(n) for m, n in metodos.items()})
+    sin_region = emparejamiento.index[emparejamiento["region_nombre"].isna()]
+    if len(sin_region):
+        log.warning("Comunas sin región: %s", ", ".join(sorted(sin_region)))
+
+
+def derivar_indicadores(df):
+    """Binariza P10–P12, P19.x y P34.x y calcula índice y nivel de madurez.
+
+    P19.x y P34.x quedan empaquetados en máscaras de bits (ver ``bloques``);
+    índice y promedio salen de un popcount sobre ellas.
+    """
+    cols_binarias = [p for p in PREGUNTAS_PRINCIPALES if p in df.columns]
+    if cols_binarias:
+        df[cols_binarias] = (
+            df[cols_binarias].apply(pd.to_numeric, errors="coerce").fillna(0).astype("int8")
+        )
+
+    cols_p19 = [p for p in BLOQUE_P19 if p in df.columns]
+    if cols_p19:
+        df = agregar_bloque(df, "P19", binarizar(df[cols_p19]))
+        df["P19_promedio"] = popcount(mascaras(df, "P19", len(cols_p19))) / len(cols_p19)
+    else:
+        df["P19_promedio"] = 0.0
+
+    cols_p34 = [c for c in df.columns if c.startswith("P34")]
+    if cols_p34:
+        df = agregar_bloque(df, "P34", binarizar(df[cols_p34]))
+        df["indice_digitalizacion"] = popcount(mascaras(df, "P34", len(cols_p34))).astype("int16")
+    else:
+        df["indice_digitalizacion"] = 0
+
+    df["Nivel_Madurez"] = clasificar_niveles(df["indice_digitalizacion"])
+    return df, cols_binarias, cols_p19, cols_p34
+
+
+# ----------------- CARGA -----------------
+def hash_filas(df):
+    """Hash ``uint64`` del contenido crudo de cada fila.
+
+    Las filas idénticas se distinguen por su número de ocurrencia, para que
+    duplicar o quitar una copia también cuente como cambio.
+    """
+    hashes = pd.util.hash_pandas_object(df, index=False).to_numpy()
+    ocurrencia = pd.Series(hashes).groupby(hashes).cumcount().to_numpy(dtype=np.uint64)
+    return hashes + ocurrencia * np.uint64(0x9E3779B97F4A7C15)
+
+
+def procesar(df, indice_geo, version="", tiempos=None, version_geo=""):
+    filas = len(df)
+    columnas_crudas = list(df.columns)
+    with medir("carga", "hash_filas", filas=filas):
+        df["hash_fila"] = hash_filas(df)
+    with medir("carga", "geografia", filas=filas) as ev:
+        df, emparejamiento = asignar_geografia(df, indice_geo)
+        _informar_emparejamiento(emparejamiento, ev)
+    with medir("carga", "indicadores", filas=filas):
+        df, cols_binarias, cols_p19, cols_p34 = derivar_indicadores(df)
+    with medir("carga", "orden_por_region", filas=filas):
+        df = ordenar_por_region(df)
+    dataset = Dataset(
+        df,
+        cols_binarias,
+        cols_p19,
+        cols_p34,
+        version=version,
+        tiempos=tiempos or [],
+        version_geo=version_geo,
+        columnas_crudas=columnas_crudas,
+        emparejamiento=emparejamiento,
+    )
+    with medir("carga", "cubo", filas=filas):
+        dataset.cubo = construir_cubo(dataset.con_items(), dataset.indicadores)
+    with medir("carga", "densidad", filas=filas):
+        dataset.densidad = construir_densidad(df)
+        dataset.histograma = construir_histograma(df)
+    with medir("carga", "indices", filas=filas):
+        dataset.indice = construir_indice(df)
+    with medir("carga", "vecinos", filas=filas):
+        dataset.vecinos = construir_tabla(perfiles(df, cols_p19, cols_p34))
+    return dataset.congelar()
+
+
+def _contar_cambios(salientes, nuevas):
+    """``(agregadas, quitadas, modificadas)`` emparejando las filas por municipio.
+
+    Una fila que sale y otra que entra con el mismo nombre son una modificada.
+    Los nombres repetidos cuentan con su multiplicidad: si salen tres filas de
+    un municipio y entran dos, son dos modificadas y una quitada.
+    """
+    salen = salientes["MUNICIPALIDAD"].value_counts(dropna=False)
+    entran = nuevas["MUNICIPALIDAD"].value_counts(dropna=False)
+    modificadas = int(np.minimum(salen, entran.reindex(salen.index, fill_value=0)).sum())
+    return len(nuevas) - modificadas, len(salientes) - modificadas, modificadas
+
+
+def actualizar(anterior, crudo, indice_geo, version="", tiempos=None):
+    """Nuevo ``Dataset`` a partir de ``anterior`` procesando sólo las filas que cambiaron.
+
+    Una fila modificada cuenta como una que sale y otra que entra. Sólo las
+    que entran pasan por geografía e indicadores; el cubo se parcha con las
+    celdas de ambas y ``empalmar`` las intercala en el orden por región y en
+    el índice existentes. Si cambió más de ``MAX_CAMBIO_INCREMENTAL`` de las
+    filas se procesa todo de nuevo.
+    """
+    hashes = hash_filas(crudo)
+    previos = anterior.df["hash_fila"].to_numpy()
+    sigue = pd.Index(previos).isin(hashes)
+    entra = ~pd.Index(hashes).isin(previos)
+    cambios = int(entra.sum() + (~sigue).sum())
+    if not len(previos) or cambios > MAX_CAMBIO_INCREMENTAL * len(crudo):
+        return procesar(crudo, indice_geo, version, tiempos, anterior.version_geo)
+
+    with medir("carga", "incremental", filas=cambios) as ev:
+        nuevas = crudo.loc[entra].copy()
+        nuevas["hash_fila"] = hashes[entra]
+        nuevas, emparejamiento = asignar_geografia(nuevas, indice_geo)
+        _informar_emparejamiento(emparejamiento, ev)
+        nuevas = derivar_indicadores(nuevas)[0]
+        salientes = anterior.df.loc[~sigue]
+        agregadas, quitadas, modificadas = _contar_cambios(salientes, nuevas)
+        ev.update(agregadas=agregadas, quitadas=quitadas, modificadas=modificadas)
+
+        df, indice, posiciones = empalmar(anterior.df, anterior.indice, np.flatnonzero(~sigue), nuevas)
+        if anterior.emparejamiento is not None:
+            emparejamiento = pd.concat([anterior.emparejamiento, emparejamiento])
+            emparejamiento = emparejamiento[~emparejamiento.index.duplicated(keep="last")]
+        # Sólo puede sobrar la clave de una fila que salió: se busca en las
+        # claves ordenadas del índice nuevo en vez de recorrer el DataFrame.
+        salen = np.unique(salientes["Comuna_clave"].dropna().to_numpy(dtype=str))
+        lugar = np.searchsorted(indice.claves, salen)
+        sigue_clave = lugar < len(indice.claves)
+        sigue_clave[sigue_clave] = indice.claves[lugar[sigue_clave]] == salen[sigue_clave]
+        emparejamiento = emparejamiento.drop(index=salen[~sigue_clave], errors="ignore")
+
+        dataset = Dataset(
+            df,
+            anterior.cols_main,
+            anterior.cols_p19,
+            anterior.cols_p34,
+            indice=indice,
+            version=version,
+            tiempos=tiempos or [],
+            version_geo=anterior.version_geo,
+            columnas_crudas=anterior.columnas_crudas,
+            emparejamiento=emparejamiento,
+        )
+        items = anterior.con_items(pd.concat([nuevas[anterior.df.columns], salientes]))
+        dataset.cubo = parchar_cubo(
+            anterior.cubo, agregar=items.iloc[: len(nuevas)], quitar=items.iloc[len(nuevas) :]
+        )
+        dataset.densidad = parchar_densidad(anterior.densidad, agregar=nuevas, quitar=salientes)
+        dataset.histograma = parchar_histograma(
+            anterior.histograma, agregar=nuevas, quitar=salientes
+        )
+        dataset.vecinos = parchar_tabla(
+            anterior.vecinos, perfiles(df, anterior.cols_p19, anterior.cols_p34), posiciones
+        )
+    return dataset.congelar()
+
+
+def cargar_dataset(frescura=None, anterior=None):
+    """Obtiene las fuentes y arma el ``Dataset``.
+
+    Con un ``anterior``: si la versión (hash del CSV + geografía) no cambió no
+    se reprocesa nada y se devuelve None; si sólo cambió el CSV, se actualiza
+    de forma incremental.
+    """
+    with medir("carga", "total") as ev:
+        dataset = _cargar_dataset(frescura, anterior)
+        ev["filas"] = len(dataset.df) if dataset is not None else 0
+    return dataset
+
+
+def _cargar_dataset(frescura=None, anterior=None):
+    # Encuesta (snapshot local + GET condicional) y DPA en paralelo, con un solo plazo.
+    df, meta_csv, dpa, tiempos = obtener_fuentes(frescura=frescura)
+    for fila in tiempos:
+        REGISTRO.registrar(
+            {
+                "tipo": "fuente",
+                "nombre": fila["fuente"],
+                "segundos": fila["segundos"],
+                "bytes": fila["bytes"],
+                "estado": fila["estado"],
+            }
+        )
+    if df is None:
+        return Dataset(pd.DataFrame(), tiempos=tiempos)
+
+    # Geografía: tabla DPA incluida con la app; la API sólo la refresca si está habilitada.
+    indice_geo = indice_desde_api(dpa["comunas"], dpa["provincias"], dpa["regiones"])
+    if indice_geo.empty:
+        indice_geo = cargar_indice_dpa()
+        version_geo = VERSION_DPA
+    else:
+        firma = pd.util.hash_pandas_object(indice_geo, index=False).sum()
+        version_geo = f"api{int(firma) & 0xFFFFFFFF:08x}"
+
+    version = f"{meta_csv.get('sha256', '')[:12]}-{version_geo}"
+    if anterior is not None and not anterior.df.empty:
+        if version == anterior.version:
+            return None
+        if (
+            version_geo == anterior.version_geo
+            and list(df.columns) == anterior.columnas_crudas
+        ):
+            return actualizar(anterior, df, indice_geo, version, tiempos)
+    return procesar(df, indice_geo, version, tiempos, version_geo)
+
+
+# ----------------- SERIALIZADO -----------------
+def firma_pipeline():
+    """Hash del código del pipeline, de pandas/numpy y de los parámetros que usa."""
+    h = hashlib.sha256(
+        repr(
+            (pd.__version__, np.__version__, UMBRALES_MADUREZ, UMBRAL_CONFIANZA,
+             VERSION_DPA, K_VECINOS, PRECALCULO_MAX_FILAS)
+        ).encode()
+    )
+    for nombre in MODULOS_PIPELINE:
+        h.update(Path(importlib.import_module(nombre).__file__).read_bytes())
+    return h.hexdigest()
+
+
+def guardar_serializado(dataset):
+    """Deja ``dataset`` listo para el próximo arranque; un fallo sólo se registra."""
+    if not SERIALIZAR_DATASET or dataset is None or dataset.df.empty:
+        return
+    with medir("serializado", "guardar") as ev:
+        try:
+            ev["bytes"] = guardar_procesado(dataset, firma_pipeline()).stat().st_size
+        except OSError:
+            log.warning("No se pudo guardar el dataset serializado", exc_info=True)
+            ev["estado"] = "error"
+
+
+def restaurar_serializado():
+    """El ``Dataset`` que guardó la última carga con la firma actual, o None."""
+    if not SERIALIZAR_DATASET:
+        return None
+    with medir("serializado", "restaurar") as ev:
+        dataset = cargar_procesado(firma_pipeline())
+        if not isinstance(dataset, Dataset) or dataset.df.empty:
+            ev["estado"] = "sin-archivo"
+            return None
+        ev.update(estado="ok", filas=len(dataset.df))
+    return dataset.congelar()
@@ -0,0 +1,111 @@
+"""Exportación de los recortes de cada vista a CSV, Parquet o Excel.
+
+``generar`` escribe por bloques de ``FILAS_POR_BLOQUE`` filas (un ``to_csv``
+por bloque, un row group de Parquet por bloque, filas de Excel en modo de
+memoria constante), así el costo en memoria no depende del tamaño del recorte
+más allá del resultado. Los bytes quedan en ``CACHE_DESCARGAS`` por (vista,
+filtros, formato, versión de datos): descargar otra vez la misma región no
+vuelve a codificar nada.
+
+Excel necesita ``xlsxwriter``; si no está instalado el formato no se ofrece.
+"""
+import importlib.util
+import os
+import tempfile
+from io import BytesIO
+
+from cache import CacheBytes
+
+FILAS_POR_BLOQUE = 5000
+# Columnas internas del pipeline que no tienen sentido para un analista.
+COLUMNAS_INTERNAS = ["hash_fila"]
+
+# etiqueta -> (extensión, tipo MIME)
+FORMATOS = {
+    "CSV": ("csv", "text/csv"),
+    "Parquet": ("parquet", "application/vnd.apache.parquet"),
+    "Excel": ("xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+}
+EXCEL_DISPONIBLE = importlib.util.find_spec("xlsxwriter") is not None
+
+CACHE_DESCARGAS = CacheBytes(
+    int(float(os.environ.get("MONITOR_CACHE_DESCARGAS_MB", 64)) * 1024 * 1024), "descarga"
+)
+
+
+def formatos_disponibles():
+    return [f for f in FORMATOS if f != "Excel" or EXCEL_DISPONIBLE]
+
+
+def _bloques(df):
+    for inicio in range(0, max(len(df), 1), FILAS_POR_BLOQUE):
+        yield inicio, df.iloc[inicio : inicio + FILAS_POR_BLOQUE]
+
+
+def _csv(df, destino):
+    destino.write("\ufeff".encode("utf-8"))  # BOM: Excel abre bien los acentos
+    for inicio, bloque in _bloques(df):
+        destino.write(bloque.to_csv(index=False, header=inicio == 0).encode("utf-8"))
+
+
+def _parquet(df, destino):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    escritor = None
+    try:
+        for _, bloque in _bloques(df):
+            tabla = pa.Table.from_pandas(
+                bloque, preserve_index=False, schema=escritor.schema if escritor else None
+            )
+            if escritor is None:
+                escritor = pq.ParquetWriter(destino, tabla.schema)
+            escritor.write_table(tabla)
+    finally:
+        if escritor is not None:
+            escritor.close()
+
+
+def _excel(df, destino):
+    import xlsxwriter
+
+    # constant_memory escribe cada fila al disco apenas se completa; necesita
+    # un archivo, así que se arma en uno temporal y después se copia.
+    with tempfile.TemporaryDirectory() as directorio:
+        ruta = os.path.join(directorio, "export.xlsx")
+        libro = xlsxwriter.Workbook(ruta, {"constant_memory": True, "nan_inf_to_errors": True})
+        hoja = libro.add_worksheet("datos")
+        hoja.write_row(0, 0, [str(c) for c in df.columns])
+        for inicio, bloque in _bloques(df):
+            filas = bloque.astype(object).where(bloque.notna(), None)
+            for i, fila in enumerate(filas.itertuples(index=False), start=inicio + 1):
+                hoja.write_row(i, 0, fila)
+        libro.close()
+        with open(ruta, "rb") as fh:
+            destino.write(fh.read())
+
+
+ESCRITORES = {"CSV": _csv, "Parquet": _parquet, "Excel": _excel}
+
+
+def generar(df, formato):
+    """Bytes de ``df`` en ``formato`` (una de las claves de ``FORMATOS``)."""
+    if formato not in ESCRITORES:
+        raise ValueError(f"formato debe ser uno de {', '.join(FORMATOS)}")
+    df = df.drop(columns=[c for c in COLUMNAS_INTERNAS if c in df.columns])
+    destino = BytesIO()
+    ESCRITORES[formato](df, destino)
+    return destino.getvalue()
+
+
+def nombre_archivo(*partes, formato):
+    """``monitor_<partes>.<ext>`` con las partes en minúscula y sin espacios."""
+    texto = "_".join(str(p) for p in partes if p)
+    limpio = "".join(c if c.isalnum() else "_" for c in texto.lower()).strip("_")
+    return f"monitor_{limpio or 'datos'}.{FORMATOS[formato][0]}"
+
+
+def descargar(clave, construir, formato):
+    """Bytes cacheados de ``construir()`` (un DataFrame) en ``formato``."""
+    return CACHE_DESCARGAS.obtener(tuple(clave) + (formato,), lambda: generar(construir(), formato))
+
@@ -0,0 +1,63 @@
+"""Emparejamiento aproximado de nombres con un índice de trigramas.
+
+Para cada nombre que no calza exacto, el índice invertido trigrama -> ids
+entrega los pocos candidatos que comparten más trigramas y sólo a esos se les
+calcula la distancia de edición. El costo por nombre depende del largo del
+nombre y de las listas de sus trigramas, no del tamaño del vocabulario.
+
+La confianza es ``1 - distancia / largo del más largo`` (1.0 = idéntico).
+"""
+from collections import Counter, defaultdict
+
+N_CANDIDATOS = 8
+
+
+def trigramas(texto):
+    """Trigramas con relleno en los bordes ("ABC" -> "##A", "#AB", "ABC", "BC#")."""
+    texto = f"##{texto}#"
+    return {texto[i : i + 3] for i in range(len(texto) - 2)}
+
+
+def levenshtein(a, b):
+    """Distancia de edición (inserción, borrado y sustitución cuestan 1)."""
+    if len(a) < len(b):
+        a, b = b, a
+    previa = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        actual = [i]
+        for j, cb in enumerate(b, 1):
+            actual.append(min(previa[j] + 1, actual[j - 1] + 1, previa[j - 1] + (ca != cb)))
+        previa = actual
+    return previa[-1]
+
+
+def confianza(a, b, distancia):
+    largo = max(len(a), len(b)) or 1
+    return 1.0 - distancia / largo
+
+
+class IndiceTrigramas:
+    def __init__(self, vocabulario):
+        self.vocabulario = list(vocabulario)
+        self._postings = defaultdict(list)
+        for i, palabra in enumerate(self.vocabulario):
+            for t in trigramas(palabra):
+                self._postings[t].append(i)
+
+    def candidatos(self, texto, n=N_CANDIDATOS):
+        """Ids del vocabulario que más trigramas comparten con ``texto``."""
+        conteo = Counter()
+        for t in trigramas(texto):
+            conteo.update(self._postings.get(t, ()))
+        return [i for i, _ in conteo.most_common(n)]
+
+    def buscar(self, texto):
+        """``(palabras, confianza)``: las mejores coincidencias (más de una si empatan)."""
+        puntajes = {}
+        for i in self.candidatos(texto):
+            palabra = self.vocabulario[i]
+            puntajes[palabra] = confianza(texto, palabra, levenshtein(texto, palabra))
+        if not puntajes:
+            return [], 0.0
+        mejor = max(puntajes.values())
+        return sorted(p for p, c in puntajes.items() if c == mejor), mejor
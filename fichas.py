@@ -0,0 +1,329 @@
+"""Fichas comunales en lote (PDF o PNG), sin Streamlit.
+
+Reutiliza el pipeline de ``datos`` y las figuras de ``graficos`` para generar:
+
+- una ficha por comuna con lo que muestra el explorador: P19 y P34 frente al
+  promedio regional y el detalle de sistemas P34.x activos;
+- una página por región con las comunas de mayor P19 y P34;
+- ``index.html`` y ``fichas.csv`` con la tabla de todas las comunas y el
+  enlace a cada archivo.
+
+El render se reparte en un pool de procesos. A cada proceso le llegan sólo
+los valores de sus fichas (no el dataset), en lotes para amortizar el envío.
+
+Uso (desde la raíz del repo)::
+
+    python fichas.py --salida fichas --formato pdf --procesos 8
+    python fichas.py --formato png --region "Ñuble" --region "Biobío"
+"""
+import argparse
+import html
+import logging
+import math
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import pandas as pd
+
+from agregados import resumen
+from bloques import desempaquetar
+from geografia import normalizar_claves
+from graficos import (
+    P19_COLOR,
+    P34_COLOR,
+    fig_barras_municipios,
+    fig_comparacion,
+    fig_detalle_p34,
+    pyplot,
+    serializar,
+)
+from indices import ordenado, particion
+
+log = logging.getLogger(__name__)
+
+MAX_TOP_REGION = 20
+MAX_ITEMS_DETALLE = 20
+TAMANO_PAGINA = (8.27, 11.69)  # A4 vertical, en pulgadas
+
+
+def etiquetas_p34(preguntas):
+    """Etiquetas del eje del detalle P34.x (las mismas que usa el explorador)."""
+    return (
+        pd.Series(preguntas, dtype=object)
+        .str.replace("P34", "", regex=False)
+        .str.replace("_", " ", regex=False)
+        .str.strip()
+        .tolist()
+    )
+
+
+def detalle_p34(df_comuna, cols_p34):
+    """Ítems P34.x activos de la comuna: columnas ``Pregunta``, ``Valor`` y ``Etiqueta``."""
+    detalle = desempaquetar(df_comuna, "P34", cols_p34).T.reset_index()
+    detalle.columns = ["Pregunta", "Valor"]
+    detalle = detalle[detalle["Valor"] > 0]
+    detalle["Etiqueta"] = etiquetas_p34(detalle["Pregunta"])
+    return detalle
+
+
+def _slugs(nombres):
+    """Nombres de archivo a partir de la clave normalizada, sin repetidos."""
+    claves = normalizar_claves(pd.Series(nombres, dtype=object)).str.lower().tolist()
+    vistos = {}
+    slugs = []
+    for clave in claves:
+        clave = clave or "sin-nombre"
+        vistos[clave] = vistos.get(clave, 0) + 1
+        slugs.append(clave if vistos[clave] == 1 else f"{clave}-{vistos[clave]}")
+    return slugs
+
+
+# ----------------- TAREAS -----------------
+def tareas_exportacion(dataset, formato="pdf", regiones=None):
+    """Lista de tareas (dicts serializables) con los datos de cada página."""
+    regiones = regiones or [
+        r for r in dataset.indice.regiones if r not in ("Desconocida", "Sin clasificar")
+    ]
+    tareas = []
+    for region, slug_region in zip(regiones, _slugs(regiones)):
+        df_region = particion(dataset.df, dataset.indice, region)
+        if df_region.empty:
+            continue
+        totales = resumen(dataset.cubo, region)
+
+        tops = {}
+        for col in ("P19_promedio", "indice_digitalizacion"):
+            top = ordenado(dataset.df, dataset.indice, col, region, k=MAX_TOP_REGION)
+            tops[col] = (top["MUNICIPALIDAD"].tolist(), top[col].tolist())
+        tareas.append(
+            {
+                "tipo": "region",
+                "region": region,
+                "n": int(totales["n"]),
+                "tops": tops,
+                "archivo": f"{slug_region}/_region.{formato}",
+            }
+        )
+
+        comunas = ordenado(dataset.df, dataset.indice, "MUNICIPALIDAD", region)
+        items = desempaquetar(comunas, "P34", dataset.cols_p34).to_numpy()
+        etiquetas = etiquetas_p34(dataset.cols_p34)
+        for i, ((_, fila), slug) in enumerate(
+            zip(comunas.iterrows(), _slugs(comunas["MUNICIPALIDAD"]))
+        ):
+            activos = [j for j in range(len(etiquetas)) if items[i, j] > 0]
+            tareas.append(
+                {
+                    "tipo": "comuna",
+                    "comuna": fila["MUNICIPALIDAD"],
+                    "region": region,
+                    "nivel": str(fila["Nivel_Madurez"]),
+                    "P19_promedio": float(fila["P19_promedio"]),
+                    "indice_digitalizacion": int(fila["indice_digitalizacion"]),
+                    "media_P19_promedio": float(totales["media_P19_promedio"]),
+                    "media_indice_digitalizacion": float(totales["media_indice_digitalizacion"]),
+                    "detalle": ([etiquetas[j] for j in activos], [1] * len(activos)),
+                    "archivo": f"{slug_region}/{slug}.{formato}",
+                }
+            )
+    return tareas
+
+
+# ----------------- RENDER (en los procesos del pool) -----------------
+def _pagina_comuna(t):
+    fig = pyplot().figure(figsize=TAMANO_PAGINA)
+    grilla = fig.add_gridspec(3, 2, height_ratios=[0.6, 2, 2], hspace=0.45, wspace=0.35)
+
+    cabecera = fig.add_subplot(grilla[0, :])
+    cabecera.axis("off")
+    cabecera.text(0, 0.9, f"Ficha comunal – {t['comuna']}", fontsize=15, weight="bold")
+    cabecera.text(
+        0,
+        0.35,
+        f"Región: {t['region']}    Nivel de madurez: {t['nivel']}\n"
+        f"P19 promedio: {t['P19_promedio']:.2f}    "
+        f"Índice de digitalización (P34): {t['indice_digitalizacion']}",
+        fontsize=10,
+        va="top",
+    )
+
+    ax_p19 = fig.add_subplot(grilla[1, 0])
+    fig_comparacion(
+        t["P19_promedio"], t["media_P19_promedio"], P19_COLOR, "P19 promedio (0 a 1)", ax=ax_p19
+    )
+    ax_p19.set_title("Bloque P19 – Digitalización interna")
+    ax_p34 = fig.add_subplot(grilla[1, 1])
+    fig_comparacion(
+        t["indice_digitalizacion"],
+        t["media_indice_digitalizacion"],
+        P34_COLOR,
+        "Índice de digitalización (suma P34.x)",
+        ax=ax_p34,
+    )
+    ax_p34.set_title("Bloque P34 – Servicios digitales")
+    for ax in (ax_p19, ax_p34):
+        ax.tick_params(axis="x", labelsize=8)
+
+    ax_det = fig.add_subplot(grilla[2, :])
+    etiquetas, valores = t["detalle"]
+    if etiquetas:
+        fig_detalle_p34(
+            etiquetas[:MAX_ITEMS_DETALLE], valores[:MAX_ITEMS_DETALLE], ax=ax_det
+        )
+        ax_det.set_title("Sistemas por área municipal (P34.x) activos")
+    else:
+        ax_det.axis("off")
+        ax_det.text(0.5, 0.5, "La comuna no declara sistemas activos en P34.x.", ha="center")
+    return fig
+
+
+def _pagina_region(t):
+    fig, (ax_p19, ax_p34) = pyplot().subplots(2, 1, figsize=TAMANO_PAGINA)
+    fig.suptitle(f"{t['region']} – {t['n']} municipios", fontsize=15, weight="bold")
+    for ax, col, color, xlabel in (
+        (ax_p19, "P19_promedio", P19_COLOR, "P19 promedio (0 a 1)"),
+        (ax_p34, "indice_digitalizacion", P34_COLOR, "Índice de digitalización (suma P34.x)"),
+    ):
+        nombres, valores = t["tops"][col]
+        etiquetas = [n.replace("MUNICIPALIDAD DE ", "") for n in nombres]
+        fig_barras_municipios(etiquetas, valores, color, xlabel, ax=ax)
+    return fig
+
+
+def _renderizar_lote(tareas, salida, formato):
+    """Dibuja y escribe un lote de páginas; devuelve ``(archivo, bytes, segundos)``."""
+    resultados = []
+    for t in tareas:
+        t0 = time.perf_counter()
+        fig = _pagina_comuna(t) if t["tipo"] == "comuna" else _pagina_region(t)
+        datos = serializar(fig, formato)
+        ruta = Path(salida) / t["archivo"]
+        ruta.parent.mkdir(parents=True, exist_ok=True)
+        ruta.write_bytes(datos)
+        resultados.append((t["archivo"], len(datos), time.perf_counter() - t0))
+    return resultados
+
+
+# ----------------- INFORME -----------------
+def escribir_informe(tareas, salida, version=""):
+    """``fichas.csv`` y ``index.html`` con todas las comunas y sus archivos."""
+    comunas = pd.DataFrame([t for t in tareas if t["tipo"] == "comuna"])
+    if comunas.empty:
+        return
+    comunas = comunas[
+        [
+            "region",
+            "comuna",
+            "nivel",
+            "P19_promedio",
+            "media_P19_promedio",
+            "indice_digitalizacion",
+            "media_indice_digitalizacion",
+            "archivo",
+        ]
+    ]
+    comunas.to_csv(Path(salida) / "fichas.csv", index=False, encoding="utf-8")
+
+    paginas_region = {t["region"]: t["archivo"] for t in tareas if t["tipo"] == "region"}
+    filas = []
+    for region, grupo in comunas.groupby("region", sort=False):
+        enlace = html.escape(paginas_region.get(region, ""))
+        filas.append(
+            f'<tr class="region"><th colspan="6"><a href="{enlace}">'
+            f"{html.escape(region)}</a> ({len(grupo)} comunas)</th></tr>"
+        )
+        for c in grupo.itertuples():
+            filas.append(
+                "<tr>"
+                f'<td><a href="{html.escape(c.archivo)}">{html.escape(c.comuna)}</a></td>'
+                f"<td>{html.escape(c.nivel)}</td>"
+                f"<td>{c.P19_promedio:.2f}</td><td>{c.media_P19_promedio:.2f}</td>"
+                f"<td>{c.indice_digitalizacion}</td><td>{c.media_indice_digitalizacion:.1f}</td>"
+                "</tr>"
+            )
+    documento = f"""<!DOCTYPE html>
+<html lang="es"><head><meta charset="utf-8">
+<title>Fichas comunales – Monitor de Digitalización Municipal</title>
+<style>
+body {{ font-family: sans-serif; margin: 2rem; color: #111827; }}
+table {{ border-collapse: collapse; }}
+td, th {{ padding: 0.25rem 0.75rem; border-bottom: 1px solid #e5e7eb; text-align: left; }}
+tr.region th {{ background: #eff6ff; padding-top: 0.75rem; }}
+</style></head><body>
+<h1>Fichas comunales</h1>
+<p>{len(comunas)} comunas · versión de datos {html.escape(version)} ·
+generado {time.strftime("%Y-%m-%d %H:%M")}</p>
+<table>
+<tr><th>Comuna</th><th>Nivel de madurez</th><th>P19 promedio</th><th>Promedio regional</th>
+<th>Índice P34</th><th>Promedio regional</th></tr>
+{chr(10).join(filas)}
+</table></body></html>
+"""
+    (Path(salida) / "index.html").write_text(documento, encoding="utf-8")
+
+
+# ----------------- EXPORTACIÓN -----------------
+def exportar(dataset, salida, formato="pdf", procesos=None, regiones=None):
+    """Genera todas las páginas y el informe; devuelve un resumen de la corrida."""
+    t0 = time.perf_counter()
+    procesos = procesos or os.cpu_count() or 1
+    tareas = tareas_exportacion(dataset, formato, regiones)
+    Path(salida).mkdir(parents=True, exist_ok=True)
+
+    # Lotes: unas cuatro tandas por proceso, para repartir bien sin pagar un envío por ficha.
+    tamano = max(1, math.ceil(len(tareas) / (procesos * 4)))
+    lotes = [tareas[i : i + tamano] for i in range(0, len(tareas), tamano)]
+
+    resultados = []
+    if procesos == 1:
+        for lote in lotes:
+            resultados += _renderizar_lote(lote, salida, formato)
+    else:
+        with ProcessPoolExecutor(max_workers=procesos) as pool:
+            futuros = [pool.submit(_renderizar_lote, lote, salida, formato) for lote in lotes]
+            for i, futuro in enumerate(futuros, 1):
+                resultados += futuro.result()
+                log.info("lote %d/%d listo (%d páginas)", i, len(lotes), len(resultados))
+
+    escribir_informe(tareas, salida, dataset.version)
+    return {
+        "paginas": len(resultados),
+        "comunas": sum(t["tipo"] == "comuna" for t in tareas),
+        "bytes": sum(r[1] for r in resultados),
+        "segundos": time.perf_counter() - t0,
+        "segundos_render": sum(r[2] for r in resultados),
+        "procesos": procesos,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--salida", default="fichas", help="directorio de salida")
+    parser.add_argument("--formato", choices=["pdf", "png"], default="pdf")
+    parser.add_argument("--procesos", type=int, default=None, help="por defecto, uno por núcleo")
+    parser.add_argument(
+        "--region", action="append", help="limitar a estas regiones (se puede repetir)"
+    )
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    from datos import cargar_dataset
+
+    dataset = cargar_dataset()
+    if dataset.df.empty:
+        print("No fue posible cargar los datos.", file=sys.stderr)
+        return 1
+
+    res = exportar(dataset, args.salida, args.formato, args.procesos, args.region)
+    print(
+        f"{res['comunas']} fichas ({res['paginas']} páginas, {res['bytes'] / 1e6:.1f} MB) "
+        f"en {res['segundos']:.1f} s con {res['procesos']} procesos -> {args.salida}"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,170 @@
+"""Obtención concurrente de las fuentes externas (CSV de la encuesta y API DPA).
+
+Las descargas corren en paralelo sobre una única ``requests.Session`` con pool
+de conexiones y comparten un solo presupuesto de tiempo: el arranque en frío
+cuesta lo que la fuente más lenta, no la suma. La API DPA es opcional
+(``MONITOR_DPA_API=1``); por defecto la geografía sale de la tabla incluida.
+
+``requests`` se importa recién al crear la sesión: un arranque que se sirve
+del dataset serializado no lo necesita hasta el primer refresco.
+"""
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import pandas as pd
+
+from almacen import obtener_encuesta
+
+log = logging.getLogger(__name__)
+
+URL_CSV = os.environ.get(
+    "MONITOR_URL_CSV",
+    "https://datos.gob.cl/datastore/dump/a6e3cfd1-08d7-4221-abb8-ee6d766a4820?bom=True",
+)
+URL_DPA = os.environ.get("MONITOR_URL_DPA", "https://apis.digital.gob.cl/dpa")
+# Segundos totales para todas las descargas de una carga.
+PRESUPUESTO_CARGA = float(os.environ.get("MONITOR_PRESUPUESTO_CARGA", 30))
+# Refrescar la geografía desde la API DPA en cada carga (si no, sólo tabla local).
+USAR_API_DPA = os.environ.get("MONITOR_DPA_API", "0") == "1"
+
+ENDPOINTS_DPA = ("comunas", "provincias", "regiones")
+
+
+def crear_sesion(max_conexiones=8):
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    sesion = requests.Session()
+    adaptador = HTTPAdapter(pool_connections=max_conexiones, pool_maxsize=max_conexiones)
+    sesion.mount("https://", adaptador)
+    sesion.mount("http://", adaptador)
+    return sesion
+
+
+def get_api(endpoint, timeout=5, session=None, url_base=None):
+    """Consulta un endpoint DPA; devuelve ``(DataFrame, bytes)`` (vacío si falla)."""
+    if session is None:
+        import requests
+
+        session = requests
+    try:
+        r = session.get(
+            f"{url_base or URL_DPA}/{endpoint}",
+            headers={"User-Agent": "Mozilla"},
+            timeout=timeout,
+        )
+        if r.status_code == 200:
+            return pd.DataFrame(r.json()), len(r.content)
+        return pd.DataFrame(), len(r.content)
+    except Exception:
+        return pd.DataFrame(), 0
+
+
+def _medir(fuente, funcion):
+    """Ejecuta ``funcion`` y devuelve ``(resultado, error, fila_de_tiempos)``."""
+    t0 = time.perf_counter()
+    resultado, error = None, None
+    try:
+        resultado = funcion()
+    except Exception as exc:
+        error = exc
+    return resultado, error, {"fuente": fuente, "segundos": time.perf_counter() - t0}
+
+
+def _cerrar_al_terminar(sesion, futuros):
+    """Cierra ``sesion`` cuando termina (o se cancela) el último de ``futuros``.
+
+    Una descarga fuera de plazo sigue corriendo tras ``shutdown(wait=False)``;
+    cerrar la sesión antes le cortaría el pool de conexiones en medio.
+    """
+    pendientes = [len(futuros)]
+    lock = threading.Lock()
+
+    def liberar(_):
+        with lock:
+            pendientes[0] -= 1
+            ultimo = pendientes[0] == 0
+        if ultimo:
+            sesion.close()
+
+    for futuro in futuros:
+        futuro.add_done_callback(liberar)
+
+
+def obtener_fuentes(
+    url_csv=None,
+    url_dpa=None,
+    presupuesto=None,
+    directorio=None,
+    incluir_dpa=None,
+    frescura=None,
+):
+    """Descarga en paralelo la encuesta y, si corresponde, las tres tablas DPA.
+
+    Devuelve ``(df_encuesta, meta_csv, dpa, tiempos)`` donde ``dpa`` es un dict
+    endpoint -> DataFrame (vacío si no se consultó la API) y ``tiempos`` una
+    lista con el desglose por fuente (segundos, bytes, estado). Si la encuesta
+    no se pudo obtener, ``df_encuesta`` es None; una tabla DPA fallida o fuera
+    de plazo queda como DataFrame vacío. ``frescura`` se pasa a
+    ``obtener_encuesta`` (0 fuerza la revalidación, ``inf`` usa el snapshot).
+    """
+    presupuesto = PRESUPUESTO_CARGA if presupuesto is None else presupuesto
+    incluir_dpa = USAR_API_DPA if incluir_dpa is None else incluir_dpa
+    limite = time.monotonic() + presupuesto
+    sesion = crear_sesion()
+
+    def restante():
+        return max(limite - time.monotonic(), 0.1)
+
+    tareas = {
+        "encuesta": lambda: obtener_encuesta(
+            url_csv or URL_CSV,
+            timeout=restante(),
+            directorio=directorio,
+            frescura=frescura,
+            session=sesion,
+        )
+    }
+    for endpoint in ENDPOINTS_DPA if incluir_dpa else ():
+        tareas[f"dpa/{endpoint}"] = (
+            lambda e=endpoint: get_api(e, timeout=restante(), session=sesion, url_base=url_dpa)
+        )
+
+    pool = ThreadPoolExecutor(max_workers=len(tareas), thread_name_prefix="fuentes")
+    futuros = {pool.submit(_medir, fuente, f): fuente for fuente, f in tareas.items()}
+    _cerrar_al_terminar(sesion, futuros)
+    wait(futuros, timeout=restante())
+    pool.shutdown(wait=False, cancel_futures=True)
+
+    df_encuesta, meta_csv, tiempos = None, {}, []
+    dpa = {endpoint: pd.DataFrame() for endpoint in ENDPOINTS_DPA}
+    for futuro, fuente in futuros.items():
+        if not futuro.done():
+            tiempos.append(
+                {"fuente": fuente, "segundos": presupuesto, "bytes": 0, "estado": "plazo agotado"}
+            )
+            continue
+
+        resultado, error, fila = futuro.result()
+        if fuente == "encuesta":
+            if error is None:
+                df_encuesta, meta_csv = resultado
+                fila.update(bytes=meta_csv.get("bytes", 0), estado=meta_csv.get("origen", "ok"))
+            else:
+                fila.update(bytes=0, estado=f"error: {error}")
+        else:
+            tabla, n_bytes = resultado
+            dpa[fuente[4:]] = tabla
+            fila.update(bytes=n_bytes, estado="ok" if not tabla.empty else "sin datos")
+        tiempos.append(fila)
+
+    tiempos.sort(key=lambda f: f["fuente"])
+    for fila in tiempos:
+        log.info(
+            "fuente=%s segundos=%.3f bytes=%d estado=%s",
+            fila["fuente"], fila["segundos"], fila["bytes"], fila["estado"],
+        )
+    return df_encuesta, meta_csv, dpa, tiempos
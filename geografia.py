@@ -0,0 +1,194 @@
+"""Índice geográfico comuna → provincia → región y normalización de claves.
+
+La fuente principal es la tabla DPA versionada que viaja con la app
+(``recursos/dpa_<VERSION_DPA>.csv``); la API de apis.digital.gob.cl sólo se
+usa como refresco opcional (``MONITOR_DPA_API=1`` o ``python geografia.py``).
+
+Las claves de la encuesta se cruzan con el DPA primero por igualdad exacta y,
+las que no calzan, con un índice de trigramas y distancia de edición (ver
+``emparejamiento``). Cada clave queda con su confianza; las que no superan
+``UMBRAL_CONFIANZA`` o empatan entre regiones distintas quedan "Desconocida".
+"""
+import os
+import sys
+from functools import lru_cache
+from pathlib import Path
+
+import pandas as pd
+
+from emparejamiento import IndiceTrigramas
+
+VERSION_DPA = "2018"
+RUTA_DPA = Path(__file__).resolve().parent / "recursos" / f"dpa_{VERSION_DPA}.csv"
+
+COLUMNAS_INDICE = [
+    "codigo_comuna",
+    "nombre_comuna",
+    "codigo_provincia",
+    "nombre_provincia",
+    "codigo_region",
+    "region_nombre",
+]
+
+# Confianza mínima (1 - distancia / largo) para aceptar un emparejamiento aproximado.
+UMBRAL_CONFIANZA = float(os.environ.get("MONITOR_UMBRAL_COMUNA", 0.75))
+
+_PREFIJOS = r"ILUSTRE MUNICIPALIDAD DE |MUNICIPALIDAD DE |MUNICIPALIDAD "
+_MEMO_CLAVES: dict[str, str] = {}
+_INDICES_DIFUSOS: dict[tuple, IndiceTrigramas] = {}
+
+
+# ----------------- NORMALIZACIÓN DE CLAVES -----------------
+def normalizar_claves(nombres: pd.Series) -> pd.Series:
+    """Clave de comuna sin acentos, prefijos ni separadores ("Ñuñoa" -> "NUNOA").
+
+    El pipeline de texto se aplica una sola vez por valor distinto y el
+    resultado queda en una tabla de memo, así la columna completa se resuelve
+    con un ``map``.
+    """
+    nombres = nombres.fillna("nan").astype(str)
+    nuevos = [n for n in pd.unique(nombres) if n not in _MEMO_CLAVES]
+    if nuevos:
+        _MEMO_CLAVES.update(zip(nuevos, _normalizar(pd.Series(nuevos, dtype=object))))
+    return nombres.map(_MEMO_CLAVES)
+
+
+def normalizar_clave(texto: str) -> str:
+    """Clave de un texto libre (búsquedas); no pasa por la tabla de memo."""
+    return _normalizar(pd.Series([str(texto)], dtype=object)).iloc[0]
+
+
+def _normalizar(nombres: pd.Series) -> pd.Series:
+    return (
+        nombres.str.normalize("NFKD")
+        .str.replace("[\u0300-\u036f]", "", regex=True)
+        .str.upper()
+        .str.replace(_PREFIJOS, "", regex=True)
+        .str.replace(r"[ \-']", "", regex=True)
+        .str.strip()
+    )
+
+
+# ----------------- ÍNDICE DPA -----------------
+@lru_cache(maxsize=1)
+def cargar_indice_dpa(ruta=RUTA_DPA) -> pd.DataFrame:
+    """Tabla DPA incluida con la app (códigos como texto, con ceros a la izquierda)."""
+    try:
+        return pd.read_csv(ruta, dtype=str, encoding="utf-8")
+    except OSError:
+        return pd.DataFrame(columns=COLUMNAS_INDICE)
+
+
+def indice_desde_api(comunas, provincias, regiones) -> pd.DataFrame:
+    """Arma el índice con las tablas crudas de la API DPA (vacío si falta alguna)."""
+    if comunas.empty or provincias.empty or regiones.empty:
+        return pd.DataFrame(columns=COLUMNAS_INDICE)
+    comunas = comunas.rename(
+        columns={
+            "codigo": "codigo_comuna",
+            "codigo_padre": "codigo_provincia",
+            "nombre": "nombre_comuna",
+        }
+    )
+    provincias = provincias.rename(
+        columns={
+            "codigo": "codigo_provincia",
+            "codigo_padre": "codigo_region",
+            "nombre": "nombre_provincia",
+        }
+    )
+    regiones = regiones.rename(columns={"codigo": "codigo_region", "nombre": "region_nombre"})
+    full_geo = comunas.merge(provincias, on="codigo_provincia").merge(regiones, on="codigo_region")
+    return full_geo[COLUMNAS_INDICE].astype(str).sort_values("codigo_comuna").reset_index(drop=True)
+
+
+def tabla_clave_region(indice: pd.DataFrame) -> pd.Series:
+    """Serie clave DPA de comuna -> nombre de región."""
+    tabla = pd.Series(
+        indice["region_nombre"].to_numpy(),
+        index=normalizar_claves(indice["nombre_comuna"]).to_numpy(),
+    )
+    return tabla[~tabla.index.duplicated()]
+
+
+def _indice_difuso(tabla):
+    firma = tuple(tabla.index)
+    if firma not in _INDICES_DIFUSOS:
+        _INDICES_DIFUSOS.clear()
+        _INDICES_DIFUSOS[firma] = IndiceTrigramas(firma)
+    return _INDICES_DIFUSOS[firma]
+
+
+def emparejar_claves(claves, indice: pd.DataFrame, umbral=None) -> pd.DataFrame:
+    """Emparejamiento de cada clave distinta con el DPA.
+
+    Índice: la clave. Columnas ``clave_dpa`` (mejor candidato), ``region_nombre``,
+    ``confianza`` y ``metodo`` ("exacto", "aproximado", "ambiguo" o "sin-resolver").
+    """
+    umbral = UMBRAL_CONFIANZA if umbral is None else umbral
+    tabla = tabla_clave_region(indice)
+    unicas = pd.Index(pd.unique(pd.Series(claves, dtype=object)))
+
+    exactas = unicas.isin(tabla.index)
+    res = pd.DataFrame(
+        {
+            "clave_dpa": unicas.where(exactas, None),
+            "region_nombre": unicas.map(tabla).where(exactas, None),
+            "confianza": exactas.astype(float),
+            "metodo": pd.Series(exactas, dtype=bool).map({True: "exacto", False: "sin-resolver"}).to_numpy(),
+        },
+        index=unicas,
+    )
+
+    if (~exactas).any():
+        difuso = _indice_difuso(tabla)
+        for clave in unicas[~exactas]:
+            candidatos, conf = difuso.buscar(clave)
+            if not candidatos:
+                continue
+            regiones = set(tabla[candidatos])
+            metodo = "sin-resolver"
+            if conf >= umbral:
+                metodo = "aproximado" if len(regiones) == 1 else "ambiguo"
+            res.loc[clave] = [
+                candidatos[0],
+                regiones.pop() if metodo == "aproximado" else None,
+                conf,
+                metodo,
+            ]
+    return res
+
+
+def asignar_regiones(claves: pd.Series, indice: pd.DataFrame):
+    """``(regiones, confianza, emparejamiento)`` alineadas con ``claves``.
+
+    Las claves sin región quedan "Desconocida" ("Sin clasificar" si no hay DPA).
+    """
+    if indice.empty:
+        return (
+            pd.Series("Sin clasificar", index=claves.index),
+            pd.Series(0.0, index=claves.index),
+            pd.DataFrame(columns=["clave_dpa", "region_nombre", "confianza", "metodo"]),
+        )
+    emparejamiento = emparejar_claves(claves, indice)
+    regiones = claves.map(emparejamiento["region_nombre"]).fillna("Desconocida")
+    confianza = claves.map(emparejamiento["confianza"]).astype("float32")
+    return regiones, confianza, emparejamiento
+
+
+# ----------------- REFRESCO DESDE LA API -----------------
+def actualizar_indice_dpa(ruta=RUTA_DPA):
+    """Descarga el DPA vigente y reescribe la tabla incluida con la app."""
+    from fuentes import ENDPOINTS_DPA, get_api
+
+    tablas = [get_api(endpoint, timeout=15)[0] for endpoint in ENDPOINTS_DPA]
+    indice = indice_desde_api(*tablas)
+    if indice.empty:
+        raise RuntimeError("La API DPA no respondió con las tres tablas.")
+    indice.to_csv(ruta, index=False, encoding="utf-8", lineterminator="\r\n")
+    return indice
+
+
+if __name__ == "__main__":
+    destino = Path(sys.argv[1]) if len(sys.argv) > 1 else RUTA_DPA
+    print(f"{len(actualizar_indice_dpa(destino))} comunas escritas en {destino}")
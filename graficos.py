@@ -0,0 +1,188 @@
+"""Gráficos matplotlib del monitor y caché de figuras ya rasterizadas.
+
+Las funciones ``fig_*`` sólo construyen la figura (no dependen de Streamlit);
+las que reciben ``ax`` dibujan sobre ese eje, para componer páginas como las
+fichas comunales de ``fichas.py``.
+``CacheRender`` guarda los bytes PNG/SVG por clave (tipo de gráfico, filtros,
+versión de datos) con desalojo LRU y un tope de memoria; cada figura se cierra
+apenas se serializa, así el registro de pyplot no crece con el proceso.
+
+matplotlib se importa con la primera figura (``pyplot()``), no al importar
+este módulo: la app arranca sin pagarlo y con ``MONITOR_GRAFICOS=vega`` no lo
+carga nunca.
+"""
+import os
+from io import BytesIO
+
+from cache import CacheBytes
+from colores import COLORES_NIVEL, GRIS, NO_COLOR, P19_COLOR, P34_COLOR  # noqa: F401
+from metricas import medir
+
+# Estilo matplotlib
+ESTILO = {
+    "figure.facecolor": "#ffffff",
+    "axes.facecolor": "#f9fafb",
+    "axes.edgecolor": "#e5e7eb",
+    "axes.grid": True,
+    "grid.color": "#e5e7eb",
+    "grid.linestyle": "--",
+    "grid.alpha": 0.6,
+    "axes.titlesize": 11,
+    "axes.labelsize": 10,
+    "xtick.labelsize": 9,
+    "ytick.labelsize": 9,
+}
+
+_PYPLOT = []
+
+
+def pyplot():
+    """``matplotlib.pyplot`` con backend Agg y ``ESTILO``, importado la primera vez."""
+    if not _PYPLOT:
+        with medir("arranque", "import_matplotlib"):
+            import matplotlib
+
+            matplotlib.use("Agg")
+            import matplotlib.pyplot as plt
+
+            plt.rcParams.update(ESTILO)
+        _PYPLOT.append(plt)
+    return _PYPLOT[0]
+
+
+# ----------------- CACHÉ DE RENDER -----------------
+class CacheRender(CacheBytes):
+    """LRU de figuras serializadas, acotado por bytes totales."""
+
+    def __init__(self, max_bytes):
+        super().__init__(max_bytes, "grafico")
+
+    def obtener(self, clave, construir, formato="png"):
+        """Devuelve los bytes de la figura; sólo llama a ``construir()`` si no está."""
+        return super().obtener(
+            tuple(clave) + (formato,), lambda: serializar(construir(), formato)
+        )
+
+
+def serializar(fig, formato="png"):
+    """Rasteriza (o exporta a SVG) la figura y la cierra."""
+    buf = BytesIO()
+    try:
+        fig.savefig(buf, format=formato, dpi=200, bbox_inches="tight")
+    finally:
+        pyplot().close(fig)
+    return buf.getvalue()
+
+
+CACHE_RENDER = CacheRender(int(float(os.environ.get("MONITOR_CACHE_RENDER_MB", 64)) * 1024 * 1024))
+
+
+# ----------------- FIGURAS -----------------
+def _lienzo(ax, figsize=None):
+    """Figura y eje nuevos, o la figura del ``ax`` recibido."""
+    if ax is not None:
+        return ax.figure, ax
+    return pyplot().subplots(figsize=figsize)
+
+
+def fig_barras_municipios(etiquetas, valores, color, xlabel, ax=None):
+    fig, ax = _lienzo(ax, (8, 6))
+    ax.barh(etiquetas, valores, color=color)
+    ax.set_xlabel(xlabel)
+    ax.set_ylabel("Municipio")
+    ax.invert_yaxis()
+    return fig
+
+
+def fig_torta(si, no, label_si, label_no):
+    fig, ax = pyplot().subplots(figsize=(3.6, 3.6))
+    ax.pie(
+        [si, no],
+        labels=[label_si, label_no],
+        autopct="%1.0f%%",
+        colors=[P19_COLOR, NO_COLOR],
+        textprops={"fontsize": 8},
+    )
+    ax.axis("equal")
+    return fig
+
+
+def fig_niveles(madurez_counts):
+    fig, ax = pyplot().subplots()
+    ax.bar(
+        madurez_counts.index,
+        madurez_counts.values,
+        color=[P19_COLOR, "#f97316", "#94a3b8"],
+    )
+    ax.set_ylabel("Cantidad de municipios")
+    return fig
+
+
+def fig_promedios_region(intervalos, color, xlabel):
+    """``intervalos``: por región, ``media``, ``inferior`` y ``superior`` (ver ``agregados``)."""
+    fig, ax = pyplot().subplots(figsize=(10, 6))
+    errores = [
+        intervalos["media"] - intervalos["inferior"],
+        intervalos["superior"] - intervalos["media"],
+    ]
+    ax.barh(intervalos.index, intervalos["media"], color=color)
+    ax.errorbar(
+        intervalos["media"],
+        intervalos.index,
+        xerr=errores,
+        fmt="none",
+        ecolor="#374151",
+        elinewidth=1,
+        capsize=3,
+    )
+    ax.set_xlabel(xlabel)
+    ax.set_ylabel("Región")
+    return fig
+
+
+def fig_densidad(densidad):
+    """Un marcador por celda (P19, P34) de ``agregados.construir_densidad``, con área ∝ municipios."""
+    fig, ax = pyplot().subplots(figsize=(7, 5))
+    celdas = densidad.reset_index()
+    escala = 400 / max(int(celdas["n"].max()), 1) if len(celdas) else 1
+    for nivel, sub in celdas.groupby("Nivel_Madurez", observed=True, sort=False):
+        ax.scatter(
+            sub["P19_promedio"],
+            sub["indice_digitalizacion"],
+            s=20 + sub["n"] * escala,
+            label=nivel,
+            alpha=0.7,
+            color=COLORES_NIVEL[nivel],
+            marker="o",
+            edgecolors="black",
+            linewidths=0.5,
+        )
+    ax.set_xlabel("Digitalización interna (P19 promedio)")
+    ax.set_ylabel("Índice de digitalización (P34)")
+    ax.grid(True, linestyle="--", alpha=0.4)
+    leyenda = ax.legend(title="Nivel de madurez")
+    for marcador in leyenda.legend_handles:
+        marcador.set_sizes([40])
+    return fig
+
+
+def fig_comparacion(valor, media_reg, color, ylabel, ax=None):
+    fig, ax = _lienzo(ax)
+    ax.bar(
+        ["Comuna seleccionada", "Promedio regional"],
+        [valor, media_reg],
+        color=[color, GRIS],
+    )
+    ax.set_ylabel(ylabel)
+    ax.grid(axis="y", linestyle="--", alpha=0.4)
+    return fig
+
+
+def fig_detalle_p34(etiquetas, valores, ax=None):
+    fig, ax = _lienzo(ax, (10, 4))
+    ax.bar(etiquetas, valores, color=P34_COLOR)
+    ax.set_xticks(range(len(etiquetas)))
+    ax.set_xticklabels(etiquetas, rotation=90)
+    ax.set_ylabel("Presencia del sistema (1 = presente)")
+    ax.grid(axis="y", linestyle="--", alpha=0.4)
+    return fig
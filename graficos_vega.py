@@ -0,0 +1,210 @@
+"""Los mismos gráficos del monitor como especificaciones Vega-Lite.
+
+En vez de rasterizar en el servidor, cada ``spec_*`` devuelve un dict con los
+datos ya agregados (sólo las columnas que se dibujan) y el navegador hace el
+render. El costo por rerun es armar una lista de pocos cientos de filas, así
+que los gráficos de municipios pueden mostrar todas las comunas en lugar de
+las 20 primeras.
+
+``MONITOR_GRAFICOS`` elige el motor por despliegue: ``matplotlib`` (por
+defecto, imágenes PNG cacheadas) o ``vega``.
+"""
+import os
+
+from colores import COLORES_NIVEL, GRIS, NO_COLOR, P19_COLOR, P34_COLOR
+
+MOTORES = ("matplotlib", "vega")
+MOTOR_GRAFICOS = os.environ.get("MONITOR_GRAFICOS", "matplotlib").lower()
+if MOTOR_GRAFICOS not in MOTORES:
+    raise ValueError(f"MONITOR_GRAFICOS debe ser uno de {', '.join(MOTORES)}")
+
+# Alto de cada barra en los gráficos horizontales (crece con la cantidad de filas).
+ALTO_BARRA = 16
+
+
+def _valores(**columnas):
+    """Filas ``[{col: valor}, ...]`` a partir de columnas del mismo largo."""
+    nombres = list(columnas)
+    return [
+        dict(zip(nombres, fila))
+        for fila in zip(*(_nativos(columnas[n]) for n in nombres))
+    ]
+
+
+def _nativos(valores):
+    return [v.item() if hasattr(v, "item") else v for v in valores]
+
+
+def spec_barras_municipios(etiquetas, valores, color, xlabel):
+    return {
+        "data": {"values": _valores(municipio=etiquetas, valor=valores)},
+        "mark": {"type": "bar", "color": color},
+        "height": max(ALTO_BARRA * len(valores), 120),
+        "encoding": {
+            "y": {"field": "municipio", "type": "nominal", "sort": None, "title": "Municipio"},
+            "x": {"field": "valor", "type": "quantitative", "title": xlabel},
+            "tooltip": [
+                {"field": "municipio", "title": "Municipio"},
+                {"field": "valor", "title": xlabel},
+            ],
+        },
+    }
+
+
+def spec_torta(si, no, label_si, label_no):
+    return {
+        "data": {"values": _valores(categoria=[label_si, label_no], n=[si, no])},
+        "mark": {"type": "arc", "tooltip": True},
+        "encoding": {
+            "theta": {"field": "n", "type": "quantitative", "stack": "normalize"},
+            "color": {
+                "field": "categoria",
+                "type": "nominal",
+                "scale": {"domain": [label_si, label_no], "range": [P19_COLOR, NO_COLOR]},
+                "legend": {"title": None, "orient": "bottom"},
+            },
+        },
+    }
+
+
+def spec_niveles(madurez_counts):
+    # ``domain`` en el orden de la serie: sin él Vega-Lite ordena los niveles
+    # alfabéticamente y los colores no coinciden con ``fig_niveles``.
+    niveles = [str(n) for n in madurez_counts.index]
+    return {
+        "data": {
+            "values": _valores(nivel=madurez_counts.index, municipios=madurez_counts.values)
+        },
+        "mark": {"type": "bar", "tooltip": True},
+        "encoding": {
+            "x": {"field": "nivel", "type": "nominal", "sort": None, "title": None},
+            "y": {"field": "municipios", "type": "quantitative", "title": "Cantidad de municipios"},
+            "color": {
+                "field": "nivel",
+                "type": "nominal",
+                "scale": {"domain": niveles, "range": [P19_COLOR, "#f97316", "#94a3b8"]},
+                "legend": None,
+            },
+        },
+    }
+
+
+def spec_promedios_region(intervalos, color, xlabel):
+    """``intervalos``: por región, ``n``, ``media``, ``inferior`` y ``superior``."""
+    region = {
+        "field": "region",
+        "type": "nominal",
+        "sort": {"field": "media", "order": "descending"},
+        "title": "Región",
+    }
+    return {
+        "data": {
+            "values": _valores(
+                region=intervalos.index,
+                n=intervalos["n"],
+                media=intervalos["media"].round(4),
+                inferior=intervalos["inferior"].round(4),
+                superior=intervalos["superior"].round(4),
+            )
+        },
+        "height": max(ALTO_BARRA * len(intervalos), 120),
+        "layer": [
+            {
+                "mark": {"type": "bar", "color": color},
+                "encoding": {
+                    "y": region,
+                    "x": {"field": "media", "type": "quantitative", "title": xlabel},
+                    "tooltip": [
+                        {"field": "region"},
+                        {"field": "n", "title": "Municipios"},
+                        {"field": "media"},
+                        {"field": "inferior", "title": "IC 95 % inferior"},
+                        {"field": "superior", "title": "IC 95 % superior"},
+                    ],
+                },
+            },
+            {
+                "mark": {"type": "errorbar", "color": "#374151", "ticks": True},
+                "encoding": {
+                    "y": region,
+                    "x": {"field": "inferior", "type": "quantitative"},
+                    "x2": {"field": "superior"},
+                },
+            },
+        ],
+    }
+
+
+def spec_densidad(densidad):
+    """Un círculo por celda (P19, P34) de ``agregados.construir_densidad``, con área ∝ municipios."""
+    celdas = densidad.reset_index()
+    niveles = [str(n) for n in celdas["Nivel_Madurez"].unique()]
+    return {
+        "data": {
+            "values": _valores(
+                nivel=celdas["Nivel_Madurez"].astype(str),
+                P19=celdas["P19_promedio"].round(4),
+                P34=celdas["indice_digitalizacion"],
+                municipios=celdas["n"],
+            )
+        },
+        "mark": {"type": "circle", "opacity": 0.7, "stroke": "black", "strokeWidth": 0.5},
+        "encoding": {
+            "x": {"field": "P19", "type": "quantitative", "title": "Digitalización interna (P19 promedio)"},
+            "y": {"field": "P34", "type": "quantitative", "title": "Índice de digitalización (P34)"},
+            "color": {
+                "field": "nivel",
+                "type": "nominal",
+                "scale": {"domain": niveles, "range": [COLORES_NIVEL[n] for n in niveles]},
+                "legend": {"title": "Nivel de madurez"},
+            },
+            "size": {
+                "field": "municipios",
+                "type": "quantitative",
+                "scale": {"range": [20, 420]},
+                "legend": {"title": "Municipios"},
+            },
+            "tooltip": [
+                {"field": "nivel"},
+                {"field": "P19"},
+                {"field": "P34"},
+                {"field": "municipios"},
+            ],
+        },
+    }
+
+
+def spec_comparacion(valor, media_reg, color, ylabel):
+    return {
+        "data": {
+            "values": _valores(
+                serie=["Comuna seleccionada", "Promedio regional"], valor=[valor, media_reg]
+            )
+        },
+        "mark": {"type": "bar", "tooltip": True},
+        "encoding": {
+            "x": {"field": "serie", "type": "nominal", "sort": None, "title": None},
+            "y": {"field": "valor", "type": "quantitative", "title": ylabel},
+            "color": {
+                "field": "serie",
+                "type": "nominal",
+                "scale": {"range": [color, GRIS]},
+                "legend": None,
+            },
+        },
+    }
+
+
+def spec_detalle_p34(etiquetas, valores):
+    return {
+        "data": {"values": _valores(item=etiquetas, valor=valores)},
+        "mark": {"type": "bar", "color": P34_COLOR, "tooltip": True},
+        "encoding": {
+            "x": {"field": "item", "type": "nominal", "sort": None, "title": None},
+            "y": {
+                "field": "valor",
+                "type": "quantitative",
+                "title": "Presencia del sistema (1 = presente)",
+            },
+        },
+    }
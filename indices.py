@@ -0,0 +1,368 @@
+"""Índice por región y órdenes precalculados sobre el DataFrame del dataset.
+
+Al cargar, las filas se ordenan por región (y dentro de cada región por índice
+P34 descendente), así cada región es un tramo contiguo y ``particion`` devuelve
+un slice sin copiar. Los órdenes por ``indice_digitalizacion``, ``P19_promedio``
+y nombre se guardan como arreglos de posiciones, nacionales y por región, de
+modo que un top-k o un ranking es un ``iloc`` de k posiciones.
+
+Para los órdenes numéricos también se precalculan los puestos con empates
+(denso y de competencia), el percentil y la posición inversa de cada fila en
+el ranking; con eso ``pagina_ranking`` arma una página (o filtra por prefijo
+del nombre usando el arreglo ordenado de claves) tocando sólo las filas que
+devuelve.
+
+En un refresco incremental ``empalmar`` saca las filas que cambiaron e
+intercala las nuevas por búsqueda binaria, parchando órdenes, puestos y claves
+en lugar de reordenar y volver a construir el índice.
+"""
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+
+from geografia import normalizar_clave, normalizar_claves
+
+# columna -> ascendente
+ORDENES = {
+    "indice_digitalizacion": False,
+    "P19_promedio": False,
+    "MUNICIPALIDAD": True,
+}
+
+
+@dataclass
+class Rangos:
+    """Puestos alineados con ``ordenes[(col, región)]`` más la posición inversa."""
+
+    denso: np.ndarray        # 1, 2, 2, 3: los empates comparten puesto sin saltos
+    competicion: np.ndarray  # 1, 2, 2, 4: los empates comparten puesto con saltos
+    percentil: np.ndarray    # % de municipios por debajo (empates cuentan la mitad)
+    lugar: np.ndarray        # fila - inicio de la región -> posición en el ranking
+
+    def arreglos(self):
+        return (self.denso, self.competicion, self.percentil, self.lugar)
+
+
+@dataclass
+class IndiceRegiones:
+    limites: dict = field(default_factory=dict)   # región -> (inicio, fin)
+    ordenes: dict = field(default_factory=dict)   # (columna, región | None) -> posiciones
+    rangos: dict = field(default_factory=dict)    # (columna, región | None) -> Rangos
+    claves: np.ndarray = None                     # claves de comuna ordenadas
+    filas_claves: np.ndarray = None               # fila de cada clave de ``claves``
+
+    @property
+    def regiones(self):
+        return list(self.limites)
+
+    def arreglos(self):
+        """Todos los arreglos numpy del índice (para congelar o medir memoria)."""
+        arreglos = list(self.ordenes.values())
+        for rangos in self.rangos.values():
+            arreglos += rangos.arreglos()
+        if self.filas_claves is not None:
+            arreglos += [self.claves, self.filas_claves]
+        return arreglos
+
+
+def ordenar_por_region(df):
+    """Reordena las filas por región, índice P34 descendente y nombre.
+
+    Los empates se resuelven por ``hash_fila`` si existe, así el orden no
+    depende de la posición de la fila en el dump (un refresco incremental
+    produce el mismo orden que una carga completa).
+    """
+    claves = (
+        _rango(df["MUNICIPALIDAD"]),
+        -df["indice_digitalizacion"].to_numpy(),
+        _rango(df["region_nombre"]),
+    )
+    if "hash_fila" in df.columns:
+        claves = (df["hash_fila"].to_numpy(),) + claves
+    orden = np.lexsort(claves)
+    return df.iloc[orden].reset_index(drop=True)
+
+
+def _rango(serie):
+    """Códigos enteros que respetan el orden alfabético de ``serie``.
+
+    ``factorize`` ordena sólo los valores distintos, así que ordenar por estos
+    códigos es mucho más barato que comparar los textos fila a fila.
+    """
+    return pd.factorize(serie.astype(str), sort=True)[0]
+
+
+def _orden(valores, nombres, ascendente):
+    """Posiciones ordenadas por ``valores`` (desempate estable por nombre)."""
+    claves = valores if ascendente else -valores
+    return np.lexsort((nombres, claves))
+
+
+def _cortes(ordenados):
+    """Máscara con el primer elemento de cada grupo de iguales."""
+    corte = np.ones(len(ordenados), dtype=bool)
+    corte[1:] = ordenados[1:] != ordenados[:-1]
+    return corte
+
+
+def _rangos(valores, posiciones, inicio):
+    """Puestos de ``valores[posiciones]`` (ya ordenados) e inversa relativa a ``inicio``."""
+    n = len(posiciones)
+    nuevo_grupo = _cortes(valores[posiciones])
+    denso = np.cumsum(nuevo_grupo, dtype=np.int32)
+    inicios = np.flatnonzero(nuevo_grupo)
+    grupo = denso - 1
+    competicion = (inicios[grupo] + 1).astype(np.int32)
+    empatados = np.diff(np.append(inicios, n))[grupo]
+    percentil = (100 * (n - competicion + 1 - empatados / 2) / max(n, 1)).astype(np.float32)
+    lugar = np.empty(n, dtype=np.int32)
+    lugar[posiciones - inicio] = np.arange(n, dtype=np.int32)
+    return Rangos(denso, competicion, percentil, lugar)
+
+
+def construir_indice(df):
+    """Espera ``df`` ya pasado por ``ordenar_por_region``."""
+    regiones = df["region_nombre"].astype(str).to_numpy()
+    nombres = _rango(df["MUNICIPALIDAD"])
+
+    limites = {}
+    if len(regiones):
+        cortes = np.flatnonzero(regiones[1:] != regiones[:-1]) + 1
+        inicios = np.concatenate(([0], cortes))
+        fines = np.concatenate((cortes, [len(regiones)]))
+        limites = {regiones[a]: (int(a), int(b)) for a, b in zip(inicios, fines)}
+
+    ordenes, rangos = {}, {}
+    for col, ascendente in ORDENES.items():
+        if col not in df.columns:
+            continue
+        if col == "MUNICIPALIDAD":
+            valores = nombres
+        else:
+            valores = df[col].to_numpy(dtype=float)
+        ordenes[(col, None)] = _orden(valores, nombres, ascendente)
+        for region, (a, b) in limites.items():
+            ordenes[(col, region)] = a + _orden(valores[a:b], nombres[a:b], ascendente)
+        if col != "MUNICIPALIDAD":
+            rangos[(col, None)] = _rangos(valores, ordenes[(col, None)], 0)
+            for region, (a, b) in limites.items():
+                rangos[(col, region)] = _rangos(valores, ordenes[(col, region)], a)
+
+    if "Comuna_clave" in df.columns:
+        claves = df["Comuna_clave"].astype(str).to_numpy(dtype=str)
+    else:
+        claves = normalizar_claves(df["MUNICIPALIDAD"]).to_numpy(dtype=str)
+    filas_claves = np.argsort(claves, kind="stable")
+    return IndiceRegiones(limites, ordenes, rangos, claves[filas_claves], filas_claves)
+
+
+def _insercion(clave, desempate, clave_nueva, desempate_nuevo):
+    """Dónde insertar cada elemento nuevo en una secuencia ordenada por (clave, desempate).
+
+    La búsqueda binaria por ``clave`` deja, para cada nuevo, el tramo de
+    empatados; dentro de ese tramo se cuentan los de ``desempate`` menor.
+    """
+    desde = np.searchsorted(clave, clave_nueva, side="left")
+    empates = np.searchsorted(clave, clave_nueva, side="right") - desde
+    if not empates.any():
+        return desde
+    cual = np.repeat(np.arange(len(desde)), empates)
+    inicio_tramo = np.cumsum(empates) - empates
+    filas = desde[cual] + np.arange(len(cual)) - inicio_tramo[cual]
+    menores = np.bincount(
+        cual, weights=desempate[filas] < desempate_nuevo[cual], minlength=len(desde)
+    )
+    return desde + menores.astype(desde.dtype)
+
+
+def _intercalar(viejo, lugares, nuevo):
+    """``viejo`` con cada ``nuevo[i]`` insertado antes de ``viejo[lugares[i]]``."""
+    destino = lugares + np.arange(len(nuevo))
+    resultado = np.empty(len(viejo) + len(nuevo), dtype=np.result_type(viejo, nuevo))
+    es_nuevo = np.zeros(len(resultado), dtype=bool)
+    es_nuevo[destino] = True
+    resultado[destino] = nuevo
+    resultado[~es_nuevo] = viejo
+    return resultado
+
+
+def _vigentes(posiciones, orden):
+    """``orden`` (filas de la carga anterior) traducido a filas nuevas, sin las que salieron."""
+    if orden is None:
+        return np.empty(0, dtype=np.intp)
+    filas = posiciones[orden]
+    return filas[filas >= 0]
+
+
+def empalmar(df, indice, quitar, nuevas):
+    """``(df, indice, posiciones)`` sin las filas ``quitar`` y con ``nuevas`` intercaladas.
+
+    ``df`` e ``indice`` son los de una carga anterior; ``nuevas`` trae las
+    mismas columnas. En vez de reordenar todo, cada fila nueva se ubica por
+    búsqueda binaria en el tramo de su región, los órdenes y las claves se
+    parchan igual y los puestos se recalculan sólo en las regiones tocadas
+    (más el nacional). El resultado es el mismo que ``ordenar_por_region`` y
+    ``construir_indice`` sobre el total. ``posiciones`` da la fila nueva de
+    cada fila de ``df`` (-1 si salió).
+    """
+    n = len(df)
+    nuevas = ordenar_por_region(nuevas[df.columns])
+    sigue = np.ones(n, dtype=bool)
+    sigue[quitar] = False
+
+    # Región, índice P34 y nombre en una sola clave entera (los empates, por hash).
+    nombres = _rango(pd.concat([df["MUNICIPALIDAD"], nuevas["MUNICIPALIDAD"]], ignore_index=True))
+    regiones_nuevas = nuevas["region_nombre"].astype(str).to_numpy()
+    regiones = np.array(sorted(set(indice.limites) | set(regiones_nuevas)), dtype=str)
+    region = np.repeat(
+        np.searchsorted(regiones, list(indice.limites)).astype(np.int64),
+        [b - a for a, b in indice.limites.values()],
+    )
+    region_nueva = np.searchsorted(regiones, regiones_nuevas).astype(np.int64)
+
+    def clave_orden(region_, filas, nombres_):
+        p34 = filas["indice_digitalizacion"].to_numpy().astype(np.int64)
+        return (region_ << 48) | ((0x7FFF - p34) << 32) | nombres_
+
+    lugares = _insercion(
+        clave_orden(region, df, nombres[:n])[sigue],
+        df["hash_fila"].to_numpy()[sigue],
+        clave_orden(region_nueva, nuevas, nombres[n:]),
+        nuevas["hash_fila"].to_numpy(),
+    )
+    m = len(nuevas)
+    destino = lugares + np.arange(m)
+    tomar = _intercalar(np.flatnonzero(sigue), lugares, n + np.arange(m))
+    posiciones = np.full(n, -1, dtype=np.intp)
+    posiciones[tomar[tomar < n]] = np.flatnonzero(tomar < n)
+
+    # Ambas partes con las mismas categorías de región, para que concat las conserve.
+    categorias = df["region_nombre"].cat.categories.union(
+        nuevas["region_nombre"].cat.categories
+    )
+    partes = [
+        p
+        if p["region_nombre"].cat.categories.equals(categorias)
+        else p.assign(region_nombre=p["region_nombre"].cat.set_categories(categorias))
+        for p in (df, nuevas)
+    ]
+    df = pd.concat(partes, ignore_index=True).take(tomar).reset_index(drop=True)
+    df["region_nombre"] = df["region_nombre"].cat.remove_unused_categories()
+    nombres = nombres[tomar]
+
+    cuentas = np.bincount(region[sigue], minlength=len(regiones))
+    cuentas += np.bincount(region_nueva, minlength=len(regiones))
+    fines = np.cumsum(cuentas)
+    limites = {
+        str(r): (int(f - c), int(f)) for r, c, f in zip(regiones, cuentas, fines) if c
+    }
+    tocadas = set(regiones[np.concatenate((region[~sigue], region_nueva))])
+    desplazamiento = {
+        r: limites[r][0] - a for r, (a, _) in indice.limites.items() if r in limites
+    }
+
+    ordenes, rangos = {}, {}
+    for col, ascendente in ORDENES.items():
+        if (col, None) not in indice.ordenes:
+            continue
+        if col == "MUNICIPALIDAD":
+            valores = nombres
+            clave = nombres.astype(np.int64)
+        else:
+            valores = df[col].to_numpy(dtype=float)
+            # Puesto de cada valor entre los distintos: los viejos salen del orden
+            # anterior (ya ordenado), así que no hace falta reordenar.
+            ordenados = valores[_vigentes(posiciones, indice.ordenes[(col, None)])]
+            distintos = np.union1d(ordenados[_cortes(ordenados)], valores[destino])
+            puesto = np.searchsorted(distintos, valores).astype(np.int64)
+            if not ascendente:
+                puesto = len(distintos) - 1 - puesto
+            clave = (puesto << 32) | nombres
+        for region_ in [None] + list(limites):
+            anterior = indice.ordenes.get((col, region_))
+            if region_ is not None and region_ not in tocadas and anterior is not None:
+                ordenes[(col, region_)] = anterior + desplazamiento[region_]
+                if col != "MUNICIPALIDAD":
+                    rangos[(col, region_)] = indice.rangos[(col, region_)]
+                continue
+            viejas = _vigentes(posiciones, anterior)
+            agregar = destino if region_ is None else destino[regiones_nuevas == region_]
+            agregar = agregar[np.lexsort((agregar, clave[agregar]))]
+            lugares = _insercion(clave[viejas], viejas, clave[agregar], agregar)
+            ordenes[(col, region_)] = _intercalar(viejas, lugares, agregar)
+            if col != "MUNICIPALIDAD":
+                inicio = 0 if region_ is None else limites[region_][0]
+                rangos[(col, region_)] = _rangos(valores, ordenes[(col, region_)], inicio)
+
+    conserva = sigue[indice.filas_claves]
+    claves = indice.claves[conserva]
+    filas_claves = posiciones[indice.filas_claves[conserva]]
+    if "Comuna_clave" in nuevas.columns:
+        claves_nuevas = nuevas["Comuna_clave"].astype(str).to_numpy(dtype=str)
+    else:
+        claves_nuevas = normalizar_claves(nuevas["MUNICIPALIDAD"]).to_numpy(dtype=str)
+    orden = np.argsort(claves_nuevas, kind="stable")
+    lugares = _insercion(claves, filas_claves, claves_nuevas[orden], destino[orden])
+    claves = _intercalar(claves, lugares, claves_nuevas[orden])
+    filas_claves = _intercalar(filas_claves, lugares, destino[orden])
+    return df, IndiceRegiones(limites, ordenes, rangos, claves, filas_claves), posiciones
+
+
+def particion(df, indice, region=None):
+    """Filas de la región como slice contiguo (todo el DataFrame si ``region`` es None)."""
+    if region is None:
+        return df
+    a, b = indice.limites.get(region, (0, 0))
+    return df.iloc[a:b]
+
+
+def ordenado(df, indice, col, region=None, k=None):
+    """Filas (de la región) ordenadas por ``col``; sólo las primeras ``k`` si se pide."""
+    posiciones = indice.ordenes.get((col, region))
+    if posiciones is None:
+        return df.iloc[0:0]
+    if k is not None:
+        posiciones = posiciones[:k]
+    return df.iloc[posiciones]
+
+
+def buscar_prefijo(indice, texto):
+    """Filas cuya clave de comuna empieza con la clave de ``texto`` (búsqueda binaria)."""
+    prefijo = normalizar_clave(texto)
+    if indice.claves is None or not prefijo:
+        return np.empty(0, dtype=np.intp)
+    desde = np.searchsorted(indice.claves, prefijo, side="left")
+    hasta = np.searchsorted(indice.claves, prefijo + "\uffff", side="left")
+    return indice.filas_claves[desde:hasta]
+
+
+def pagina_ranking(df, indice, col, region=None, desde=0, limite=25, buscar=""):
+    """``(página, total)`` del ranking de ``col`` en la región.
+
+    La página trae las columnas ``puesto`` (competencia), ``puesto_denso`` y
+    ``percentil``. Con ``buscar`` sólo cuentan las comunas cuya clave empieza
+    con ese texto, cada una con su puesto en el ranking completo.
+    """
+    posiciones = indice.ordenes.get((col, region))
+    rangos = indice.rangos.get((col, region))
+    if posiciones is None or rangos is None:
+        return df.iloc[0:0].assign(puesto=[], puesto_denso=[], percentil=[]), 0
+
+    if buscar:
+        inicio, fin = indice.limites.get(region, (0, len(df))) if region else (0, len(df))
+        filas = buscar_prefijo(indice, buscar)
+        filas = filas[(filas >= inicio) & (filas < fin)]
+        lugares = np.sort(rangos.lugar[filas - inicio])
+        total = len(lugares)
+        lugares = lugares[desde : desde + limite]
+    else:
+        total = len(posiciones)
+        lugares = np.arange(min(desde, total), min(desde + limite, total))
+
+    pagina = df.iloc[posiciones[lugares]].assign(
+        puesto=rangos.competicion[lugares],
+        puesto_denso=rangos.denso[lugares],
+        percentil=rangos.percentil[lugares],
+    )
+    return pagina, total
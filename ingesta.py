@@ -0,0 +1,104 @@
+"""Descarga en streaming y lectura proyectada del CSV de la encuesta.
+
+El cuerpo se baja por trozos a un archivo temporal (en memoria mientras es
+chico, en disco si crece), calculando el hash y validando la codificación a
+medida que llegan los bytes. Luego pandas lee desde ese archivo sólo las
+columnas que usa la app, sin materializar nunca el texto completo como ``str``.
+"""
+import codecs
+import hashlib
+import tempfile
+from dataclasses import dataclass
+from typing import Any
+
+import pandas as pd
+
+TAM_TROZO = 1 << 16
+# Hasta este tamaño el archivo temporal se queda en memoria.
+MAX_EN_MEMORIA = 8 * 1024 * 1024
+
+COLUMNAS_FIJAS = {"MUNICIPALIDAD", "P10", "P11", "P12"}
+BLOQUE_P19 = [f"P19.{i}" for i in range(1, 12)]
+_COLUMNAS_EXACTAS = COLUMNAS_FIJAS | set(BLOQUE_P19)
+
+
+def columna_usada(nombre) -> bool:
+    """Columnas que la app necesita: MUNICIPALIDAD, P10–P12, P19.1–P19.11 y P34*."""
+    nombre = str(nombre).strip().lstrip("\ufeff")
+    return nombre in _COLUMNAS_EXACTAS or nombre.startswith("P34")
+
+
+@dataclass
+class Descarga:
+    """Resultado de una descarga: archivo temporal + hash, codificación y cabeceras."""
+
+    status_code: int
+    etag: str | None = None
+    last_modified: str | None = None
+    sha256: str | None = None
+    encoding: str | None = None
+    bytes: int = 0
+    archivo: Any = None
+
+    def cerrar(self):
+        if self.archivo is not None:
+            self.archivo.close()
+            self.archivo = None
+
+
+def descargar_streaming(url, headers=None, timeout=30, session=None):
+    """GET en streaming. Para respuestas 200 deja el cuerpo en ``Descarga.archivo``.
+
+    La codificación se detecta en línea: se intenta UTF-8 (con o sin BOM) con un
+    decodificador incremental y, al primer error, se asume latin1 como el
+    cargador original.
+    """
+    if session is None:
+        import requests
+
+        session = requests
+    with session.get(url, headers=headers or {}, timeout=timeout, stream=True) as r:
+        desc = Descarga(
+            r.status_code, r.headers.get("ETag"), r.headers.get("Last-Modified")
+        )
+        if r.status_code != 200:
+            r.raise_for_status()
+            return desc
+
+        sha = hashlib.sha256()
+        decodificador = codecs.getincrementaldecoder("utf-8")()
+        encoding = "utf-8-sig"
+        archivo = tempfile.SpooledTemporaryFile(max_size=MAX_EN_MEMORIA)
+        try:
+            for trozo in r.iter_content(chunk_size=TAM_TROZO):
+                if not trozo:
+                    continue
+                sha.update(trozo)
+                archivo.write(trozo)
+                desc.bytes += len(trozo)
+                if encoding != "latin1":
+                    try:
+                        decodificador.decode(trozo)
+                    except UnicodeDecodeError:
+                        encoding = "latin1"
+            if encoding != "latin1":
+                try:
+                    decodificador.decode(b"", final=True)
+                except UnicodeDecodeError:
+                    encoding = "latin1"
+        except BaseException:
+            archivo.close()
+            raise
+
+    archivo.seek(0)
+    desc.sha256 = sha.hexdigest()
+    desc.encoding = encoding
+    desc.archivo = archivo
+    return desc
+
+
+def parsear_csv(archivo, encoding="utf-8-sig"):
+    """Lee sólo las columnas usadas por la app desde un archivo binario."""
+    df = pd.read_csv(archivo, encoding=encoding, usecols=columna_usada, low_memory=False)
+    df.columns = [str(c).strip().lstrip("\ufeff") for c in df.columns]
+    return df
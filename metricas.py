@@ -0,0 +1,254 @@
+"""Instrumentación liviana de las rutas calientes (carga, vistas y gráficos).
+
+``medir(tipo, nombre)`` es un context manager que toma el tiempo de pared y
+deja anotar bytes, filas y acierto/fallo de caché en el evento. Cada evento se
+acumula en contadores por (tipo, nombre), se guarda en un buffer circular para
+el panel de depuración y, si está configurado, se escribe como JSON en el log
+``monitor.metricas`` y en un archivo de texto con formato Prometheus.
+
+Variables de entorno:
+
+- ``MONITOR_METRICAS_LOG``: archivo donde escribir un evento JSON por línea.
+- ``MONITOR_METRICAS_PROM``: ruta del archivo Prometheus (se reescribe como
+  máximo cada ``MONITOR_METRICAS_INTERVALO`` segundos, 15 por defecto).
+- ``MONITOR_SESION_VENTANA``: segundos sin actividad tras los que una sesión
+  deja de contarse como activa (600 por defecto).
+- ``MONITOR_DEBUG=1``: muestra el panel en la barra lateral (también ``?debug=1``).
+
+Además de los eventos, ``fijar(nombre, valor)`` guarda indicadores puntuales
+(memoria del proceso, sesiones activas) que se exportan como gauges.
+``arranque(etapa)`` deja una vez por proceso los segundos desde que arrancó el
+proceso hasta cada etapa (importaciones, primer pintado, datos listos).
+"""
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+log = logging.getLogger("monitor.metricas")
+
+RUTA_PROMETHEUS = os.environ.get("MONITOR_METRICAS_PROM")
+INTERVALO_PROMETHEUS = float(os.environ.get("MONITOR_METRICAS_INTERVALO", 15))
+DEBUG = os.environ.get("MONITOR_DEBUG", "0") == "1"
+
+if os.environ.get("MONITOR_METRICAS_LOG") and not log.handlers:
+    _manejador = logging.FileHandler(os.environ["MONITOR_METRICAS_LOG"], encoding="utf-8")
+    _manejador.setFormatter(logging.Formatter("%(message)s"))
+    log.addHandler(_manejador)
+    log.setLevel(logging.INFO)
+    log.propagate = False
+
+
+def _escapar(valor):
+    """Valor de etiqueta Prometheus: escapa barra invertida, comillas y saltos de línea."""
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _etiquetas(fila):
+    return f'tipo="{_escapar(fila["tipo"])}",nombre="{_escapar(fila["nombre"])}"'
+
+
+class Registro:
+    def __init__(self, max_eventos=500):
+        self.eventos = deque(maxlen=max_eventos)
+        self.totales = {}
+        self.gauges = {}
+        self._lock = threading.Lock()
+        self._ultimo_volcado = 0.0
+
+    @contextmanager
+    def medir(self, tipo, nombre, **campos):
+        evento = {"tipo": tipo, "nombre": nombre, **campos}
+        t0 = time.perf_counter()
+        try:
+            yield evento
+        finally:
+            evento["segundos"] = time.perf_counter() - t0
+            self.registrar(evento)
+
+    def registrar(self, evento):
+        evento.setdefault("ts", time.time())
+        clave = (evento["tipo"], evento["nombre"])
+        with self._lock:
+            self.eventos.append(evento)
+            tot = self.totales.get(clave)
+            if tot is None:
+                tot = self.totales[clave] = {
+                    "eventos": 0, "segundos": 0.0, "max_segundos": 0.0,
+                    "bytes": 0, "filas": 0, "hit": 0, "miss": 0,
+                }
+            tot["eventos"] += 1
+            tot["segundos"] += evento.get("segundos", 0.0)
+            tot["max_segundos"] = max(tot["max_segundos"], evento.get("segundos", 0.0))
+            tot["bytes"] += int(evento.get("bytes") or 0)
+            tot["filas"] += int(evento.get("filas") or 0)
+            if evento.get("cache") in ("hit", "miss"):
+                tot[evento["cache"]] += 1
+
+        if log.isEnabledFor(logging.INFO):
+            log.info(json.dumps(evento, ensure_ascii=False, default=str))
+        if RUTA_PROMETHEUS and time.time() - self._ultimo_volcado > INTERVALO_PROMETHEUS:
+            self.volcar_prometheus(RUTA_PROMETHEUS)
+
+    def fijar(self, nombre, valor):
+        with self._lock:
+            self.gauges[nombre] = valor
+
+    def resumen(self):
+        """Filas (tipo, nombre, contadores) ordenadas por tiempo acumulado."""
+        with self._lock:
+            filas = [{"tipo": t, "nombre": n, **tot} for (t, n), tot in self.totales.items()]
+        return sorted(filas, key=lambda f: f["segundos"], reverse=True)
+
+    def recientes(self, n=50):
+        with self._lock:
+            return list(self.eventos)[-n:][::-1]
+
+    def a_prometheus(self):
+        series = [
+            ("monitor_eventos_total", "eventos", "Eventos medidos"),
+            ("monitor_segundos_total", "segundos", "Tiempo de pared acumulado"),
+            ("monitor_segundos_max", "max_segundos", "Evento más lento"),
+            ("monitor_bytes_total", "bytes", "Bytes obtenidos o generados"),
+            ("monitor_filas_total", "filas", "Filas procesadas"),
+        ]
+        filas = self.resumen()
+        lineas = []
+        for metrica, campo, ayuda in series:
+            tipo = "gauge" if campo == "max_segundos" else "counter"
+            lineas += [f"# HELP {metrica} {ayuda}", f"# TYPE {metrica} {tipo}"]
+            for f in filas:
+                lineas.append(f'{metrica}{{{_etiquetas(f)}}} {f[campo]}')
+        lineas += [
+            "# HELP monitor_cache_total Aciertos y fallos de caché",
+            "# TYPE monitor_cache_total counter",
+        ]
+        for f in filas:
+            for resultado in ("hit", "miss"):
+                if f[resultado]:
+                    lineas.append(
+                        f'monitor_cache_total{{{_etiquetas(f)},'
+                        f'resultado="{resultado}"}} {f[resultado]}'
+                    )
+        for nombre, valor in sorted(self.gauges.items()):
+            lineas += [f"# TYPE monitor_{nombre} gauge", f"monitor_{nombre} {valor}"]
+        return "\n".join(lineas) + "\n"
+
+    def volcar_prometheus(self, ruta):
+        self._ultimo_volcado = time.time()
+        tmp = f"{ruta}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as fh:
+                fh.write(self.a_prometheus())
+            os.replace(tmp, ruta)
+        except OSError:
+            log.warning("No se pudo escribir %s", ruta, exc_info=True)
+
+
+# ----------------- MEMORIA Y SESIONES -----------------
+def memoria_rss():
+    """Memoria residente del proceso en bytes (pico si no hay /proc)."""
+    try:
+        with open("/proc/self/statm") as fh:
+            return int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        import resource
+
+        pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return pico if sys.platform == "darwin" else pico * 1024
+
+
+class Sesiones:
+    """Sesiones vistas en los últimos ``ventana`` segundos (por id de sesión)."""
+
+    def __init__(self, ventana=600):
+        self.ventana = ventana
+        self._vistas = {}
+        self._lock = threading.Lock()
+
+    def visto(self, sesion_id):
+        ahora = time.time()
+        with self._lock:
+            self._vistas[sesion_id] = ahora
+            for sid, ts in list(self._vistas.items()):
+                if ahora - ts > self.ventana:
+                    del self._vistas[sid]
+            return len(self._vistas)
+
+    def activas(self):
+        with self._lock:
+            return len(self._vistas)
+
+
+REGISTRO = Registro()
+SESIONES = Sesiones(float(os.environ.get("MONITOR_SESION_VENTANA", 600)))
+medir = REGISTRO.medir
+
+
+_RSS_BASE = []
+
+
+def medir_memoria(bytes_compartidos=0):
+    """Fija los gauges de memoria del proceso y por sesión activa.
+
+    La primera medición (con el dataset ya cargado) queda como base: lo que
+    crece el RSS por sobre ella se reparte entre las sesiones activas. El
+    dataset, que existe una sola vez por proceso, se informa aparte.
+    """
+    rss = memoria_rss()
+    if not _RSS_BASE:
+        _RSS_BASE.append(rss)
+    activas = SESIONES.activas()
+    valores = {
+        "memoria_rss_bytes": rss,
+        "memoria_base_bytes": _RSS_BASE[0],
+        "memoria_dataset_bytes": bytes_compartidos,
+        "sesiones_activas": activas,
+        "memoria_por_sesion_bytes": max(rss - _RSS_BASE[0], 0) // max(activas, 1),
+    }
+    for nombre, valor in valores.items():
+        REGISTRO.fijar(nombre, valor)
+    return valores
+
+
+# ----------------- ARRANQUE -----------------
+def _inicio_proceso():
+    """``time.time()`` en que arrancó el proceso (sin /proc, al importar este módulo)."""
+    try:
+        with open("/proc/self/stat") as fh:
+            # starttime es el campo 22; se cuenta después del nombre entre paréntesis.
+            ticks = int(fh.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as fh:
+            encendido = float(fh.read().split()[0])
+        return time.time() - encendido + ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return time.time()
+
+
+INICIO_PROCESO = _inicio_proceso()
+# etapa -> evento, fuera del buffer circular para que no se pierda.
+ARRANQUE = {}
+_LOCK_ARRANQUE = threading.Lock()
+
+
+def arranque(etapa, **campos):
+    """Registra los segundos desde el inicio del proceso hasta ``etapa``.
+
+    Sólo cuenta la primera vez por proceso: en los reruns siguientes las
+    importaciones ya están hechas y el dataset ya está en memoria.
+    """
+    with _LOCK_ARRANQUE:
+        if etapa in ARRANQUE:
+            return
+        evento = ARRANQUE[etapa] = {
+            "tipo": "arranque",
+            "nombre": etapa,
+            "segundos": time.time() - INICIO_PROCESO,
+            **campos,
+        }
+    REGISTRO.registrar(evento)
+    REGISTRO.fijar(f"arranque_{etapa}_segundos", round(evento["segundos"], 4))
@@ -0,0 +1,116 @@
+"""Refresco del dataset en segundo plano (stale-while-revalidate).
+
+Un hilo revalida las fuentes cada ``MONITOR_REFRESCO_INTERVALO`` segundos
+(900 por defecto), arma el nuevo ``Dataset`` con sus índices y agregados fuera
+del camino de las peticiones y lo publica reemplazando una sola referencia, de
+modo que cada rerun ve la versión anterior completa o la nueva completa. Si el
+refresco falla se sigue sirviendo la versión vigente.
+
+El arranque toma primero el ``Dataset`` serializado por la carga anterior
+(sin rehacer el pipeline); si no hay, procesa el snapshot local sin importar
+su antigüedad. En ambos casos la revalidación queda para el hilo y sólo sin
+snapshot el primer arranque espera la red. Cada versión publicada se vuelve a
+serializar para el próximo arranque.
+"""
+import logging
+import os
+import threading
+import time
+
+from datos import cargar_dataset, guardar_serializado, restaurar_serializado
+from metricas import medir
+
+log = logging.getLogger(__name__)
+
+INTERVALO_REFRESCO = float(os.environ.get("MONITOR_REFRESCO_INTERVALO", 900))
+# Reintento más corto mientras no haya ningún dato que servir.
+INTERVALO_SIN_DATOS = 60
+
+
+class Refresco:
+    def __init__(
+        self,
+        cargar=cargar_dataset,
+        intervalo=None,
+        restaurar=restaurar_serializado,
+        guardar=guardar_serializado,
+    ):
+        self._cargar = cargar
+        self._restaurar = restaurar
+        self._guardar = guardar
+        self.intervalo = INTERVALO_REFRESCO if intervalo is None else intervalo
+        self._actual = None
+        self._lock = threading.Lock()
+        self._despertar = threading.Event()
+        self._hilo = None
+        self.estado = {
+            "ultimo_intento": None,
+            "ultimo_cambio": None,
+            "resultado": None,
+            "error": None,
+            "refrescos": 0,
+            "fallos": 0,
+            "arranque": None,
+        }
+
+    def actual(self):
+        """Dataset vigente (lectura de una referencia: no bloquea)."""
+        return self._actual
+
+    def iniciar(self):
+        """Carga inicial (serializado o snapshot) y arranque del hilo de refresco."""
+        with self._lock:
+            if self._actual is None:
+                self._actual = self._restaurar()
+                origen = "serializado"
+                if self._actual is None:
+                    self._actual = self._cargar(frescura=float("inf"))
+                    self._guardar(self._actual)
+                    origen = "procesado"
+                self.estado.update(arranque=origen, ultimo_cambio=time.time())
+        if self._hilo is None:
+            self._hilo = threading.Thread(target=self._bucle, name="refresco", daemon=True)
+            self._hilo.start()
+        self._despertar.set()
+        return self._actual
+
+    def refrescar(self):
+        """Un ciclo de revalidación; True si se publicó una versión nueva."""
+        with self._lock, medir("refresco", "dataset") as ev:
+            vigente = self._actual
+            self.estado["ultimo_intento"] = time.time()
+            try:
+                nuevo = self._cargar(frescura=0, anterior=vigente)
+            except Exception as exc:
+                log.exception(
+                    "Falló el refresco; se mantiene la versión %s",
+                    vigente.version if vigente is not None else None,
+                )
+                self.estado.update(resultado="error", error=str(exc))
+                self.estado["fallos"] += 1
+                ev["estado"] = "error"
+                return False
+
+            if nuevo is None or nuevo.df.empty:
+                resultado = "sin-cambios" if nuevo is None else "sin-datos"
+                self.estado.update(resultado=resultado, error=None)
+                ev["estado"] = resultado
+                return False
+
+            self._actual = nuevo
+            self._guardar(nuevo)
+            self.estado.update(resultado="actualizado", error=None, ultimo_cambio=time.time())
+            self.estado["refrescos"] += 1
+            ev.update(estado="actualizado", filas=len(nuevo.df))
+            log.info("Dataset actualizado a la versión %s", nuevo.version)
+            return True
+
+    def _bucle(self):
+        while True:
+            sin_datos = self._actual is None or self._actual.df.empty
+            self._despertar.wait(INTERVALO_SIN_DATOS if sin_datos else self.intervalo)
+            self._despertar.clear()
+            try:
+                self.refrescar()
+            except Exception:
+                log.exception("Error inesperado en el hilo de refresco")
@@ -0,0 +1,191 @@
+"""Municipios con perfil de respuestas parecido (P19.x y P34.x).
+
+El perfil de cada municipio son sus máscaras de bits de ambos bloques (ver
+``bloques``), una al lado de la otra. La distancia entre dos perfiles sale de
+XOR/AND/OR y popcount sobre esas pocas palabras:
+
+- ``hamming``: cantidad de ítems en que difieren.
+- ``jaccard``: 1 - ítems presentes en ambos / ítems presentes en alguno
+  (0 si ninguno declara nada).
+
+``vecinos`` calcula por lotes de filas contra todo el dataset, sin armar la
+matriz completa n × n. En un refresco incremental ``parchar_tabla`` reutiliza
+la tabla anterior y sólo recalcula las filas afectadas. Si el dataset no supera ``MONITOR_VECINOS_MAX_FILAS``
+filas (5000 por defecto, 0 lo desactiva) se precalcula al cargar una tabla
+con los ``K_VECINOS`` más cercanos de cada municipio y la consulta es una
+lectura; si no, se calcula sólo la fila pedida.
+"""
+import os
+from dataclasses import dataclass
+
+import numpy as np
+
+from bloques import BITS_PALABRA, mascaras
+
+METRICAS = ("jaccard", "hamming")
+K_VECINOS = 10
+PRECALCULO_MAX_FILAS = int(os.environ.get("MONITOR_VECINOS_MAX_FILAS", 5000))
+# Filas por lote: acota la matriz temporal (lote × n × palabras) del cálculo.
+FILAS_POR_LOTE = 256
+
+
+@dataclass
+class TablaVecinos:
+    """Los ``k`` vecinos de cada fila, por métrica: (posiciones, distancias) de forma (n, k)."""
+
+    k: int
+    por_metrica: dict
+
+    def arreglos(self):
+        return [a for par in self.por_metrica.values() for a in par]
+
+
+def perfiles(df, cols_p19, cols_p34):
+    """Matriz (n, palabras) ``uint64`` con las máscaras de P19 y P34 concatenadas.
+
+    Si entre los dos bloques no pasan de 64 ítems (el caso de la encuesta) van
+    en una sola palabra, P34 a continuación de P19.
+    """
+    bloques = [
+        mascaras(df, bloque, len(cols))
+        for bloque, cols in (("P19", cols_p19), ("P34", cols_p34))
+        if cols
+    ]
+    if not bloques:
+        return np.zeros((len(df), 1), dtype=np.uint64)
+    if len(bloques) == 2 and len(cols_p19) + len(cols_p34) <= BITS_PALABRA:
+        return bloques[0] | (bloques[1] << np.uint64(len(cols_p19)))
+    return np.hstack(bloques)
+
+
+def distancias(perfiles_, consulta, metrica="jaccard"):
+    """Matriz (m, n) de distancias entre las filas ``consulta`` (m, palabras) y todas."""
+    a = consulta[:, None, :]
+    b = perfiles_[None, :, :]
+    if metrica == "hamming":
+        return _popcount(a ^ b).astype(np.float32)
+    if metrica != "jaccard":
+        raise ValueError(f"métrica debe ser una de {', '.join(METRICAS)}")
+    union = _popcount(a | b).astype(np.float32)
+    comun = _popcount(a & b)
+    return np.where(union > 0, 1 - comun / np.maximum(union, 1), np.float32(0))
+
+
+def _popcount(palabras):
+    """Bits encendidos sumando el último eje (sin suma si es una sola palabra)."""
+    cuentas = np.bitwise_count(palabras)
+    return cuentas[..., 0] if cuentas.shape[-1] == 1 else cuentas.sum(axis=-1, dtype=np.int16)
+
+
+def vecinos(perfiles_, filas, k=K_VECINOS, metrica="jaccard"):
+    """``(posiciones, distancias)`` (len(filas), k) de los más cercanos a cada fila.
+
+    La propia fila se excluye; los empates se resuelven por posición.
+    """
+    filas = np.asarray(filas, dtype=np.intp)
+    n = len(perfiles_)
+    k = min(k, max(n - 1, 0))
+    posiciones = np.empty((len(filas), k), dtype=np.int32)
+    valores = np.empty((len(filas), k), dtype=np.float32)
+    if not k:
+        return posiciones, valores
+    for inicio in range(0, len(filas), FILAS_POR_LOTE):
+        lote = filas[inicio : inicio + FILAS_POR_LOTE]
+        d = distancias(perfiles_, perfiles_[lote], metrica)
+        d[np.arange(len(lote)), lote] = np.inf
+        todas = np.broadcast_to(np.arange(n), d.shape)
+        posiciones[inicio : inicio + len(lote)], valores[inicio : inicio + len(lote)] = (
+            _primeros(d, todas, k, n)
+        )
+    return posiciones, valores
+
+
+def _primeros(d, candidatos, k, n):
+    """Los ``k`` candidatos de menor (distancia, posición) de cada fila, ya ordenados."""
+    # Clave única por celda: los bits de un float32 no negativo ordenan igual
+    # que su valor, así distancia * n + posición desempata por posición y
+    # argpartition elige exactamente los k primeros sin ordenar toda la fila;
+    # después se ordenan sólo esos k.
+    clave = np.ascontiguousarray(d, dtype=np.float32).view(np.int32).astype(np.int64)
+    clave = clave * n + candidatos
+    elegidos = np.argpartition(clave, k - 1, axis=1)[:, :k]
+    orden = np.argsort(np.take_along_axis(clave, elegidos, axis=1), axis=1)
+    elegidos = np.take_along_axis(elegidos, orden, axis=1)
+    return (
+        np.take_along_axis(candidatos, elegidos, axis=1),
+        np.take_along_axis(d, elegidos, axis=1),
+    )
+
+
+def construir_tabla(perfiles_, k=K_VECINOS, max_filas=None):
+    """``TablaVecinos`` de todo el dataset, o None si supera ``max_filas``."""
+    max_filas = PRECALCULO_MAX_FILAS if max_filas is None else max_filas
+    if not len(perfiles_) or len(perfiles_) > max_filas:
+        return None
+    todas = np.arange(len(perfiles_))
+    return TablaVecinos(k, {m: vecinos(perfiles_, todas, k, m) for m in METRICAS})
+
+
+def parchar_tabla(tabla, perfiles_, posiciones, max_filas=None):
+    """``tabla`` de una carga anterior llevada a ``perfiles_`` (el dataset actual).
+
+    ``posiciones`` da la fila actual de cada fila anterior (-1 si salió). Las
+    filas nuevas y las que perdieron un vecino se recalculan enteras; al resto
+    le basta comparar sus k vecinos (con la posición traducida) contra las
+    filas nuevas, porque entre las que siguen el orden relativo no cambia.
+    """
+    max_filas = PRECALCULO_MAX_FILAS if max_filas is None else max_filas
+    n = len(perfiles_)
+    k = K_VECINOS if tabla is None else tabla.k
+    columnas = min(k, max(n - 1, 0))
+    if tabla is None or not n or n > max_filas or any(
+        pos.shape[1] != columnas for pos, _ in tabla.por_metrica.values()
+    ):
+        return construir_tabla(perfiles_, k, max_filas)
+
+    sigue = posiciones >= 0
+    filas = posiciones[sigue]
+    es_nueva = np.ones(n, dtype=bool)
+    es_nueva[filas] = False
+    nuevas = np.flatnonzero(es_nueva)
+    por_metrica = {}
+    for metrica, (anteriores, valores) in tabla.por_metrica.items():
+        pos = np.empty((n, columnas), dtype=np.int32)
+        dist = np.empty((n, columnas), dtype=np.float32)
+        anteriores = posiciones[anteriores[sigue]]
+        valores = valores[sigue]
+        enteras = (anteriores < 0).any(axis=1)
+        recalcular = np.concatenate((filas[enteras], nuevas))
+        pos[recalcular], dist[recalcular] = vecinos(perfiles_, recalcular, k, metrica)
+
+        parchar = np.flatnonzero(~enteras)
+        for inicio in range(0, len(parchar), FILAS_POR_LOTE):
+            lote = parchar[inicio : inicio + FILAS_POR_LOTE]
+            hacia_nuevas = distancias(perfiles_[nuevas], perfiles_[filas[lote]], metrica)
+            candidatos = np.hstack(
+                (anteriores[lote], np.broadcast_to(nuevas, (len(lote), len(nuevas))))
+            )
+            d = np.hstack((valores[lote], hacia_nuevas))
+            pos[filas[lote]], dist[filas[lote]] = _primeros(d, candidatos, columnas, n)
+        por_metrica[metrica] = (pos, dist)
+    return TablaVecinos(k, por_metrica)
+
+
+def similares(dataset, fila, k=K_VECINOS, metrica="jaccard"):
+    """Los ``k`` municipios más parecidos a la fila ``fila`` de ``dataset.df``.
+
+    Devuelve esas filas con las columnas ``distancia`` y ``en_comun`` (ítems
+    presentes en ambos).
+    """
+    tabla = dataset.vecinos
+    if tabla is not None and k <= tabla.k:
+        posiciones, valores = tabla.por_metrica[metrica]
+        posiciones, valores = posiciones[fila, :k], valores[fila, :k]
+    else:
+        perf = perfiles(dataset.df, dataset.cols_p19, dataset.cols_p34)
+        posiciones, valores = vecinos(perf, [fila], k, metrica)
+        posiciones, valores = posiciones[0], valores[0]
+    filas = dataset.df.iloc[posiciones]
+    propio = perfiles(dataset.df.iloc[[fila]], dataset.cols_p19, dataset.cols_p34)
+    en_comun = _popcount(perfiles(filas, dataset.cols_p19, dataset.cols_p34) & propio)
+    return filas.assign(distancia=valores, en_comun=en_comun)